@@ -1,56 +1,15 @@
-import numpy as np
+import os
+import sys
 
-# Predictions from EfficientNetB0
-efficientnet_predictions = {
-    "appleExpired.jpg": {"good": 0.0000, "risky": 0.2558, "expired": 0.7442},
-    "appleGood.jpg": {"good": 0.9718, "risky": 0.0282, "expired": 0.0000},
-    "appleRisky.jpg": {"good": 0.0770, "risky": 0.9228, "expired": 0.0003}
-}
+# Run the EfficientNetB0/MobileNetV2/ResNet50 ensemble on the apple test images
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from ensemble import run_ensemble
 
-# Predictions from MobileNetV2
-mobilenet_predictions = {
-    "appleExpired.jpg": {"good": 0.0016, "risky": 0.2704, "expired": 0.7280},
-    "appleGood.jpg": {"good": 0.9617, "risky": 0.0367, "expired": 0.0016},
-    "appleRisky.jpg": {"good": 0.1183, "risky": 0.6103, "expired": 0.2704}
-}
-
-# Predictions from ResNet50
-resnet_predictions = {
-    "appleExpired.jpg": {"good": 0.0005, "risky": 0.1500, "expired": 0.8495},
-    "appleGood.jpg": {"good": 0.9800, "risky": 0.0200, "expired": 0.0000},
-    "appleRisky.jpg": {"good": 0.1000, "risky": 0.8500, "expired": 0.0500}
-}
-
-# Compute average predictions
-average_results = {}
-
-for apple_image in efficientnet_predictions.keys():
-    avg_good = np.mean([
-        efficientnet_predictions[apple_image]["good"],
-        mobilenet_predictions[apple_image]["good"],
-        resnet_predictions[apple_image]["good"]
-    ])
-    
-    avg_risky = np.mean([
-        efficientnet_predictions[apple_image]["risky"],
-        mobilenet_predictions[apple_image]["risky"],
-        resnet_predictions[apple_image]["risky"]
-    ])
-    
-    avg_expired = np.mean([
-        efficientnet_predictions[apple_image]["expired"],
-        mobilenet_predictions[apple_image]["expired"],
-        resnet_predictions[apple_image]["expired"]
-    ])
-
-    average_results[apple_image] = {
-        "good": avg_good,
-        "risky": avg_risky,
-        "expired": avg_expired
-    }
+report = run_ensemble("Apples")
 
 # Clean terminal-style display
-for apple_image, preds in average_results.items():
+for i, apple_image in enumerate(report["images"]):
+    preds = dict(zip(report["labels"], report["ensemble"][i]))
     print(f"\n🍏 Average Predictions for '{apple_image}':")
     print("-" * 40)
     print(f"{'Category':<10} | {'Probability':>10}")
@@ -72,3 +31,7 @@ for apple_image, preds in average_results.items():
         marker = "🔴 Uncertain"
 
     print(f"🔍 Prediction: {max_label.upper()} ({max_prob * 100:.2f}%) {marker}")
+
+timings = report["timings"]
+print(f"\n⏱️  Ensemble latency: {timings['ensemble'] * 1000:.1f} ms for {len(report['images'])} images "
+      f"(decode {timings['decode'] * 1000:.1f} ms)")
@@ -1,8 +1,12 @@
 import tensorflow as tf
-from tensorflow.keras.preprocessing import image
 from tensorflow.keras.applications.mobilenet_v2 import MobileNetV2, preprocess_input
 import numpy as np
 import os
+import sys
+
+# Shared DCT-scaled image decoder from ML_Classifier/backbones.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from backbones import load_image
 from rich.console import Console
 from rich.panel import Panel
 from rich.table import Table
@@ -17,8 +21,8 @@ feature_extractor = MobileNetV2(weights='imagenet', include_top=False, pooling='
 
 # Function to load an image, preprocess, and compute its embedding
 def get_embedding(img_path):
-    img = image.load_img(img_path, target_size=IMG_SIZE)
-    img_array = image.img_to_array(img)
+    # Decode straight to 224x224 uint8 and convert to float only at the end
+    img_array = load_image(img_path).astype(np.float32)
     img_array = np.expand_dims(img_array, axis=0)
     img_array = preprocess_input(img_array)
     embedding = feature_extractor.predict(img_array)
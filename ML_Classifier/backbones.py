@@ -0,0 +1,233 @@
+import os
+import time
+from io import BytesIO
+import numpy as np
+from PIL import Image
+
+# Shared pieces of the prototype classifiers in Image_Classifiers/. The per-fruit
+# scripts each carry their own copy of this setup; the tools next to this file
+# (ensemble.py, ...) import it from here instead.
+
+# Set image dimensions
+IMG_SIZE = (224, 224)
+
+# Resolve sample paths relative to this file so the tools work from any directory
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_IMAGES_DIR = os.path.join(ML_DIR, "Sample_Images")
+
+# Prototype image paths for each produce type (one image per category)
+PROTOTYPES = {
+    "Apples": {
+        "good": os.path.join(SAMPLE_IMAGES_DIR, "Apples", "Training_Images", "good_apple.jpg"),
+        "risky": os.path.join(SAMPLE_IMAGES_DIR, "Apples", "Training_Images", "risky_apple.jpg"),
+        "expired": os.path.join(SAMPLE_IMAGES_DIR, "Apples", "Training_Images", "rotten_apple.jpg"),
+    },
+    "Bananas": {
+        "good": os.path.join(SAMPLE_IMAGES_DIR, "Bananas", "Training_Images", "good_banana.jpg"),
+        "risky": os.path.join(SAMPLE_IMAGES_DIR, "Bananas", "Training_Images", "risky_banana.jpg"),
+        "expired": os.path.join(SAMPLE_IMAGES_DIR, "Bananas", "Training_Images", "rotten_banana.jpg"),
+    },
+}
+
+# Labeled test images for each produce type
+TEST_IMAGES = {
+    "Apples": {
+        os.path.join(SAMPLE_IMAGES_DIR, "Apples", "TestingImages", "appleExpired.jpg"): "expired",
+        os.path.join(SAMPLE_IMAGES_DIR, "Apples", "TestingImages", "appleGood.jpg"): "good",
+        os.path.join(SAMPLE_IMAGES_DIR, "Apples", "TestingImages", "appleRisky.jpg"): "risky",
+    },
+    "Bananas": {
+        os.path.join(SAMPLE_IMAGES_DIR, "Bananas", "TestingImages", "bananaExpired.jpg"): "expired",
+        os.path.join(SAMPLE_IMAGES_DIR, "Bananas", "TestingImages", "bananaGood.jpg"): "good",
+        os.path.join(SAMPLE_IMAGES_DIR, "Bananas", "TestingImages", "bananaRisky.jpg"): "risky",
+    },
+}
+
+# Backbones in increasing order of cost
+BACKBONE_NAMES = ["MobileNetV2", "EfficientNetB0", "ResNet50"]
+
+# Per-backbone similarity biases, as tuned in the individual classifier scripts
+LABEL_BIASES = {
+    "MobileNetV2": {},
+    "EfficientNetB0": {"risky": 0.1},
+    "ResNet50": {"risky": 0.15, "expired": 0.15},
+}
+
+# Sharpening temperature parameter and confidence threshold
+TEMPERATURE = 25.0
+CONFIDENCE_THRESHOLD = 0.80
+
+
+def load_backbone(name):
+    """Load a pre-trained backbone as a feature extractor with global average pooling"""
+    # TensorFlow is imported lazily so the helpers below stay usable without it
+    if name == "MobileNetV2":
+        from tensorflow.keras.applications.mobilenet_v2 import MobileNetV2 as model_fn, preprocess_input
+    elif name == "EfficientNetB0":
+        from tensorflow.keras.applications.efficientnet import EfficientNetB0 as model_fn, preprocess_input
+    elif name == "ResNet50":
+        from tensorflow.keras.applications.resnet50 import ResNet50 as model_fn, preprocess_input
+    else:
+        raise ValueError(f"Unknown backbone '{name}'. Choose from {BACKBONE_NAMES}")
+    feature_extractor = model_fn(weights='imagenet', include_top=False, pooling='avg', input_shape=(224, 224, 3))
+    return feature_extractor, preprocess_input
+
+
+class CompiledFeatureExtractor:
+    """A backbone wrapped in a tf.function with a fixed input signature (optionally XLA-compiled)"""
+
+    def __init__(self, feature_extractor, jit_compile=False, max_batch_size=32):
+        import tensorflow as tf
+
+        self.feature_extractor = feature_extractor
+        self.jit_compile = jit_compile
+        # XLA specialises on concrete shapes, so batches are padded up to a few fixed sizes
+        self.buckets = [2 ** i for i in range(max_batch_size.bit_length()) if 2 ** i < max_batch_size] + [max_batch_size]
+        self.warmup_report = None
+
+        @tf.function(input_signature=[tf.TensorSpec([None, IMG_SIZE[0], IMG_SIZE[1], 3], tf.float32)],
+                     jit_compile=jit_compile)
+        def serve(img_array):
+            return feature_extractor(img_array, training=False)
+
+        self.serve = serve
+
+    def count_params(self):
+        return self.feature_extractor.count_params()
+
+    def _bucket(self, n):
+        for size in self.buckets:
+            if n <= size:
+                return size
+        return n
+
+    def predict(self, img_array, verbose=0):
+        n = len(img_array)
+        if self.jit_compile and self._bucket(n) != n:
+            padding = np.zeros((self._bucket(n) - n,) + img_array.shape[1:], dtype=np.float32)
+            img_array = np.concatenate([img_array, padding])
+        return self.serve(np.asarray(img_array, dtype=np.float32)).numpy()[:n]
+
+    def warmup(self, batch_sizes=None, repeats=3):
+        """Trace, compile and allocate for every batch size up front; returns cold vs warm latency"""
+        report = {}
+        for size in batch_sizes or self.buckets:
+            batch = np.zeros((size,) + IMG_SIZE + (3,), dtype=np.float32)
+            start = time.perf_counter()
+            self.predict(batch)
+            cold = time.perf_counter() - start
+            warm = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                self.predict(batch)
+                warm.append(time.perf_counter() - start)
+            report[str(size)] = {"cold_ms": cold * 1000, "warm_ms": float(np.median(warm)) * 1000}
+        self.warmup_report = report
+        return report
+
+
+def compile_backbone(feature_extractor, jit_compile=False, max_batch_size=32, warmup=True):
+    """Compile a loaded backbone and, by default, warm it up for every batch bucket"""
+    compiled = CompiledFeatureExtractor(feature_extractor, jit_compile=jit_compile, max_batch_size=max_batch_size)
+    if warmup:
+        compiled.warmup()
+    return compiled
+
+
+def numpy_preprocess(name, batch):
+    """Framework-free equivalent of each backbone's keras preprocess_input"""
+    x = batch.astype(np.float32)
+    if name == "MobileNetV2":
+        # 'tf' mode: scale to [-1, 1]
+        return x / 127.5 - 1.0
+    if name == "EfficientNetB0":
+        # EfficientNet rescales inside the model and expects raw [0, 255] pixels
+        return x
+    if name == "ResNet50":
+        # 'caffe' mode: RGB -> BGR and subtract the ImageNet channel means
+        return x[..., ::-1] - np.array([103.939, 116.779, 123.68], dtype=np.float32)
+    raise ValueError(f"Unknown backbone '{name}'. Choose from {BACKBONE_NAMES}")
+
+
+def sample_image_paths(root=SAMPLE_IMAGES_DIR):
+    """Every image under Sample_Images, in a stable order"""
+    paths = []
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.lower().endswith((".jpg", ".jpeg", ".png")):
+                paths.append(os.path.join(dirpath, filename))
+    return sorted(paths)
+
+
+def decode_image(source, fast=True):
+    """Decode a path, file object or bytes into a uint8 (224, 224, 3) array"""
+    if isinstance(source, (bytes, bytearray)):
+        source = BytesIO(source)
+    img = Image.open(source)
+    if fast:
+        # Ask libjpeg for DCT-scaled output (1/2, 1/4 or 1/8) at the smallest scale
+        # that still covers 224px on both sides; a no-op for non-JPEG files
+        img.draft("RGB", IMG_SIZE)
+    # Finish the resize in uint8; conversion to float happens only in embed_batch.
+    # Nearest-neighbour is keras image.load_img's default, so with fast=False the
+    # pixels match load_img(img_path, target_size=IMG_SIZE). With fast=True a JPEG
+    # has already been downscaled by libjpeg, so the result differs slightly from
+    # the keras decode (prototypes and queries both use it, so they stay consistent)
+    img = img.convert("RGB").resize(IMG_SIZE, Image.NEAREST)
+    return np.asarray(img, dtype=np.uint8)
+
+
+def load_image(img_path, fast=True):
+    """Decode an image file into a uint8 (224, 224, 3) array"""
+    if not os.path.exists(img_path):
+        raise FileNotFoundError(f"Image not found at {img_path}")
+    return decode_image(img_path, fast=fast)
+
+
+def load_image_batch(img_paths, fast=True):
+    """Decode a list of images into a single uint8 (N, 224, 224, 3) batch"""
+    return np.stack([load_image(path, fast=fast) for path in img_paths])
+
+
+def embed_batch(feature_extractor, preprocess_input, batch):
+    """Compute unit-length embeddings for a uint8 image batch"""
+    # preprocess_input works in place, so always hand it a fresh float copy;
+    # this keeps the shared uint8 batch intact for the other backbones
+    img_array = preprocess_input(batch.astype(np.float32))
+    # float16-weight models return float16 features; score everything in float32
+    embeddings = np.asarray(feature_extractor.predict(img_array, verbose=0), dtype=np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def available_prototypes(prototypes):
+    """Prototypes whose image exists; missing ones are skipped with a note (Apples has no good_apple.jpg)"""
+    available = {}
+    for label, path in prototypes.items():
+        if os.path.exists(path):
+            available[label] = path
+        else:
+            print(f"Skipping prototype '{label}': no image at {path}")
+    if len(available) < 2:
+        raise FileNotFoundError(f"Need at least two prototype images, found {sorted(available)}")
+    return available
+
+
+def prototype_matrix(feature_extractor, preprocess_input, prototypes):
+    """Embed the prototype images, returning (labels, matrix of shape (K, D))"""
+    labels = list(prototypes.keys())
+    for label, path in prototypes.items():
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Prototype image for '{label}' not found at {path}")
+    batch = load_image_batch([prototypes[label] for label in labels])
+    return labels, embed_batch(feature_extractor, preprocess_input, batch)
+
+
+def prototype_probabilities(embeddings, proto_matrix, labels, biases=None, temperature=TEMPERATURE):
+    """Temperature-scaled softmax over cosine similarities, for a whole batch at once"""
+    similarities = embeddings @ proto_matrix.T
+    if biases:
+        similarities = similarities + np.array([biases.get(label, 0.0) for label in labels])
+    # Subtract the row max before exponentiating to keep the softmax stable
+    scaled = temperature * similarities
+    exp_sim = np.exp(scaled - scaled.max(axis=1, keepdims=True))
+    return exp_sim / exp_sim.sum(axis=1, keepdims=True)
@@ -0,0 +1,177 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+from datetime import datetime, timezone
+import numpy as np
+
+from backbones import (
+    BACKBONE_NAMES, LABEL_BIASES, PROTOTYPES, TEST_IMAGES,
+    compile_backbone, embed_batch, load_backbone, load_image_batch, prototype_matrix, prototype_probabilities, sample_image_paths,
+)
+
+# --- Backbone benchmark suite ---
+# Each backbone is measured in its own freshly spawned process so cold load time and
+# peak RSS are not polluted by the other models. Results are written as JSON.
+
+BATCH_SIZES = [1, 8, 32]
+PRECISIONS = ["float32", "int8", "float16"]
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _load(name, precision, compiled=None):
+    if precision == "float32":
+        feature_extractor, preprocess_input = load_backbone(name)
+        if compiled:
+            # Warmup is left out here so first-inference latency shows the tracing cost
+            feature_extractor = compile_backbone(feature_extractor, jit_compile=compiled == "xla",
+                                                 max_batch_size=max(BATCH_SIZES), warmup=False)
+        return feature_extractor, preprocess_input
+    from tflite_backbones import load_quantized_backbone
+    return load_quantized_backbone(name, precision)
+
+
+def measure_accuracy(name, feature_extractor, preprocess_input):
+    """Top-1 accuracy on the labeled Sample_Images test sets, per produce type"""
+    accuracy = {}
+    for produce, prototypes in PROTOTYPES.items():
+        try:
+            labels, matrix = prototype_matrix(feature_extractor, preprocess_input, prototypes)
+        except FileNotFoundError as e:
+            accuracy[produce] = {"accuracy": None, "error": str(e)}
+            continue
+        test_paths = list(TEST_IMAGES[produce])
+        embeddings = embed_batch(feature_extractor, preprocess_input, load_image_batch(test_paths))
+        probabilities = prototype_probabilities(embeddings, matrix, labels, biases=LABEL_BIASES.get(name))
+        predicted = [labels[i] for i in probabilities.argmax(axis=1)]
+        correct = sum(pred == TEST_IMAGES[produce][path] for pred, path in zip(predicted, test_paths))
+        accuracy[produce] = {"accuracy": correct / len(test_paths), "correct": correct, "total": len(test_paths)}
+    return accuracy
+
+
+def benchmark_backbone(name, precision="float32", batch_sizes=BATCH_SIZES, iterations=10, compiled=None):
+    """Benchmark one backbone in the current process and return a result dict"""
+    rss_before = peak_rss_mb()
+    start = time.perf_counter()
+    feature_extractor, preprocess_input = _load(name, precision, compiled)
+    cold_load = time.perf_counter() - start
+
+    # Build batches by cycling over the decoded sample images
+    images = load_image_batch(sample_image_paths())
+
+    def make_batch(size):
+        return images[np.arange(size) % len(images)]
+
+    start = time.perf_counter()
+    embed_batch(feature_extractor, preprocess_input, make_batch(1))
+    first_inference = time.perf_counter() - start
+
+    steady_state = {}
+    for size in batch_sizes:
+        batch = make_batch(size)
+        # One untimed call per batch size absorbs any re-tracing for the new shape
+        embed_batch(feature_extractor, preprocess_input, batch)
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            embed_batch(feature_extractor, preprocess_input, batch)
+            timings.append(time.perf_counter() - start)
+        timings = np.array(timings)
+        steady_state[str(size)] = {
+            "batch_ms_median": float(np.median(timings) * 1000),
+            "batch_ms_p90": float(np.percentile(timings, 90) * 1000),
+            "per_image_ms": float(np.median(timings) * 1000 / size),
+            "images_per_second": float(size / np.median(timings)),
+        }
+
+    return {
+        "backbone": name,
+        "precision": precision,
+        "compiled": compiled,
+        "cold_load_s": cold_load,
+        "first_inference_ms": first_inference * 1000,
+        "steady_state": steady_state,
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_rss_before_load_mb": rss_before,
+        "accuracy": measure_accuracy(name, feature_extractor, preprocess_input),
+    }
+
+
+def benchmark_decode(img_paths, iterations=5):
+    """Per-image decode time with and without DCT-scaled JPEG decoding, kept apart from inference"""
+    results = {}
+    for mode, fast in (("full", False), ("dct_scaled", True)):
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            load_image_batch(img_paths, fast=fast)
+            timings.append(time.perf_counter() - start)
+        results[mode] = {"per_image_ms": float(np.median(timings) * 1000 / len(img_paths))}
+    return results
+
+
+def _benchmark_worker(args):
+    return benchmark_backbone(*args)
+
+
+def environment_info():
+    info = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+    }
+    try:
+        import tensorflow as tf
+        info["tensorflow"] = tf.__version__
+    except ImportError:
+        info["tensorflow"] = None
+    return info
+
+
+def run_suite(backbone_names=BACKBONE_NAMES, precision="float32", batch_sizes=BATCH_SIZES, iterations=10,
+              compiled=None):
+    """Benchmark every backbone, each in a fresh spawned process"""
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for name in backbone_names:
+        with context.Pool(1) as pool:
+            results.append(pool.apply(_benchmark_worker, ((name, precision, batch_sizes, iterations, compiled),)))
+    return {
+        "environment": environment_info(),
+        "iterations": iterations,
+        "decode": benchmark_decode(sample_image_paths()),
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the ML_Classifier backbones on CPU")
+    parser.add_argument("--backbones", nargs="+", default=BACKBONE_NAMES, choices=BACKBONE_NAMES)
+    parser.add_argument("--precision", default="float32", choices=PRECISIONS)
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=BATCH_SIZES)
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--compiled", default=None, choices=["graph", "xla"],
+                        help="Run float32 backbones through a compiled tf.function (optionally with XLA)")
+    parser.add_argument("--output", default=None, help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = run_suite(args.backbones, args.precision, args.batch_sizes, args.iterations, args.compiled)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"Benchmark results written to {args.output}")
+    else:
+        print(text)
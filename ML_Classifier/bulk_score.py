@@ -0,0 +1,204 @@
+import argparse
+import itertools
+import json
+import os
+import sys
+import tarfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from backbones import decode_image
+from produce_index import ProduceIndex
+
+# --- Resumable bulk scoring over directory trees and tar shards ---
+# Images are streamed in a fixed order, decoded in parallel in bounded batches,
+# classified with the unified produce index and appended to Parquet part files.
+# After every part a checkpoint records how far each source got, so an
+# interrupted run picks up exactly where it stopped.
+#
+#   python bulk_score.py /archive/2024 /archive/shards/*.tar --output scores/
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+CHECKPOINT_FILE = "checkpoint.json"
+
+
+def iter_directory(root):
+    """Yield (key, path) for every image under a directory, in a stable order"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                path = os.path.join(dirpath, filename)
+                yield os.path.relpath(path, root), path
+
+
+def iter_tar(path, skip=0):
+    """Yield (key, bytes) for every image in a tar shard after the first skip, streaming without an index"""
+    with tarfile.open(path, "r|*") as tar:
+        position = 0
+        for member in tar:
+            if member.isfile() and member.name.lower().endswith(IMAGE_EXTENSIONS):
+                position += 1
+                # Skipped members are never extracted
+                if position > skip:
+                    yield member.name, tar.extractfile(member).read()
+
+
+def iter_source(source, skip=0):
+    """Images of a source after the first skip; directory items carry a path, read when decoded"""
+    if os.path.isdir(source):
+        return itertools.islice(iter_directory(source), skip, None)
+    if tarfile.is_tarfile(source):
+        return iter_tar(source, skip)
+    raise ValueError(f"Source '{source}' is neither a directory nor a tar shard")
+
+
+def _decode(item):
+    key, data = item
+    try:
+        if isinstance(data, str):
+            # Directory images are read in the decode threads, so reads overlap too
+            with open(data, "rb") as f:
+                data = f.read()
+        return key, decode_image(data), None
+    except Exception as e:
+        return key, None, f"{type(e).__name__}: {e}"
+
+
+class BulkScorer:
+    def __init__(self, index, output_dir, batch_size=32, rows_per_part=10000, decode_workers=None):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("Bulk scoring writes Parquet; install it using: pip install pyarrow")
+        self.index = index
+        self.output_dir = output_dir
+        self.batch_size = batch_size
+        self.rows_per_part = rows_per_part
+        self.decode_pool = ThreadPoolExecutor(max_workers=decode_workers or os.cpu_count())
+        os.makedirs(output_dir, exist_ok=True)
+        self.checkpoint_path = os.path.join(output_dir, CHECKPOINT_FILE)
+        self.checkpoint = self._load_checkpoint()
+        self.rows = []
+        self.totals = Counter(self.checkpoint["totals"])
+        self.images_this_run = 0
+
+    def _load_checkpoint(self):
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                checkpoint = json.load(f)
+        else:
+            checkpoint = {"next_part": 0, "done": {}, "totals": {}}
+        # Part files written after the last checkpoint belong to work that will be redone
+        for filename in os.listdir(self.output_dir):
+            if filename.startswith("part-") and filename.endswith(".parquet"):
+                if int(filename[5:-8]) >= checkpoint["next_part"]:
+                    os.remove(os.path.join(self.output_dir, filename))
+        return checkpoint
+
+    def _save_checkpoint(self):
+        self.checkpoint["totals"] = dict(self.totals)
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.checkpoint, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _flush(self, done):
+        """Write buffered rows as the next part file, then advance the checkpoint"""
+        if not self.rows:
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # Explicit schema so parts with no errors (an all-null column) stay compatible
+        schema = pa.schema([
+            ("source", pa.string()), ("key", pa.string()), ("produce", pa.string()), ("condition", pa.string()),
+            ("produce_probability", pa.float64()), ("condition_probability", pa.float64()), ("error", pa.string()),
+        ])
+        table = pa.Table.from_pylist(self.rows, schema=schema)
+        part = self.checkpoint["next_part"]
+        tmp_path = os.path.join(self.output_dir, f".part-{part:06d}.parquet.tmp")
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, os.path.join(self.output_dir, f"part-{part:06d}.parquet"))
+
+        self.checkpoint["next_part"] = part + 1
+        self.checkpoint["done"].update(done)
+        self._save_checkpoint()
+        self.rows = []
+
+    def _score_batch(self, source, items):
+        decoded = list(self.decode_pool.map(_decode, items))
+        ok = [(key, img) for key, img, error in decoded if error is None]
+        results = iter(self.index.classify(np.stack([img for _, img in ok]))) if ok else iter(())
+        for key, img, error in decoded:
+            row = {"source": source, "key": key, "produce": None, "condition": None,
+                   "produce_probability": None, "condition_probability": None, "error": error}
+            if error is None:
+                result = next(results)
+                row.update({field: result[field] for field in
+                            ("produce", "condition", "produce_probability", "condition_probability")})
+                self.totals[f"{result['produce']}/{result['condition']}"] += 1
+            else:
+                self.totals["unreadable"] += 1
+            self.rows.append(row)
+        self.images_this_run += len(items)
+
+    def score_source(self, source):
+        source = os.path.abspath(source)
+        already_done = self.checkpoint["done"].get(source, 0)
+        if already_done == "complete":
+            print(f"Skipping {source}: already scored")
+            return
+        if already_done:
+            print(f"Resuming {source} after {already_done} images")
+
+        position = already_done
+        stream = iter_source(source, already_done)
+        while True:
+            # Only one batch of encoded images is held in memory at a time
+            items = list(itertools.islice(stream, self.batch_size))
+            if not items:
+                break
+            self._score_batch(source, items)
+            position += len(items)
+            if len(self.rows) >= self.rows_per_part:
+                self._flush({source: position})
+        self._flush({source: position})
+        self.checkpoint["done"][source] = "complete"
+        self._save_checkpoint()
+
+    def close(self):
+        self.decode_pool.shutdown(wait=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score archived intake photos in bulk (resumable)")
+    parser.add_argument("sources", nargs="+", help="Directories and/or tar shards to score")
+    parser.add_argument("--output", required=True, help="Output directory for Parquet parts and the checkpoint")
+    parser.add_argument("--index", default=None, help="Saved produce index (.npz); built from Sample_Images if omitted")
+    parser.add_argument("--backbone", default="MobileNetV2")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--rows-per-part", type=int, default=10000)
+    parser.add_argument("--decode-workers", type=int, default=None)
+    args = parser.parse_args()
+
+    index = ProduceIndex.load(args.index) if args.index else ProduceIndex.build(args.backbone)
+    scorer = BulkScorer(index, args.output, args.batch_size, args.rows_per_part, args.decode_workers)
+    start = time.perf_counter()
+    try:
+        for source in args.sources:
+            scorer.score_source(source)
+    except KeyboardInterrupt:
+        print("\nInterrupted; rerun the same command to resume from the last checkpoint.")
+        sys.exit(130)
+    finally:
+        scorer.close()
+    elapsed = time.perf_counter() - start
+
+    print(f"\nScored {scorer.images_this_run} images in {elapsed:.1f} s "
+          f"({scorer.images_this_run / elapsed if elapsed else 0:.1f} images/s)")
+    print("Per-class totals (all runs):")
+    for label, count in sorted(scorer.totals.items()):
+        print(f"{label:<24} {count:>10}")
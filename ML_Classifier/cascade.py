@@ -0,0 +1,121 @@
+import argparse
+import os
+import time
+import numpy as np
+
+from backbones import (
+    BACKBONE_NAMES, CONFIDENCE_THRESHOLD, LABEL_BIASES, PROTOTYPES, TEST_IMAGES, TEMPERATURE,
+    available_prototypes, embed_batch, load_image_batch, prototype_matrix, prototype_probabilities,
+)
+from model_registry import ModelRegistry
+
+# --- Early-exit cascade across backbones ---
+# MobileNetV2 classifies every image; only images it is unsure about (low top
+# probability or a small margin to the runner-up) are escalated to EfficientNetB0,
+# and from there to ResNet50. The last stage always answers. Later stages are
+# only loaded (through the model registry) once some image actually escalates.
+
+DEFAULT_MARGIN = 0.20
+
+
+class CascadeClassifier:
+    def __init__(self, produce, stages=None, confidence_threshold=CONFIDENCE_THRESHOLD,
+                 margin_threshold=DEFAULT_MARGIN, temperature=TEMPERATURE, registry=None):
+        if produce not in PROTOTYPES:
+            raise ValueError(f"Unknown produce type '{produce}'. Choose from {list(PROTOTYPES)}")
+        self.stages = list(stages or BACKBONE_NAMES)
+        self.confidence_threshold = confidence_threshold
+        self.margin_threshold = margin_threshold
+        self.temperature = temperature
+        self.prototypes = available_prototypes(PROTOTYPES[produce])
+        self.registry = registry or ModelRegistry()
+
+        # Prototype matrices are embedded per stage on first use; the first stage right away
+        self.prototype_matrices = {}
+        self.labels = list(self.prototypes)
+        self._stage_model(self.stages[0])
+
+        # Running traffic statistics
+        self.exits = {name: 0 for name in self.stages}
+        self.stage_seconds = {name: 0.0 for name in self.stages}
+        self.images_seen = 0
+
+    def _stage_model(self, name):
+        feature_extractor, preprocess_input = self.registry.get(name)
+        if name not in self.prototype_matrices:
+            _, self.prototype_matrices[name] = prototype_matrix(feature_extractor, preprocess_input, self.prototypes)
+        return feature_extractor, preprocess_input
+
+    def _confident(self, probabilities):
+        """Boolean mask of rows that may exit at the current stage"""
+        top_two = np.sort(probabilities, axis=1)[:, -2:]
+        top = top_two[:, -1]
+        margin = top_two[:, -1] - top_two[:, 0]
+        return (top >= self.confidence_threshold) & (margin >= self.margin_threshold)
+
+    def predict(self, batch):
+        """Classify a uint8 batch; returns (probabilities, name of the stage that answered each row)"""
+        probabilities = np.zeros((len(batch), len(self.labels)))
+        exit_stage = np.empty(len(batch), dtype=object)
+        remaining = np.arange(len(batch))
+
+        for i, name in enumerate(self.stages):
+            start = time.perf_counter()
+            feature_extractor, preprocess_input = self._stage_model(name)
+            embeddings = embed_batch(feature_extractor, preprocess_input, batch[remaining])
+            stage_probs = prototype_probabilities(
+                embeddings, self.prototype_matrices[name], self.labels,
+                biases=LABEL_BIASES.get(name), temperature=self.temperature,
+            )
+            self.stage_seconds[name] += time.perf_counter() - start
+
+            # The final stage answers for everything that is left
+            done = np.ones(len(remaining), dtype=bool) if i == len(self.stages) - 1 else self._confident(stage_probs)
+            probabilities[remaining[done]] = stage_probs[done]
+            exit_stage[remaining[done]] = name
+            self.exits[name] += int(done.sum())
+            remaining = remaining[~done]
+            if len(remaining) == 0:
+                break
+
+        self.images_seen += len(batch)
+        return probabilities, exit_stage
+
+    def stats(self):
+        """Share of traffic exiting at each stage and average cost per image"""
+        seen = max(self.images_seen, 1)
+        return {
+            "images": self.images_seen,
+            "exit_rate": {name: self.exits[name] / seen for name in self.stages},
+            "stage_ms_total": {name: self.stage_seconds[name] * 1000 for name in self.stages},
+            "avg_ms_per_image": sum(self.stage_seconds.values()) * 1000 / seen,
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the early-exit backbone cascade on the sample test images")
+    parser.add_argument("--produce", default="Bananas", choices=sorted(PROTOTYPES))
+    parser.add_argument("--threshold", type=float, default=CONFIDENCE_THRESHOLD,
+                        help="Minimum top probability to exit early")
+    parser.add_argument("--margin", type=float, default=DEFAULT_MARGIN,
+                        help="Minimum gap between the top two probabilities to exit early")
+    parser.add_argument("--memory-budget-mb", type=float, default=None,
+                        help="Evict least recently used backbones above this many MB of weights")
+    args = parser.parse_args()
+
+    cascade = CascadeClassifier(args.produce, confidence_threshold=args.threshold, margin_threshold=args.margin,
+                                registry=ModelRegistry(args.memory_budget_mb))
+    img_paths = list(TEST_IMAGES[args.produce])
+    probabilities, exit_stage = cascade.predict(load_image_batch(img_paths))
+
+    for path, probs, stage in zip(img_paths, probabilities, exit_stage):
+        results = dict(zip(cascade.labels, probs))
+        print(f"\nCascade Classification Results for '{os.path.basename(path)}' (answered by {stage}):")
+        for label, prob in results.items():
+            print(f"{label}: {prob * 100:.2f}%")
+
+    stats = cascade.stats()
+    print("\nExit rate per stage:")
+    for name, rate in stats["exit_rate"].items():
+        print(f"{name:<16} {rate * 100:>6.1f}%  ({stats['stage_ms_total'][name]:.1f} ms total)")
+    print(f"Average cost per image: {stats['avg_ms_per_image']:.1f} ms")
@@ -0,0 +1,268 @@
+import argparse
+import json
+import os
+import numpy as np
+
+# --- Compressed embedding store for large prototype sets ---
+# Pooled embeddings are 1280-d (MobileNetV2, EfficientNetB0) or 2048-d (ResNet50)
+# float32, i.e. 5-8 KB per prototype image. This store keeps each vector as
+#   * its PCA projection (optional, to a configurable dimension), and
+#   * float16 codes, or int8 codes with one float32 scale per vector,
+# plus one float32 offset per vector (its dot product with the PCA mean). Similarities
+# are computed straight from the codes without decoding the stored vectors:
+#   x . y = (x - m) . (y - m) + m . x + m . y - m . m
+# where (x - m) . (y - m) is approximated by the projected query against the codes.
+# Only the query is projected; stored vectors stay compressed. With fewer stored
+# vectors than PCA dimensions the projection is exact for them, and only the
+# quantization error remains.
+
+DTYPES = ["float16", "int8"]
+
+
+class CompressedEmbeddingStore:
+    def __init__(self, mean, components=None, dtype="int8", explained_variance=None):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown dtype '{dtype}'. Choose from {DTYPES}")
+        self.mean = np.asarray(mean, dtype=np.float32)
+        # (D, d) orthonormal PCA basis, or None to quantize the centered vectors as they are
+        self.components = None if components is None else np.asarray(components, dtype=np.float32)
+        self.dtype = dtype
+        self.explained_variance = explained_variance
+        self.mean_sq = float(self.mean @ self.mean)
+        self.dim = self.mean.shape[0] if self.components is None else self.components.shape[1]
+        self.size = 0
+        self.codes = np.zeros((0, self.dim), dtype=np.int8 if dtype == "int8" else np.float16)
+        self.scales = np.zeros(0, dtype=np.float32)
+        self.offsets = np.zeros(0, dtype=np.float32)
+        self.ids = []
+        self.slots = {}
+
+    @classmethod
+    def fit(cls, embeddings, dim=None, dtype="int8"):
+        """Fit the PCA projection on (N, D) embeddings; dim=None keeps all D dimensions"""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        mean = embeddings.mean(axis=0)
+        if dim is None or dim >= embeddings.shape[1]:
+            return cls(mean, None, dtype)
+        _, singular_values, vt = np.linalg.svd(embeddings - mean, full_matrices=False)
+        # A PCA basis cannot have more directions than the data spans
+        dim = min(dim, vt.shape[0])
+        variance = singular_values ** 2
+        explained = float(variance[:dim].sum() / variance.sum()) if variance.sum() > 0 else 1.0
+        return cls(mean, vt[:dim].T, dtype, explained_variance=explained)
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, example_id):
+        return example_id in self.slots
+
+    def project(self, embeddings):
+        centered = np.asarray(embeddings, dtype=np.float32) - self.mean
+        return centered if self.components is None else centered @ self.components
+
+    def encode(self, embeddings):
+        """(codes, scales, offsets) for a batch of embeddings"""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        projected = self.project(embeddings)
+        offsets = embeddings @ self.mean
+        if self.dtype == "float16":
+            return projected.astype(np.float16), np.ones(len(projected), dtype=np.float32), offsets
+        # Symmetric per-vector scale: the largest component maps to +-127
+        scales = np.abs(projected).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(projected / scales[:, np.newaxis]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32), offsets
+
+    def _grow(self, needed):
+        capacity = len(self.codes)
+        if self.size + needed <= capacity:
+            return
+        # Double the capacity so adding N vectors one by one stays O(N)
+        new_capacity = max(self.size + needed, 2 * capacity, 64)
+        self.codes = np.resize(self.codes, (new_capacity, self.dim))
+        self.scales = np.resize(self.scales, new_capacity)
+        self.offsets = np.resize(self.offsets, new_capacity)
+
+    def add_many(self, example_ids, embeddings):
+        if not len(example_ids):
+            return
+        duplicates = [example_id for example_id in example_ids if example_id in self.slots]
+        if duplicates:
+            raise ValueError(f"Example '{duplicates[0]}' is already in the store")
+        codes, scales, offsets = self.encode(np.asarray(embeddings, dtype=np.float32).reshape(len(example_ids), -1))
+        self._grow(len(example_ids))
+        start, end = self.size, self.size + len(example_ids)
+        self.codes[start:end], self.scales[start:end], self.offsets[start:end] = codes, scales, offsets
+        for slot, example_id in enumerate(example_ids, start):
+            self.slots[example_id] = slot
+        self.ids.extend(example_ids)
+        self.size = end
+
+    def add(self, example_id, embedding):
+        self.add_many([example_id], np.asarray(embedding)[np.newaxis])
+
+    def remove(self, example_id):
+        """Drop one vector and return its decoded embedding"""
+        slot = self.slots.pop(example_id)
+        embedding = self.decode([slot])[0]
+        last = self.size - 1
+        if slot != last:
+            # Move the last vector into the freed slot
+            self.codes[slot], self.scales[slot], self.offsets[slot] = self.codes[last], self.scales[last], self.offsets[last]
+            self.ids[slot] = self.ids[last]
+            self.slots[self.ids[slot]] = slot
+        self.ids.pop()
+        self.size = last
+        return embedding
+
+    def decode(self, slots=None):
+        """Approximate float32 embeddings of the given slots (all by default)"""
+        slots = np.arange(self.size) if slots is None else np.asarray(slots)
+        projected = self.codes[slots].astype(np.float32) * self.scales[slots, np.newaxis]
+        return self.mean + (projected if self.components is None else projected @ self.components.T)
+
+    def get(self, example_id):
+        return self.decode([self.slots[example_id]])[0]
+
+    def similarities(self, queries, slots=None, chunk_size=16384):
+        """(N, M) dot products of full-precision queries with stored vectors, computed from the codes"""
+        queries = np.asarray(queries, dtype=np.float32)
+        projected = self.project(queries)
+        query_offsets = queries @ self.mean
+        slots = np.arange(self.size) if slots is None else np.asarray(slots)
+        result = np.empty((len(queries), len(slots)), dtype=np.float32)
+        # Widen the codes a chunk at a time so scoring never materialises the full float32 matrix
+        for start in range(0, len(slots), chunk_size):
+            chunk = slots[start:start + chunk_size]
+            scores = projected @ self.codes[chunk].astype(np.float32).T
+            if self.dtype == "int8":
+                scores *= self.scales[chunk]
+            result[:, start:start + len(chunk)] = scores + query_offsets[:, np.newaxis] + self.offsets[chunk] - self.mean_sq
+        return result
+
+    def nbytes(self):
+        """Memory held by the stored vectors and by the projection"""
+        per_vector = self.codes.itemsize * self.dim + self.offsets.itemsize + (self.scales.itemsize if self.dtype == "int8" else 0)
+        projection = self.mean.nbytes + (self.components.nbytes if self.components is not None else 0)
+        return {"per_vector": per_vector, "vectors": per_vector * self.size, "projection": projection,
+                "float32_per_vector": 4 * self.mean.shape[0]}
+
+    def state(self):
+        """Arrays to persist the store with (see from_state)"""
+        return {
+            "store_dtype": self.dtype,
+            "store_mean": self.mean,
+            "store_components": self.components if self.components is not None else np.zeros((0, 0), dtype=np.float32),
+            "store_codes": self.codes[:self.size],
+            "store_scales": self.scales[:self.size],
+            "store_offsets": self.offsets[:self.size],
+            "store_ids": np.array(self.ids, dtype=str),
+        }
+
+    @classmethod
+    def from_state(cls, data):
+        components = data["store_components"]
+        store = cls(data["store_mean"], components if components.size else None, str(data["store_dtype"]))
+        example_ids = data["store_ids"].tolist()
+        store._grow(len(example_ids))
+        store.size = len(example_ids)
+        store.codes[:store.size] = data["store_codes"]
+        store.scales[:store.size] = data["store_scales"]
+        store.offsets[:store.size] = data["store_offsets"]
+        store.ids = list(example_ids)
+        store.slots = {example_id: slot for slot, example_id in enumerate(example_ids)}
+        return store
+
+
+def nearest_class_predictions(similarities, example_rows, labels, bias_vector):
+    """Label of the class holding the most similar example (nearest-prototype scoring)"""
+    class_scores = np.full((len(similarities), len(labels)), -np.inf)
+    for row in range(len(labels)):
+        members = example_rows == row
+        if members.any():
+            class_scores[:, row] = similarities[:, members].max(axis=1)
+    return [labels[i] for i in (class_scores + bias_vector).argmax(axis=1)]
+
+
+def accuracy(predictions, truth):
+    return sum(p == t for p, t in zip(predictions, truth)) / len(truth)
+
+
+def compression_report(backbone_name="MobileNetV2", dims=(None, 256, 64), dtypes=DTYPES):
+    """Accuracy of full-precision vs compressed prototype scoring on the Sample_Images test images"""
+    from backbones import TEST_IMAGES, load_image_batch
+    from produce_index import ProduceIndex
+
+    index = ProduceIndex.build(backbone_name)
+    test_paths = [path for paths in TEST_IMAGES.values() for path in paths]
+    truth = [(produce, paths[path]) for produce, paths in TEST_IMAGES.items() for path in paths]
+    queries = index.embed(load_image_batch(test_paths))
+
+    example_ids = list(index.examples)
+    example_rows = np.array([index.examples[i][0] for i in example_ids])
+    example_embeddings = np.stack([index.examples[i][1] for i in example_ids])
+    full_similarities = queries @ example_embeddings.T
+    full_centroid = [(r["produce"], r["condition"]) for r in index.classify_embeddings(queries)]
+    full_nearest = nearest_class_predictions(full_similarities, example_rows, index.labels, index.bias_vector)
+
+    report = {
+        "backbone": backbone_name,
+        "prototypes": len(example_ids),
+        "test_images": len(test_paths),
+        "full_precision": {"centroid_accuracy": accuracy(full_centroid, truth),
+                           "nearest_accuracy": accuracy(full_nearest, truth),
+                           "bytes_per_vector": int(example_embeddings.shape[1] * 4)},
+        "compressed": [],
+    }
+    for dtype in dtypes:
+        for dim in dims:
+            compressed = ProduceIndex(backbone_name, example_embeddings.shape[1])
+            for example_id, row, embedding in zip(example_ids, example_rows, example_embeddings):
+                compressed.add_example(*index.labels[row], embedding, example_id=example_id, persist=False)
+            store = compressed.compress(dim=dim, dtype=dtype)
+            similarities = store.similarities(queries, [store.slots[i] for i in example_ids])
+            centroid = [(r["produce"], r["condition"]) for r in compressed.classify_embeddings(queries)]
+            nearest = nearest_class_predictions(similarities, example_rows, index.labels, index.bias_vector)
+            report["compressed"].append({
+                "dtype": dtype,
+                "requested_dim": dim,
+                "dim": store.dim,
+                "explained_variance": store.explained_variance,
+                "bytes_per_vector": store.nbytes()["per_vector"],
+                "max_similarity_error": float(np.abs(similarities - full_similarities).max()),
+                "centroid_accuracy": accuracy(centroid, truth),
+                "centroid_accuracy_delta": accuracy(centroid, truth) - report["full_precision"]["centroid_accuracy"],
+                "centroid_agreement": accuracy(centroid, full_centroid),
+                "nearest_accuracy": accuracy(nearest, truth),
+                "nearest_accuracy_delta": accuracy(nearest, truth) - report["full_precision"]["nearest_accuracy"],
+                "nearest_agreement": accuracy(nearest, full_nearest),
+            })
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Accuracy delta of compressed vs full-precision prototype scoring")
+    parser.add_argument("--backbone", default="MobileNetV2")
+    parser.add_argument("--dims", nargs="+", type=int, default=[0, 256, 64], help="PCA dimensions (0 = no PCA)")
+    parser.add_argument("--dtypes", nargs="+", default=DTYPES, choices=DTYPES)
+    parser.add_argument("--output", default=None, help="Also write the report as JSON to this file")
+    args = parser.parse_args()
+
+    report = compression_report(args.backbone, [dim or None for dim in args.dims], args.dtypes)
+    full = report["full_precision"]
+    print(f"{report['backbone']}: {report['prototypes']} prototypes, {report['test_images']} test images")
+    print(f"float32: {full['bytes_per_vector']} B/vector, centroid accuracy {full['centroid_accuracy']:.0%}, "
+          f"nearest accuracy {full['nearest_accuracy']:.0%}")
+    for row in report["compressed"]:
+        print(f"{row['dtype']:>8} dim={row['dim']:<5} {row['bytes_per_vector']:>6} B/vector  "
+              f"max sim err {row['max_similarity_error']:.4f}  "
+              f"centroid {row['centroid_accuracy']:.0%} ({row['centroid_accuracy_delta']:+.0%})  "
+              f"nearest {row['nearest_accuracy']:.0%} ({row['nearest_accuracy_delta']:+.0%})")
+    if report["prototypes"] <= max(row["dim"] for row in report["compressed"]):
+        print("Note: the PCA was fit on fewer prototypes than dimensions, so it is exact for them; "
+              "the deltas above come from quantization only")
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,171 @@
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from backbones import (
+    BACKBONE_NAMES, CONFIDENCE_THRESHOLD, LABEL_BIASES, PROTOTYPES, TEMPERATURE, TEST_IMAGES,
+    available_prototypes, embed_batch, load_image_batch, prototype_matrix, prototype_probabilities,
+)
+from model_registry import ModelRegistry
+
+# --- Prototype ensemble over EfficientNetB0, MobileNetV2 and ResNet50 ---
+# Each image is decoded once; the shared uint8 batch is fed to every backbone
+# concurrently and the per-backbone probabilities are combined in one weighted step.
+
+
+class PrototypeEnsemble:
+    def __init__(self, produce, backbone_names=None, weights=None, temperature=TEMPERATURE, registry=None):
+        if produce not in PROTOTYPES:
+            raise ValueError(f"Unknown produce type '{produce}'. Choose from {list(PROTOTYPES)}")
+        self.backbone_names = list(backbone_names or BACKBONE_NAMES)
+        self.temperature = temperature
+        self.set_weights(weights)
+
+        # Backbones come from the registry, which loads them on first use and may
+        # evict them again under a memory budget; prototypes are embedded up front
+        self.registry = registry or ModelRegistry()
+        self.prototype_matrices = {}
+        self.labels = None
+        prototypes = available_prototypes(PROTOTYPES[produce])
+        for name in self.backbone_names:
+            feature_extractor, preprocess_input = self.registry.get(name)
+            self.labels, self.prototype_matrices[name] = prototype_matrix(
+                feature_extractor, preprocess_input, prototypes
+            )
+
+        # TensorFlow releases the GIL inside predict, so threads give real overlap
+        self.executor = ThreadPoolExecutor(max_workers=len(self.backbone_names))
+
+    def set_weights(self, weights=None):
+        """Set per-backbone weights; missing backbones get weight 0, default is a plain average"""
+        if weights is None:
+            weights = {name: 1.0 for name in self.backbone_names}
+        unknown = set(weights) - set(self.backbone_names)
+        if unknown:
+            raise ValueError(f"Weights given for backbones not in the ensemble: {sorted(unknown)}")
+        vector = np.array([float(weights.get(name, 0.0)) for name in self.backbone_names])
+        if vector.sum() <= 0:
+            raise ValueError("Ensemble weights must sum to a positive value")
+        self.weights = vector / vector.sum()
+
+    def _run_backbone(self, name, batch):
+        start = time.perf_counter()
+        feature_extractor, preprocess_input = self.registry.get(name)
+        embeddings = embed_batch(feature_extractor, preprocess_input, batch)
+        probabilities = prototype_probabilities(
+            embeddings, self.prototype_matrices[name], self.labels,
+            biases=LABEL_BIASES.get(name), temperature=self.temperature,
+        )
+        return probabilities, time.perf_counter() - start
+
+    def predict(self, batch):
+        """Classify a uint8 (N, 224, 224, 3) batch; returns (ensemble probs, per-backbone probs, timings)"""
+        start = time.perf_counter()
+        futures = {name: self.executor.submit(self._run_backbone, name, batch) for name in self.backbone_names}
+        per_backbone = {}
+        timings = {}
+        for name, future in futures.items():
+            per_backbone[name], timings[name] = future.result()
+
+        # Weighted combination of all backbones as a single (B,) x (B, N, K) contraction
+        combine_start = time.perf_counter()
+        stacked = np.stack([per_backbone[name] for name in self.backbone_names])
+        ensemble_probs = np.tensordot(self.weights, stacked, axes=1)
+        timings["combine"] = time.perf_counter() - combine_start
+        timings["ensemble"] = time.perf_counter() - start
+        return ensemble_probs, per_backbone, timings
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+def run_ensemble(produce, weights=None, img_paths=None, registry=None):
+    """Run the ensemble over a produce type's test images and return a report dict"""
+    ensemble = PrototypeEnsemble(produce, weights=weights, registry=registry)
+    try:
+        img_paths = list(img_paths or TEST_IMAGES[produce])
+
+        # Decode once for all backbones
+        decode_start = time.perf_counter()
+        batch = load_image_batch(img_paths)
+        decode_time = time.perf_counter() - decode_start
+
+        ensemble_probs, per_backbone, timings = ensemble.predict(batch)
+    finally:
+        ensemble.close()
+
+    timings["decode"] = decode_time
+    return {
+        "produce": produce,
+        "labels": ensemble.labels,
+        "images": [os.path.basename(path) for path in img_paths],
+        "weights": dict(zip(ensemble.backbone_names, ensemble.weights.tolist())),
+        "ensemble": ensemble_probs,
+        "per_backbone": per_backbone,
+        "timings": timings,
+        "registry": ensemble.registry.stats(),
+    }
+
+
+def print_report(report):
+    """Print per-image ensemble predictions and a latency breakdown"""
+    labels = report["labels"]
+    for i, image_name in enumerate(report["images"]):
+        preds = dict(zip(labels, report["ensemble"][i]))
+        print(f"\nEnsemble Predictions for '{image_name}':")
+        for label, prob in preds.items():
+            per_model = ", ".join(
+                f"{name} {probs[i][labels.index(label)] * 100:.1f}%" for name, probs in report["per_backbone"].items()
+            )
+            print(f"{label}: {prob * 100:.2f}%  ({per_model})")
+
+        max_label = max(preds, key=preds.get)
+        max_prob = preds[max_label]
+        if max_prob >= CONFIDENCE_THRESHOLD:
+            print(f"✅ Confident ensemble prediction: {max_label} ({max_prob * 100:.2f}%)")
+        else:
+            print("The prediction is not confident enough (less than 80%); consider reviewing the image or improving prototypes.")
+
+    timings = report["timings"]
+    n_images = len(report["images"])
+    fastest = min(timings[name] for name in report["per_backbone"])
+    print(f"\nLatency for {n_images} image(s), weights {report['weights']}:")
+    print("-" * 44)
+    print(f"{'Stage':<16} | {'Total (ms)':>10} | {'Per image':>10}")
+    print("-" * 44)
+    rows = [("Decode (once)", timings["decode"])]
+    rows += [(name, timings[name]) for name in report["per_backbone"]]
+    rows += [("Combine", timings["combine"]), ("Ensemble", timings["ensemble"])]
+    for stage, seconds in rows:
+        print(f"{stage:<16} | {seconds * 1000:>10.1f} | {seconds * 1000 / n_images:>10.1f}")
+    print("-" * 44)
+    print(f"Ensemble costs {timings['ensemble'] / fastest:.2f}x the fastest single backbone.")
+
+    registry = report["registry"]
+    print(f"Resident weights: {registry['resident_weights_mb']:.0f} MB ({registry['weights_dtype']}), "
+          f"process RSS {registry['process_rss_mb']:.0f} MB, {registry['evictions']} eviction(s), "
+          f"{registry['reloads']} reload(s) costing {registry['reload_penalty_s_total']:.1f} s")
+
+
+def parse_weights(text):
+    """Parse 'MobileNetV2=2,ResNet50=1' into a weights dict"""
+    weights = {}
+    for item in text.split(","):
+        name, _, value = item.partition("=")
+        weights[name.strip()] = float(value)
+    return weights
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the prototype ensemble on the sample test images")
+    parser.add_argument("--produce", default="Bananas", choices=sorted(PROTOTYPES))
+    parser.add_argument("--weights", type=parse_weights, default=None,
+                        help="Comma-separated backbone weights, e.g. MobileNetV2=2,EfficientNetB0=1,ResNet50=1")
+    parser.add_argument("--memory-budget-mb", type=float, default=None,
+                        help="Evict least recently used backbones above this many MB of weights")
+    parser.add_argument("--float16", action="store_true", help="Keep backbone weights in float16")
+    args = parser.parse_args()
+    registry = ModelRegistry(args.memory_budget_mb, "float16" if args.float16 else "float32")
+    print_report(run_ensemble(args.produce, weights=args.weights, registry=registry))
@@ -0,0 +1,99 @@
+import argparse
+import os
+import sys
+import numpy as np
+
+from backbones import (
+    BACKBONE_NAMES, PROTOTYPES, TEST_IMAGES,
+    embed_batch, load_backbone, load_image_batch, numpy_preprocess, sample_image_paths,
+)
+from tflite_backbones import PRECISIONS, QUANTIZED_MODELS_DIR, load_quantized_backbone, quantized_model_path
+
+# --- Quantized export of the prototype feature extractors ---
+# Converts each float32 Keras backbone to TFLite at int8 (calibrated on Sample_Images)
+# or float16 precision, then checks that prototype similarities stay close to float32.
+
+# Maximum allowed absolute difference in cosine similarity against the float32 baseline
+DEFAULT_TOLERANCE = {"int8": 0.05, "float16": 0.005}
+
+
+def representative_dataset(name, img_paths):
+    """Calibration batches for int8 quantization, preprocessed exactly as at serving time"""
+    def generator():
+        for path in img_paths:
+            yield [numpy_preprocess(name, load_image_batch([path]))]
+    return generator
+
+
+def export_backbone(name, precision, calibration_paths, models_dir=QUANTIZED_MODELS_DIR):
+    """Convert one backbone to a quantized TFLite flatbuffer and return its path"""
+    import tensorflow as tf
+
+    feature_extractor, _ = load_backbone(name)
+    converter = tf.lite.TFLiteConverter.from_keras_model(feature_extractor)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if precision == "int8":
+        # Full-integer kernels; input and output stay float32 so the pipeline is unchanged
+        converter.representative_dataset = representative_dataset(name, calibration_paths)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    elif precision == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    else:
+        raise ValueError(f"Unknown precision '{precision}'. Choose from {PRECISIONS}")
+
+    tflite_model = converter.convert()
+    os.makedirs(models_dir, exist_ok=True)
+    output_path = quantized_model_path(name, precision, models_dir)
+    with open(output_path, "wb") as f:
+        f.write(tflite_model)
+    print(f"Exported {name} ({precision}) to {output_path}: {len(tflite_model) / 1e6:.1f} MB")
+    return output_path
+
+
+def prototype_similarities(feature_extractor, preprocess_input):
+    """Cosine similarities of every test image against its produce type's prototypes"""
+    similarities = []
+    for produce, prototypes in PROTOTYPES.items():
+        available = {label: path for label, path in prototypes.items() if os.path.exists(path)}
+        if not available:
+            continue
+        proto_matrix = embed_batch(feature_extractor, preprocess_input, load_image_batch(list(available.values())))
+        test_batch = load_image_batch(list(TEST_IMAGES[produce]))
+        test_embeddings = embed_batch(feature_extractor, preprocess_input, test_batch)
+        similarities.append((test_embeddings @ proto_matrix.T).ravel())
+    return np.concatenate(similarities)
+
+
+def verify_backbone(name, precision, tolerance, models_dir=QUANTIZED_MODELS_DIR):
+    """Compare quantized prototype similarities with the float32 Keras baseline"""
+    baseline = prototype_similarities(*load_backbone(name))
+    quantized = prototype_similarities(*load_quantized_backbone(name, precision, models_dir))
+    max_diff = float(np.max(np.abs(baseline - quantized)))
+    passed = max_diff <= tolerance
+    status = "OK" if passed else "FAIL"
+    print(f"{name} ({precision}): max similarity difference {max_diff:.4f} (tolerance {tolerance}) {status}")
+    return passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export quantized TFLite feature extractors and verify them")
+    parser.add_argument("--backbones", nargs="+", default=BACKBONE_NAMES, choices=BACKBONE_NAMES)
+    parser.add_argument("--precision", nargs="+", default=PRECISIONS, choices=PRECISIONS)
+    parser.add_argument("--models-dir", default=QUANTIZED_MODELS_DIR)
+    parser.add_argument("--tolerance", type=float, default=None,
+                        help="Override the maximum allowed similarity difference for every precision")
+    parser.add_argument("--verify-only", action="store_true", help="Skip export and only run the tolerance check")
+    args = parser.parse_args()
+
+    calibration_paths = sample_image_paths()
+    all_passed = True
+    for name in args.backbones:
+        for precision in args.precision:
+            if not args.verify_only:
+                export_backbone(name, precision, calibration_paths, args.models_dir)
+            tolerance = args.tolerance if args.tolerance is not None else DEFAULT_TOLERANCE[precision]
+            all_passed = verify_backbone(name, precision, tolerance, args.models_dir) and all_passed
+
+    if not all_passed:
+        print("Quantized models drifted beyond tolerance from the float32 baseline.")
+        sys.exit(1)
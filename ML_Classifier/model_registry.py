@@ -0,0 +1,120 @@
+import gc
+import os
+import resource
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from backbones import load_backbone
+
+# --- Lazy backbone registry with LRU eviction ---
+# Backbones are loaded on first use and the least recently used ones are evicted
+# whenever the resident weights exceed the memory budget. With weights_dtype="float16"
+# models are built under a float16 Keras policy, halving their resident weights at
+# the cost of slower CPU kernels. Load/eviction counts, reload penalty and process
+# memory are exposed through stats().
+
+BYTES_PER_PARAM = {"float32": 4, "float16": 2}
+
+
+def process_rss_mb():
+    """Current resident set size of this process"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        # No /proc (e.g. macOS): fall back to the peak, reported in bytes there
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class ModelRegistry:
+    def __init__(self, memory_budget_mb=None, weights_dtype="float32", loader=load_backbone):
+        if weights_dtype not in BYTES_PER_PARAM:
+            raise ValueError(f"Unknown weights dtype '{weights_dtype}'. Choose from {list(BYTES_PER_PARAM)}")
+        self.memory_budget_mb = memory_budget_mb
+        self.weights_dtype = weights_dtype
+        self.loader = loader
+        self.models = OrderedDict()
+        self.sizes_mb = {}
+        self.lock = threading.RLock()
+        # Metrics
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+        self.reloads = 0
+        self.reload_seconds = 0.0
+        self.load_seconds = {}
+        self.evicted_names = set()
+
+    def _load(self, name):
+        if self.weights_dtype == "float32":
+            return self.loader(name)
+        from tensorflow.keras import mixed_precision
+        # The dtype policy is process-global, so only hold it for the duration of the build
+        previous = mixed_precision.global_policy()
+        mixed_precision.set_global_policy(self.weights_dtype)
+        try:
+            return self.loader(name)
+        finally:
+            mixed_precision.set_global_policy(previous)
+
+    def get(self, name):
+        """Return (feature_extractor, preprocess_input) for a backbone, loading it if needed"""
+        with self.lock:
+            if name in self.models:
+                self.models.move_to_end(name)
+                self.hits += 1
+                return self.models[name]
+
+            start = time.perf_counter()
+            model = self._load(name)
+            elapsed = time.perf_counter() - start
+            self.loads += 1
+            self.load_seconds[name] = elapsed
+            if name in self.evicted_names:
+                # Paying for a model we already had once is the cost of the budget
+                self.reloads += 1
+                self.reload_seconds += elapsed
+
+            feature_extractor = model[0]
+            count_params = getattr(feature_extractor, "count_params", None)
+            self.sizes_mb[name] = count_params() * BYTES_PER_PARAM[self.weights_dtype] / (1024 * 1024) if count_params else 0.0
+            self.models[name] = model
+            self._evict(keep=name)
+            return model
+
+    def _evict(self, keep):
+        if self.memory_budget_mb is None:
+            return
+        while self.resident_mb() > self.memory_budget_mb and len(self.models) > 1:
+            name = next(iter(self.models))
+            if name == keep:
+                break
+            del self.models[name]
+            self.evicted_names.add(name)
+            self.evictions += 1
+            print(f"Evicted {name} ({self.sizes_mb[name]:.0f} MB) to stay within {self.memory_budget_mb} MB")
+        gc.collect()
+
+    def resident_mb(self):
+        with self.lock:
+            return sum(self.sizes_mb[name] for name in self.models)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "weights_dtype": self.weights_dtype,
+                "memory_budget_mb": self.memory_budget_mb,
+                "resident": {name: self.sizes_mb[name] for name in self.models},
+                "resident_weights_mb": self.resident_mb(),
+                "process_rss_mb": process_rss_mb(),
+                "hits": self.hits,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "reloads": self.reloads,
+                "reload_penalty_s_total": self.reload_seconds,
+                "reload_penalty_s_mean": self.reload_seconds / self.reloads if self.reloads else None,
+                "load_seconds": dict(self.load_seconds),
+            }
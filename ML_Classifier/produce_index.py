@@ -0,0 +1,322 @@
+import argparse
+import base64
+import json
+import os
+import threading
+import numpy as np
+
+from backbones import (
+    LABEL_BIASES, SAMPLE_IMAGES_DIR, TEMPERATURE, TEST_IMAGES,
+    embed_batch, load_backbone, load_image_batch,
+)
+
+# --- Unified prototype index across all produce types ---
+# Every (produce, condition) class gets one centroid row in a single matrix, so one
+# embedding pass plus one matrix multiply yields both the produce type and its
+# freshness condition. Prototypes are discovered from the Sample_Images layout:
+#   Sample_Images/<Produce>/Training_Images/<condition>_<anything>.jpg
+# so adding a produce type only means adding its prototype images.
+#
+# Each class keeps a running sum of its member embeddings, so labeled examples can be
+# added or removed online in O(1) without re-embedding anything. Changes are appended
+# to a journal next to the saved index and replayed on load; save() compacts it.
+# For large prototype sets, compress() moves the per-example embeddings into a
+# CompressedEmbeddingStore (PCA + float16/int8); class sums then hold the decoded
+# vectors, so removing an example subtracts exactly what was added.
+
+# File name prefixes that map onto the classifier's condition labels
+CONDITION_ALIASES = {"good": "good", "risky": "risky", "rotten": "expired", "expired": "expired"}
+
+
+def discover_prototypes(root=SAMPLE_IMAGES_DIR):
+    """Map (produce, condition) -> list of prototype image paths"""
+    prototypes = {}
+    for produce in sorted(os.listdir(root)):
+        training_dir = os.path.join(root, produce, "Training_Images")
+        if not os.path.isdir(training_dir):
+            continue
+        for filename in sorted(os.listdir(training_dir)):
+            prefix = filename.split("_", 1)[0].lower()
+            if prefix not in CONDITION_ALIASES:
+                print(f"Skipping prototype '{filename}': name should start with one of {sorted(CONDITION_ALIASES)}")
+                continue
+            key = (produce, CONDITION_ALIASES[prefix])
+            prototypes.setdefault(key, []).append(os.path.join(training_dir, filename))
+    return prototypes
+
+
+def _encode_embedding(embedding):
+    return base64.b64encode(np.asarray(embedding, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def _decode_embedding(text):
+    return np.frombuffer(base64.b64decode(text), dtype=np.float32)
+
+
+class ProduceIndex:
+    def __init__(self, backbone_name, dim, feature_extractor=None, preprocess_input=None):
+        self.backbone_name = backbone_name
+        self.feature_extractor = feature_extractor
+        self.preprocess_input = preprocess_input
+        self.labels = []
+        self.sums = np.zeros((0, dim))
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.centroids = np.zeros((0, dim))
+        # example id -> (class row, embedding), needed to subtract an example again;
+        # the embedding is None once it lives in the compressed store
+        self.examples = {}
+        self.store = None
+        self.path = None
+        self.lock = threading.RLock()
+        self._refresh()
+
+    def _refresh(self):
+        """Rebuild the lookup arrays derived from the labels"""
+        self.produce_names = sorted({produce for produce, _ in self.labels})
+        produce_ids = np.array([self.produce_names.index(produce) for produce, _ in self.labels], dtype=np.int64)
+        # (C, P) one-hot map from class rows to produce types, used to sum probabilities per produce
+        self.produce_onehot = np.eye(len(self.produce_names))[produce_ids]
+        biases = LABEL_BIASES.get(self.backbone_name, {})
+        self.bias_vector = np.array([biases.get(condition, 0.0) for _, condition in self.labels])
+
+    @classmethod
+    def build(cls, backbone_name="MobileNetV2", root=SAMPLE_IMAGES_DIR, embed_fn=None):
+        """Embed every discovered prototype; embed_fn(uint8 batch) defaults to loading the backbone here"""
+        feature_extractor = preprocess_input = None
+        if embed_fn is None:
+            feature_extractor, preprocess_input = load_backbone(backbone_name)
+            embed_fn = lambda batch: embed_batch(feature_extractor, preprocess_input, batch)
+        prototypes = discover_prototypes(root)
+        if not prototypes:
+            raise FileNotFoundError(f"No prototype images found under {root}")
+
+        index = None
+        for (produce, condition), paths in prototypes.items():
+            embeddings = embed_fn(load_image_batch(paths))
+            if index is None:
+                index = cls(backbone_name, embeddings.shape[1], feature_extractor, preprocess_input)
+            for path, embedding in zip(paths, embeddings):
+                index.add_example(produce, condition, embedding, example_id=os.path.relpath(path, root))
+        return index
+
+    def _class_row(self, produce, condition):
+        key = (produce, condition)
+        if key in self.labels:
+            return self.labels.index(key)
+        # A new class costs one row append; updates to existing classes are O(1)
+        dim = self.sums.shape[1]
+        self.labels.append(key)
+        self.sums = np.vstack([self.sums, np.zeros((1, dim))])
+        self.counts = np.append(self.counts, 0)
+        self.centroids = np.vstack([self.centroids, np.zeros((1, dim))])
+        self._refresh()
+        return len(self.labels) - 1
+
+    def _update_centroid(self, row):
+        norm = np.linalg.norm(self.sums[row])
+        self.centroids[row] = self.sums[row] / norm if self.counts[row] > 0 and norm > 0 else 0.0
+
+    def _journal(self, record):
+        if self.path is not None:
+            with open(self.path + ".journal", "a") as f:
+                f.write(json.dumps(record) + "\n")
+
+    def add_example(self, produce, condition, embedding, example_id=None, persist=True):
+        """Add one labeled embedding to its class centroid and return its example id"""
+        embedding = np.asarray(embedding, dtype=np.float32).ravel()
+        with self.lock:
+            example_id = example_id or f"example-{len(self.examples)}-{os.urandom(4).hex()}"
+            if example_id in self.examples:
+                raise ValueError(f"Example '{example_id}' is already in the index")
+            row = self._class_row(produce, condition)
+            stored = embedding
+            if self.store is not None:
+                self.store.add(example_id, embedding)
+                stored, embedding = None, self.store.get(example_id)
+            self.sums[row] += embedding
+            self.counts[row] += 1
+            self._update_centroid(row)
+            self.examples[example_id] = (row, stored)
+            if persist:
+                self._journal({"op": "add", "id": example_id, "produce": produce, "condition": condition,
+                               "embedding": _encode_embedding(embedding)})
+        return example_id
+
+    def remove_example(self, example_id, persist=True):
+        """Subtract a previously added example from its class centroid"""
+        with self.lock:
+            if example_id not in self.examples:
+                raise KeyError(f"Example '{example_id}' is not in the index")
+            row, embedding = self.examples.pop(example_id)
+            if embedding is None:
+                embedding = self.store.remove(example_id)
+            self.sums[row] -= embedding
+            self.counts[row] -= 1
+            self._update_centroid(row)
+            if persist:
+                self._journal({"op": "remove", "id": example_id})
+            return self.labels[row]
+
+    def example_embedding(self, example_id):
+        """Embedding of one example, decoded from the compressed store if necessary"""
+        with self.lock:
+            row, embedding = self.examples[example_id]
+            return embedding if embedding is not None else self.store.get(example_id)
+
+    def class_examples(self, row):
+        """(n, D) embeddings of every example in one class row"""
+        with self.lock:
+            ids = [example_id for example_id, (example_row, _) in self.examples.items() if example_row == row]
+            if self.store is not None:
+                return self.store.decode([self.store.slots[i] for i in ids]).astype(np.float32)
+            return np.array([self.examples[i][1] for i in ids], dtype=np.float32).reshape(len(ids), -1)
+
+    def compress(self, dim=None, dtype="int8"):
+        """Move example embeddings into a compressed store fit on them; returns the store"""
+        from compressed_store import CompressedEmbeddingStore
+        with self.lock:
+            if self.store is not None:
+                raise RuntimeError("Index is already compressed")
+            ids = list(self.examples)
+            rows = np.array([self.examples[i][0] for i in ids], dtype=np.int64)
+            embeddings = np.array([self.examples[i][1] for i in ids], dtype=np.float32).reshape(len(ids), -1)
+            store = CompressedEmbeddingStore.fit(embeddings, dim=dim, dtype=dtype)
+            store.add_many(ids, embeddings)
+            self._attach_store(store, ids, rows)
+            return store
+
+    def _attach_store(self, store, ids, rows):
+        # Rebuild the class sums from the decoded vectors the store will hand back
+        self.store = store
+        self.sums = np.zeros_like(self.sums)
+        if ids:
+            np.add.at(self.sums, rows, store.decode([store.slots[i] for i in ids]))
+        for row in range(len(self.labels)):
+            self._update_centroid(row)
+        self.examples = {example_id: (int(row), None) for example_id, row in zip(ids, rows)}
+
+    def class_sizes(self):
+        with self.lock:
+            return {f"{produce}/{condition}": int(count) for (produce, condition), count in zip(self.labels, self.counts)}
+
+    def save(self, path):
+        """Write a full snapshot and start a fresh journal"""
+        with self.lock:
+            ids = list(self.examples)
+            dim = self.sums.shape[1]
+            # A compressed index stores the codes instead of the float32 embeddings
+            store_state = self.store.state() if self.store is not None else {}
+            np.savez(
+                path,
+                backbone=self.backbone_name,
+                labels=np.array(self.labels, dtype=str).reshape(-1, 2),
+                example_ids=np.array(ids, dtype=str),
+                example_rows=np.array([self.examples[i][0] for i in ids], dtype=np.int64),
+                example_embeddings=np.zeros((0, dim), dtype=np.float32) if self.store is not None
+                else np.array([self.examples[i][1] for i in ids], dtype=np.float32).reshape(len(ids), dim),
+                **store_state,
+            )
+            # np.savez appends .npz when it is missing
+            self.path = path if path.endswith(".npz") else path + ".npz"
+            if os.path.exists(self.path + ".journal"):
+                os.remove(self.path + ".journal")
+
+    @classmethod
+    def load(cls, path, with_backbone=True):
+        """Load a snapshot and replay any journaled updates made since"""
+        data = np.load(path)
+        backbone_name = str(data["backbone"])
+        feature_extractor, preprocess_input = load_backbone(backbone_name) if with_backbone else (None, None)
+        embeddings = data["example_embeddings"]
+        index = cls(backbone_name, embeddings.shape[1], feature_extractor, preprocess_input)
+        labels = [tuple(label) for label in data["labels"].tolist()]
+        if "store_codes" in data:
+            from compressed_store import CompressedEmbeddingStore
+            for produce, condition in labels:
+                index._class_row(produce, condition)
+            index.counts = np.bincount(data["example_rows"], minlength=len(labels)).astype(np.int64)
+            index._attach_store(CompressedEmbeddingStore.from_state(data), data["example_ids"].tolist(), data["example_rows"])
+        for example_id, row, embedding in zip(data["example_ids"].tolist(), data["example_rows"], embeddings):
+            produce, condition = labels[row]
+            index.add_example(produce, condition, embedding, example_id=example_id, persist=False)
+
+        journal_path = path + ".journal"
+        if os.path.exists(journal_path):
+            with open(journal_path) as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    if record["op"] == "add":
+                        index.add_example(record["produce"], record["condition"], _decode_embedding(record["embedding"]),
+                                          example_id=record["id"], persist=False)
+                    elif record["op"] == "remove" and record["id"] in index.examples:
+                        index.remove_example(record["id"], persist=False)
+        index.path = path
+        return index
+
+    def probabilities(self, embeddings, temperature=TEMPERATURE):
+        """Softmax over every (produce, condition) class from a single matrix multiply"""
+        scaled = temperature * (embeddings @ self.centroids.T + self.bias_vector)
+        # Classes emptied by remove_example have a zero centroid; keep them out of the softmax
+        scaled[:, self.counts == 0] = -np.inf
+        exp_sim = np.exp(scaled - scaled.max(axis=1, keepdims=True))
+        return exp_sim / exp_sim.sum(axis=1, keepdims=True)
+
+    def classify_embeddings(self, embeddings, temperature=TEMPERATURE):
+        """Return one result dict per embedding with produce type and condition"""
+        with self.lock:
+            probs = self.probabilities(embeddings, temperature)
+            produce_onehot = self.produce_onehot
+            labels = list(self.labels)
+            produce_names = list(self.produce_names)
+        produce_probs = probs @ produce_onehot
+        results = []
+        for row, produce_row in zip(probs, produce_probs):
+            produce_id = int(produce_row.argmax())
+            produce = produce_names[produce_id]
+            # Condition probabilities within the winning produce type
+            mask = produce_onehot[:, produce_id].astype(bool)
+            conditions = {labels[i][1]: float(row[i] / produce_row[produce_id]) for i in np.flatnonzero(mask)}
+            condition = max(conditions, key=conditions.get)
+            results.append({
+                "produce": produce,
+                "produce_probability": float(produce_row[produce_id]),
+                "condition": condition,
+                "condition_probability": conditions[condition],
+                "conditions": conditions,
+            })
+        return results
+
+    def embed(self, batch):
+        """Embed a uint8 image batch with this index's backbone"""
+        if self.feature_extractor is None:
+            raise RuntimeError("Index was loaded without a backbone; embed images elsewhere and use classify_embeddings")
+        return embed_batch(self.feature_extractor, self.preprocess_input, batch)
+
+    def classify(self, batch, temperature=TEMPERATURE):
+        """Classify a uint8 image batch"""
+        return self.classify_embeddings(self.embed(batch), temperature)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Classify produce type and condition in one pass")
+    parser.add_argument("images", nargs="*", help="Images to classify (defaults to every sample test image)")
+    parser.add_argument("--backbone", default="MobileNetV2")
+    parser.add_argument("--save", default=None, help="Write the built index to this .npz file")
+    parser.add_argument("--compress", default=None, choices=["float16", "int8"], help="Store examples compressed")
+    parser.add_argument("--pca-dim", type=int, default=None, help="Project compressed examples to this many dimensions")
+    args = parser.parse_args()
+
+    index = ProduceIndex.build(args.backbone)
+    print(f"Index: {len(index.labels)} classes over {len(index.produce_names)} produce types ({args.backbone})")
+    if args.compress:
+        store = index.compress(dim=args.pca_dim, dtype=args.compress)
+        print(f"Compressed examples: {args.compress}, {store.dim} dims, {store.nbytes()['per_vector']} B/vector")
+    if args.save:
+        index.save(args.save)
+
+    img_paths = args.images or [path for paths in TEST_IMAGES.values() for path in paths]
+    for path, result in zip(img_paths, index.classify(load_image_batch(img_paths))):
+        print(f"\n'{os.path.basename(path)}': {result['produce']} ({result['produce_probability'] * 100:.1f}%), "
+              f"{result['condition']} ({result['condition_probability'] * 100:.1f}%)")
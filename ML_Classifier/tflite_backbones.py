@@ -0,0 +1,68 @@
+import os
+from functools import partial
+import numpy as np
+
+from backbones import BACKBONE_NAMES, ML_DIR, numpy_preprocess
+
+# Serving path for the quantized feature extractors written by export_quantized.py.
+# Only a TFLite interpreter and numpy are needed here, not full TensorFlow.
+
+QUANTIZED_MODELS_DIR = os.path.join(ML_DIR, "quantized_models")
+PRECISIONS = ["int8", "float16"]
+
+
+def _interpreter_class():
+    # Prefer the standalone runtimes; fall back to the interpreter bundled with TensorFlow
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        import tensorflow as tf
+        return tf.lite.Interpreter
+    except ImportError:
+        raise ImportError("No TFLite runtime found. Install it using: pip install ai-edge-litert (or tflite-runtime)")
+
+
+def quantized_model_path(name, precision, models_dir=QUANTIZED_MODELS_DIR):
+    if name not in BACKBONE_NAMES:
+        raise ValueError(f"Unknown backbone '{name}'. Choose from {BACKBONE_NAMES}")
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}'. Choose from {PRECISIONS}")
+    return os.path.join(models_dir, f"{name}_{precision}.tflite")
+
+
+class TFLiteFeatureExtractor:
+    """Wraps a TFLite interpreter with the keras predict() call the classifiers use"""
+
+    def __init__(self, model_path, num_threads=None):
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Quantized model not found at {model_path}; run export_quantized.py first")
+        self.model_path = model_path
+        self.interpreter = _interpreter_class()(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self.input_index = self.interpreter.get_input_details()[0]["index"]
+        self.output_index = self.interpreter.get_output_details()[0]["index"]
+        self.batch_size = int(self.interpreter.get_input_details()[0]["shape"][0])
+
+    def predict(self, img_array, verbose=0):
+        # Resize the input only when the batch size changes; re-allocating is not free
+        if img_array.shape[0] != self.batch_size:
+            self.interpreter.resize_tensor_input(self.input_index, list(img_array.shape))
+            self.interpreter.allocate_tensors()
+            self.batch_size = img_array.shape[0]
+        self.interpreter.set_tensor(self.input_index, np.ascontiguousarray(img_array, dtype=np.float32))
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output_index).copy()
+
+
+def load_quantized_backbone(name, precision="int8", models_dir=QUANTIZED_MODELS_DIR, num_threads=None):
+    """Drop-in replacement for backbones.load_backbone backed by a quantized TFLite model"""
+    feature_extractor = TFLiteFeatureExtractor(quantized_model_path(name, precision, models_dir), num_threads=num_threads)
+    return feature_extractor, partial(numpy_preprocess, name)
@@ -0,0 +1,215 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Optional
+
+# Append-only audit log of classification requests.
+# The request path only appends a record to an in-memory deque. A background task
+# drains it in batches and, in a worker thread, hashes images, serialises fields and
+# appends one Arrow record batch per flush to an Arrow IPC stream file. Files rotate
+# by row count and age; the open file carries an ".inprogress" suffix, renamed once
+# it is complete. IPC streams stay readable up to the last written batch even after
+# a crash, and load directly with pyarrow.ipc.open_stream (or pandas/polars).
+# The queue is bounded both in records and in the image bytes it holds; records
+# beyond either bound, and batches that fail to write, are counted in stats().
+
+AUDIT_SUFFIX = ".arrows"
+IN_PROGRESS_SUFFIX = ".inprogress"
+
+
+def audit_schema():
+    import pyarrow as pa
+    return pa.schema([
+        ("timestamp", pa.timestamp("ms", tz="UTC")),
+        ("endpoint", pa.string()),
+        ("image_sha256", pa.string()),
+        ("image_bytes", pa.int64()),
+        ("inputs", pa.string()),
+        ("outputs", pa.string()),
+        ("error", pa.string()),
+        ("latency_ms", pa.float64()),
+    ])
+
+
+def read_audit_log(path):
+    """Read one audit file (complete or in progress) into a pyarrow Table"""
+    import pyarrow as pa
+    with pa.OSFile(path, "rb") as f:
+        return pa.ipc.open_stream(f).read_all()
+
+
+class AuditLog:
+    def __init__(self, directory, batch_size=256, flush_interval_s=1.0, rotate_rows=100_000,
+                 rotate_seconds=3600, max_pending=100_000, max_pending_bytes=256 * 1024 * 1024):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("The audit log writes Arrow IPC files; install it using: pip install pyarrow")
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self.rotate_rows = rotate_rows
+        self.rotate_seconds = rotate_seconds
+        self.max_pending = max_pending
+        self.max_pending_bytes = max_pending_bytes
+        self.pending = deque()
+        # Image bytes held by the queued records
+        self.pending_bytes = 0
+        self.wakeup = None
+        self.stopping = False
+        self.task = None
+        # Writer state, only touched from the writer thread
+        self.writer = None
+        self.sink = None
+        self.path = None
+        self.file_rows = 0
+        self.file_opened = 0.0
+        # Metrics
+        self.recorded = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed_batches = 0
+        self.failed_records = 0
+        self.last_error = None
+        self.files_completed = 0
+        self.write_seconds = 0.0
+        os.makedirs(directory, exist_ok=True)
+        self._finish_abandoned_files()
+
+    def record(self, endpoint: str, inputs: dict, outputs=None, started: Optional[float] = None,
+               image: Optional[bytes] = None, error: Optional[str] = None):
+        """Enqueue one audit record; started is the request's time.perf_counter() start"""
+        size = len(image) if image else 0
+        if len(self.pending) >= self.max_pending or self.pending_bytes + size > self.max_pending_bytes:
+            # Never block or grow without bound if the disk cannot keep up
+            self.dropped += 1
+            return
+        latency_ms = (time.perf_counter() - started) * 1000 if started is not None else None
+        self.pending.append((time.time(), endpoint, image, inputs, outputs, error, latency_ms))
+        self.pending_bytes += size
+        self.recorded += 1
+        if self.wakeup is not None and len(self.pending) >= self.batch_size:
+            self.wakeup.set()
+
+    def start(self):
+        self.wakeup = asyncio.Event()
+        self.stopping = False
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything still queued and complete the current file"""
+        if self.task is not None:
+            self.stopping = True
+            self.wakeup.set()
+            await self.task
+            self.task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.flush_interval_s)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            # One write at a time, so the writer state needs no lock
+            while self.pending:
+                records = self._drain()
+                try:
+                    await asyncio.to_thread(self._write, records)
+                except Exception as e:
+                    # The batch is lost; keep count so it shows up in stats()
+                    self.failed_batches += 1
+                    self.failed_records += len(records)
+                    self.last_error = f"{type(e).__name__}: {e}"
+                    print(f"Audit log write failed, {len(records)} records lost: {e}")
+                    break
+            if self.stopping:
+                break
+        await asyncio.to_thread(self._close_file)
+
+    def _drain(self):
+        batch = []
+        while self.pending and len(batch) < self.batch_size:
+            record = self.pending.popleft()
+            self.pending_bytes -= len(record[2]) if record[2] else 0
+            batch.append(record)
+        return batch
+
+    def _write(self, records):
+        import pyarrow as pa
+        start = time.perf_counter()
+        columns = {name: [] for name in audit_schema().names}
+        for timestamp, endpoint, image, inputs, outputs, error, latency_ms in records:
+            columns["timestamp"].append(datetime.fromtimestamp(timestamp, timezone.utc))
+            columns["endpoint"].append(endpoint)
+            columns["image_sha256"].append(hashlib.sha256(image).hexdigest() if image else None)
+            columns["image_bytes"].append(len(image) if image else None)
+            columns["inputs"].append(json.dumps(inputs, default=str))
+            columns["outputs"].append(json.dumps(outputs, default=str) if outputs is not None else None)
+            columns["error"].append(error)
+            columns["latency_ms"].append(latency_ms)
+        batch = pa.RecordBatch.from_pydict(columns, schema=audit_schema())
+
+        if self.writer is None:
+            self._open_file()
+        self.writer.write_batch(batch)
+        self.sink.flush()
+        self.file_rows += len(records)
+        self.written += len(records)
+        self.write_seconds += time.perf_counter() - start
+        if self.file_rows >= self.rotate_rows or time.time() - self.file_opened >= self.rotate_seconds:
+            self._close_file()
+
+    def _open_file(self):
+        import pyarrow as pa
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        self.path = os.path.join(self.directory, f"audit-{stamp}-{self.files_completed:05d}-{os.getpid()}{AUDIT_SUFFIX}")
+        self.sink = pa.OSFile(self.path + IN_PROGRESS_SUFFIX, "wb")
+        self.writer = pa.ipc.new_stream(self.sink, audit_schema())
+        self.file_rows = 0
+        self.file_opened = time.time()
+
+    def _close_file(self):
+        if self.writer is None:
+            return
+        self.writer.close()
+        self.sink.close()
+        os.replace(self.path + IN_PROGRESS_SUFFIX, self.path)
+        self.writer = self.sink = None
+        self.files_completed += 1
+
+    def _finish_abandoned_files(self):
+        """Files left in progress by a crashed process are readable up to their last batch"""
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(AUDIT_SUFFIX + IN_PROGRESS_SUFFIX):
+                continue
+            pid = int(filename[:-len(AUDIT_SUFFIX + IN_PROGRESS_SUFFIX)].rsplit("-", 1)[1])
+            try:
+                # Leave files of other live workers alone
+                os.kill(pid, 0)
+                continue
+            except ProcessLookupError:
+                pass
+            except PermissionError:
+                continue
+            path = os.path.join(self.directory, filename)
+            os.replace(path, path[:-len(IN_PROGRESS_SUFFIX)])
+
+    def stats(self):
+        return {
+            "recorded": self.recorded,
+            "written": self.written,
+            "pending": len(self.pending),
+            "pending_bytes": self.pending_bytes,
+            "dropped": self.dropped,
+            "failed_batches": self.failed_batches,
+            "failed_records": self.failed_records,
+            "last_error": self.last_error,
+            "files_completed": self.files_completed,
+            "current_file": self.path if self.writer is not None else None,
+            "write_ms_per_record": self.write_seconds * 1000 / self.written if self.written else None,
+        }
@@ -0,0 +1,241 @@
+import argparse
+import base64
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import timeit
+from datetime import datetime
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+# --- Hot path micro-benchmarks ---
+# Times the CPU work done on every request (base64 decode, image open/decode, response
+# parsing, normalization, best-before date math) and the ML_Classifier scoring code
+# against fixed fixtures: canned Gemini responses and the Sample_Images. Runs fully
+# offline. Each benchmark reports the fastest of several timeit repeats in
+# microseconds per call (the minimum is the run least disturbed by other load);
+# --update-baseline stores them, and later runs exit with status 1 when any
+# benchmark is slower than its baseline by more than --threshold. Baselines are
+# stored together with a fixed calibration loop timed in the same run, and
+# compared relative to it, so a faster or slower (or busier) machine does not by
+# itself pass or fail the check; a different machine or Python still gets a warning.
+#
+#   python bench_hot_paths.py --update-baseline
+#   python bench_hot_paths.py --threshold 0.25
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ML_DIR = os.path.join(HERE, "..", "ML_Classifier")
+sys.path.append(ML_DIR)
+# foodClassifier configures the Gemini client at import time; nothing is called upstream here
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+
+from backbones import decode_image, prototype_probabilities, sample_image_paths  # noqa: E402
+from produce_index import ProduceIndex  # noqa: E402
+from foodClassifier import (  # noqa: E402
+    days_since_best_before, extract_json, normalize_classification, parse_classification_response,
+)
+
+BASELINE_PATH = os.path.join(HERE, "bench_baselines.json")
+
+# Canned Gemini responses in the formats seen from the classify and best-before prompts
+CLASSIFY_RESPONSES = {
+    "clean": (
+        "ItemName: Banana\n"
+        "Condition: Needs immediate distribution\n"
+        "FoodType: Fruits & Vegetables\n"
+        "Restrictions: Vegan, Vegetarian, Gluten-Free\n"
+        "Reason: Brown spots are spreading but the fruit is still firm."
+    ),
+    "messy": (
+        "Here is my analysis of the image:\n\n"
+        "**ItemName:** Milk\n"
+        "condition: safe for consumption  \n"
+        "FOODTYPE: dairy\n"
+        "Restrictions: vegetarian ,gluten-free\n"
+        "Reason: Sealed carton, no visible damage.\n"
+        "Let me know if you need anything else."
+    ),
+    "no_item_name": (
+        "Condition: Waste\n"
+        "FoodType: Fruits & Vegetables\n"
+        "Restrictions: None\n"
+        "Reason: The apple shows mold on most of its surface."
+    ),
+}
+BEST_BEFORE_RESPONSES = {
+    "clean": '{"is_safe": true, "safe_until": "2025-06-14", "explanation": "Unopened and within the '
+             'guideline for canned goods.", "recommendation": "Safe to donate."}',
+    "wrapped": 'Sure, here is the result:\n```json\n{"is_safe": false, "safe_until": null, "explanation": '
+               '"Opened dairy 10 days past its date.", "recommendation": "Do not donate; compost it."}\n```',
+}
+
+
+def load_fixtures():
+    paths = sample_image_paths()
+    if not paths:
+        raise FileNotFoundError("No Sample_Images found; the image benchmarks need them")
+    images = [open(path, "rb").read() for path in paths]
+    data_urls = ["data:image/jpeg;base64," + base64.b64encode(data).decode("ascii") for data in images]
+    # Synthetic but fixed scoring inputs, sized like a full produce index
+    rng = np.random.default_rng(0)
+    dim = 1280
+    embeddings = rng.standard_normal((32, dim)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    proto_matrix = embeddings[:3] + 0.1 * rng.standard_normal((3, dim)).astype(np.float32)
+    proto_matrix /= np.linalg.norm(proto_matrix, axis=1, keepdims=True)
+    index = ProduceIndex("MobileNetV2", dim)
+    for produce in ["Apples", "Bananas", "Oranges", "Tomatoes", "Potatoes", "Carrots"]:
+        for condition in ["good", "risky", "expired"]:
+            for example in rng.standard_normal((4, dim)):
+                index.add_example(produce, condition, example / np.linalg.norm(example), persist=False)
+    return images, data_urls, embeddings, proto_matrix, index
+
+
+def decode_data_urls(data_urls):
+    # Same steps as /classify-base64/
+    for image_data in data_urls:
+        if "base64," in image_data:
+            image_data = image_data.split("base64,")[1]
+        base64.b64decode(image_data)
+
+
+def open_images(images):
+    for data in images:
+        Image.open(BytesIO(data))
+
+
+def load_images(images):
+    for data in images:
+        Image.open(BytesIO(data)).convert("RGB")
+
+
+def parse_responses():
+    # The parser prints debug lines; keep them out of the timing
+    with contextlib.redirect_stdout(io.StringIO()):
+        for text in CLASSIFY_RESPONSES.values():
+            parse_classification_response(text)
+
+
+def normalize_results():
+    normalize_classification("Needs immediate distribution", "Fruits & Vegetables", "Banana")
+    normalize_classification("safe", "dairy", "Milk")
+    normalize_classification("rotten", "Unknown", "Unknown Item")
+
+
+def best_before_math():
+    now = datetime(2025, 6, 1)
+    for date in ["2025-05-20", "2025-06-01", "2025-07-15"]:
+        days_since_best_before(date, now)
+
+
+def extract_best_before_json():
+    for text in BEST_BEFORE_RESPONSES.values():
+        extract_json(text)
+
+
+def make_benchmarks():
+    images, data_urls, embeddings, proto_matrix, index = load_fixtures()
+    labels = ["good", "risky", "expired"]
+    single = embeddings[:1]
+    return {
+        "base64_decode": lambda: decode_data_urls(data_urls),
+        "image_open": lambda: open_images(images),
+        "image_load_rgb": lambda: load_images(images),
+        "image_decode_224": lambda: [decode_image(data) for data in images],
+        "parse_classification_response": parse_responses,
+        "normalize_classification": normalize_results,
+        "best_before_date_math": best_before_math,
+        "extract_json": extract_best_before_json,
+        "prototype_probabilities_1": lambda: prototype_probabilities(single, proto_matrix, labels, {"risky": 0.1}),
+        "prototype_probabilities_32": lambda: prototype_probabilities(embeddings, proto_matrix, labels, {"risky": 0.1}),
+        "index_classify_embeddings_1": lambda: index.classify_embeddings(single),
+        "index_classify_embeddings_32": lambda: index.classify_embeddings(embeddings),
+    }
+
+
+def calibration_loop():
+    # Fixed mix of interpreter and numpy work, a yardstick for this machine's speed
+    total = 0
+    for i in range(2000):
+        total += i * i % 7
+    matrix = np.arange(4096, dtype=np.float32).reshape(64, 64)
+    return total, float((matrix @ matrix).sum())
+
+
+def measure(fn, repeat=7, min_time=0.05):
+    """Fastest microseconds per call over several repeats, each running at least min_time"""
+    timer = timeit.Timer(fn)
+    number, elapsed = timer.autorange()
+    number = max(1, int(number * min_time / max(elapsed, 1e-9))) if elapsed < min_time else number
+    times = timer.repeat(repeat=repeat, number=number)
+    return min(times) / number * 1e6
+
+
+def machine_info():
+    return {"machine": platform.platform(), "processor": platform.processor() or platform.machine(),
+            "python": platform.python_version(), "numpy": np.__version__}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline micro-benchmarks for the request hot path")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline JSON file")
+    parser.add_argument("--update-baseline", action="store_true", help="Store this run as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Allowed slowdown over the baseline before failing (0.25 = 25%%)")
+    parser.add_argument("--only", nargs="+", help="Run only these benchmarks")
+    parser.add_argument("--repeat", type=int, default=7, help="timeit repeats per benchmark")
+    args = parser.parse_args()
+
+    stored = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            stored = json.load(f)
+    baseline = stored.get("benchmarks", {})
+    info = machine_info()
+    differs = [key for key in ("machine", "processor", "python", "numpy") if key in stored and stored[key] != info[key]]
+    if differs:
+        print(f"Warning: baseline was recorded with a different {', '.join(differs)} "
+              f"({', '.join(str(stored[key]) for key in differs)}); comparing relative to the calibration loop")
+
+    calibration = measure(calibration_loop, repeat=args.repeat)
+    # Baseline times scaled to how fast this machine runs the calibration loop right now
+    scale = calibration / stored["calibration_us"] if stored.get("calibration_us") else 1.0
+    print(f"Calibration loop: {calibration:.1f} us (baseline scaled by {scale:.2f})")
+
+    results = {}
+    regressions = []
+    print(f"{'benchmark':<32}{'us/call':>12}{'baseline':>12}{'change':>10}")
+    for name, fn in make_benchmarks().items():
+        if args.only and name not in args.only:
+            continue
+        results[name] = measure(fn, repeat=args.repeat)
+        base = baseline[name] * scale if baseline.get(name) else None
+        change = ""
+        if base:
+            ratio = results[name] / base - 1
+            change = f"{ratio:+.0%}"
+            if ratio > args.threshold:
+                regressions.append(name)
+                change += " !"
+        print(f"{name:<32}{results[name]:>12.1f}{f'{base:.1f}' if base else '-':>12}{change:>10}")
+
+    if args.update_baseline:
+        # Results kept from an older baseline are rescaled to this run's calibration
+        merged = dict({name: value * scale for name, value in baseline.items()}, **results)
+        with open(args.baseline, "w") as f:
+            json.dump(dict(info, calibration_us=calibration, benchmarks=merged), f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) regressed more than {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,31 @@
+# Inventory categories and dietary restriction tags shared by the API and the
+# standalone tools (matching demo, product import), so those can run without
+# importing foodClassifier and its Gemini setup.
+
+# Define available inventory categories (adjust based on your actual inventory categories)
+INVENTORY_CATEGORIES = [
+    "Fruits & Vegetables",
+    "Dairy & Eggs",
+    "Meat & Poultry",
+    "Seafood",
+    "Bakery & Bread",
+    "Frozen Foods",
+    "Pantry Staples",
+    "Snacks & Confectionery",
+    "Beverages",
+    "Prepared Foods"
+]
+
+# Mapping of potential dietary restrictions/tags
+POTENTIAL_RESTRICTIONS = [
+    "Vegetarian",
+    "Vegan",
+    "Gluten-Free",
+    "Dairy-Free",
+    "Nut-Free",
+    "Soy-Free",
+    "Halal",
+    "Kosher",
+    "Low Sugar",
+    "Organic"
+]
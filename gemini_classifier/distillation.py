@@ -0,0 +1,165 @@
+import asyncio
+import hashlib
+import json
+import os
+from datetime import date
+from typing import Optional
+
+import numpy as np
+
+# Distillation of Gemini verdicts into local prototypes.
+# High-confidence Gemini classifications arrive with their image; a background task
+# embeds the image with the local backbone and adds it as an example of the
+# (item, condition) class in the produce index. Near-duplicate images and classes
+# that already hold max_per_class examples are skipped. Before an image is added,
+# the local index classifies it; weekly counters record how often it already gave
+# the same (item, condition) as Gemini with at least coverage_confidence, so the
+# growth of local coverage (and the upstream calls it can save) is visible over time.
+
+# Gemini condition labels -> produce index conditions
+CONDITION_MAP = {
+    "safe for consumption": "good",
+    "needs immediate distribution": "risky",
+    "waste": "expired",
+}
+
+# Fallback names classify_image uses when Gemini did not name a specific item
+GENERIC_ITEM_NAMES = {"unknown", "unknown item", "fruit", "vegetable", "dairy product", "meat product", "baked good"}
+
+
+def week_key(day: date) -> str:
+    year, week, _ = day.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+class Distiller:
+    def __init__(self, get_model, food_types, max_per_class=50, dedup_similarity=0.97,
+                 report_path=None, max_pending=256, coverage_confidence=0.8):
+        # get_model is an async callable returning the LocalClassifier, created on first use
+        self.get_model = get_model
+        self.food_types = set(food_types)
+        self.max_per_class = max_per_class
+        self.dedup_similarity = dedup_similarity
+        self.coverage_confidence = coverage_confidence
+        self.report_path = report_path
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        self.task = None
+        self.weeks = {}
+        if report_path and os.path.exists(report_path):
+            with open(report_path) as f:
+                self.weeks = json.load(f)
+
+    def label_for(self, result: dict):
+        """(produce, condition) for a high-confidence Gemini result, otherwise None"""
+        condition = CONDITION_MAP.get(result.get("condition"))
+        item_name = (result.get("item_name") or "").strip()
+        if condition is None or result.get("food_type") not in self.food_types:
+            return None
+        if not item_name or item_name.lower() in GENERIC_ITEM_NAMES or item_name == result.get("food_type"):
+            return None
+        if result.get("reason", "No reason provided.") == "No reason provided.":
+            return None
+        return item_name.title(), condition
+
+    def submit(self, image: bytes, result: dict):
+        """Queue a Gemini result for distillation; never blocks the request"""
+        if not image or self.task is None:
+            return
+        label = self.label_for(result)
+        if label is None:
+            self._count("low_confidence")
+            return
+        try:
+            self.queue.put_nowait((image, label))
+        except asyncio.QueueFull:
+            self._count("dropped")
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        self._save_report()
+
+    async def _run(self):
+        processed = 0
+        while True:
+            image, label = await self.queue.get()
+            try:
+                model = await self.get_model()
+                # Counters are only touched here on the event loop, never in the thread
+                for field in await asyncio.to_thread(self._distill, model, image, label):
+                    self._count(field)
+            except Exception as e:
+                print(f"Distillation failed for {label}: {e}")
+            processed += 1
+            if processed % 20 == 0:
+                self._save_report()
+
+    def _canonical_produce(self, index, item_name):
+        """Match "Apple" to an existing "Apples" class (and vice versa) instead of splitting it"""
+        for produce in index.produce_names:
+            if produce.lower() in (item_name.lower(), item_name.lower() + "s") or item_name.lower() == produce.lower() + "s":
+                return produce
+        return item_name
+
+    def _distill(self, model, image, label):
+        """Add one image to its class unless it is full or a near-duplicate; returns counter names"""
+        from local_classifier import decode_image
+        index = model.index
+        produce, condition = self._canonical_produce(index, label[0]), label[1]
+        size = index.class_sizes().get(f"{produce}/{condition}", 0)
+        embedding = model.embed_fn(decode_image(image)[np.newaxis])[0]
+        # Coverage: would the local index have given Gemini's answer, confidently, without it?
+        events = ["gemini_results"] + (["covered_by_local"] if self._covered(index, embedding, produce, condition) else [])
+        if size >= self.max_per_class:
+            return events + ["skipped_class_full"]
+
+        example_id = "distilled-" + hashlib.sha256(image).hexdigest()[:16]
+        if example_id in index.examples:
+            return events + ["skipped_duplicate"]
+        if size > 0:
+            with index.lock:
+                row = index.labels.index((produce, condition))
+                existing = index.class_examples(row)
+            if len(existing) and float((existing @ embedding).max()) >= self.dedup_similarity:
+                return events + ["skipped_duplicate"]
+
+        index.add_example(produce, condition, embedding, example_id=example_id)
+        return events + ["added"] + (["new_classes"] if size == 0 else [])
+
+    def _covered(self, index, embedding, produce, condition):
+        if not index.labels:
+            return False
+        local = index.classify_embeddings(embedding[np.newaxis])[0]
+        confidence = local["produce_probability"] * local["condition_probability"]
+        return (local["produce"], local["condition"]) == (produce, condition) and confidence >= self.coverage_confidence
+
+    def _count(self, field, amount=1):
+        week = self.weeks.setdefault(week_key(date.today()), {})
+        week[field] = week.get(field, 0) + amount
+
+    def _save_report(self):
+        if self.report_path:
+            tmp_path = self.report_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.weeks, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.report_path)
+
+    def coverage_report(self, class_sizes: Optional[dict] = None):
+        """Per-week distillation counts and the share of Gemini results the local index covered"""
+        self._save_report()
+        weeks = []
+        for week in sorted(self.weeks):
+            counts = dict(self.weeks[week])
+            seen = counts.get("gemini_results", 0)
+            counts["week"] = week
+            counts["local_coverage"] = counts.get("covered_by_local", 0) / seen if seen else None
+            weeks.append(counts)
+        report = {"weeks": weeks, "pending": self.queue.qsize()}
+        if class_sizes is not None:
+            report["classes"] = len([n for n in class_sizes.values() if n > 0])
+            report["produce_types"] = len({name.split("/")[0] for name, n in class_sizes.items() if n > 0})
+        return report
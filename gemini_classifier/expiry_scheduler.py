@@ -0,0 +1,131 @@
+import heapq
+import itertools
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+# Expiry-ordered scheduling of stock.
+# Items sit in a min-heap keyed by (safe_until, urgency), so dispatch pops the item
+# closest to its deadline in O(log n), with "needs immediate distribution" ahead of
+# others on the same day. Expiry only ever looks at the top of the heap: items are
+# moved to waste as their safe_until passes, without scanning the rest. Removals and
+# updates are lazy (the stale heap entry is skipped when it surfaces) and the heap
+# is compacted once stale entries outnumber live ones.
+
+# Items without a safe_until sort after every dated item
+NO_DEADLINE = date.max.toordinal()
+
+URGENT_CONDITION = "needs immediate distribution"
+
+
+class ExpiryScheduler:
+    def __init__(self):
+        self.heap = []
+        # item_id -> (heap key, item); only the entry matching this key is live
+        self.items: Dict[str, tuple] = {}
+        self.waste: Dict[str, dict] = {}
+        self.seq = itertools.count()
+        self.ids = itertools.count(1)
+        self.stale = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def _key(self, item):
+        safe_until = item.get("safe_until")
+        deadline = datetime.strptime(safe_until, "%Y-%m-%d").date().toordinal() if safe_until else NO_DEADLINE
+        return (deadline, 0 if item.get("condition") == URGENT_CONDITION else 1, next(self.seq))
+
+    def add(self, item: dict, today: Optional[date] = None) -> str:
+        """Schedule an item (classification/best-before fields); re-adding an id updates it"""
+        item_id = str(item.get("item_id") or f"item-{next(self.ids)}")
+        item = dict(item, item_id=item_id)
+        if item.get("condition") == "waste":
+            self.remove(item_id)
+            self.waste[item_id] = item
+            return item_id
+        if item_id in self.items:
+            self.stale += 1
+        key = self._key(item)
+        self.items[item_id] = (key, item)
+        heapq.heappush(self.heap, (key, item_id))
+        self.expire(today)
+        return item_id
+
+    def remove(self, item_id: str) -> Optional[dict]:
+        """Take an item out of the schedule (handed out by other means); O(1)"""
+        entry = self.items.pop(item_id, None)
+        if entry is None:
+            return None
+        self.stale += 1
+        self._compact()
+        return entry[1]
+
+    def _compact(self):
+        if self.stale > len(self.items):
+            self.heap = [(key, item_id) for item_id, (key, _) in self.items.items()]
+            heapq.heapify(self.heap)
+            self.stale = 0
+
+    def _top(self):
+        """Discard stale entries at the top of the heap and return the live one, if any"""
+        while self.heap:
+            key, item_id = self.heap[0]
+            entry = self.items.get(item_id)
+            if entry is not None and entry[0] == key:
+                return key, item_id
+            heapq.heappop(self.heap)
+            self.stale -= 1
+        return None
+
+    def expire(self, today: Optional[date] = None) -> List[dict]:
+        """Move every item whose safe_until has passed to waste; touches only those items"""
+        today = (today or date.today()).toordinal()
+        expired = []
+        while True:
+            top = self._top()
+            if top is None or top[0][0] >= today:
+                break
+            heapq.heappop(self.heap)
+            _, item = self.items.pop(top[1])
+            item = dict(item, condition="waste")
+            self.waste[top[1]] = item
+            expired.append(item)
+        return expired
+
+    def peek(self, today: Optional[date] = None) -> Optional[dict]:
+        self.expire(today)
+        top = self._top()
+        return self.items[top[1]][1] if top else None
+
+    def pop(self, count: int = 1, today: Optional[date] = None) -> List[dict]:
+        """Dispatch the count most urgent items that are still safe"""
+        self.expire(today)
+        dispatched = []
+        while len(dispatched) < count:
+            top = self._top()
+            if top is None:
+                break
+            heapq.heappop(self.heap)
+            dispatched.append(self.items.pop(top[1])[1])
+        return dispatched
+
+    def next_deadline(self) -> Optional[date]:
+        """Last safe day of the most urgent dated item, i.e. when expire() next has work"""
+        top = self._top()
+        if top is None or top[0][0] == NO_DEADLINE:
+            return None
+        return date.fromordinal(top[0][0])
+
+    def collect_waste(self) -> List[dict]:
+        """Hand over (and forget) everything that has gone to waste so far"""
+        waste, self.waste = list(self.waste.values()), {}
+        return waste
+
+    def stats(self):
+        next_deadline = self.next_deadline()
+        return {
+            "scheduled": len(self.items),
+            "waste": len(self.waste),
+            "heap_entries": len(self.heap),
+            "next_deadline": next_deadline.isoformat() if next_deadline else None,
+        }
@@ -0,0 +1,205 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from typing import Dict, Optional
+
+# Per-client rate limiting and weighted fair queuing.
+# Every client (API key or donor ID) has a token bucket: it refills at the sustained
+# rate and holds at most the burst size, so short bursts pass while a bulk upload is
+# held to the sustained rate. A request can also be charged to a second bucket for
+# its network address, so clients that invent new ids cannot escape the limit.
+# Requests within the limit then wait for one of max_concurrent slots. Waiting requests are ordered by weighted fair queuing: each
+# gets a virtual finish tag of max(virtual clock, client's last tag) + cost / weight,
+# and a freed slot goes to the smallest tag. A client with a deep backlog therefore
+# only gets its weighted share of slots, and a new interactive request from anyone
+# else is served next rather than behind the whole backlog. Requests that are over
+# the rate, would overflow the client's queue or wait too long raise RateLimited with
+# the number of seconds to wait, for a 429 with Retry-After.
+
+
+class RateLimited(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+def display_id(client_id: str) -> str:
+    """Client id safe to show in stats: API keys are cut to a short prefix"""
+    return client_id[:8] + "..." if client_id.startswith("key:") else client_id
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, cost: float = 1.0) -> float:
+        """Take cost tokens; returns 0 on success, otherwise seconds until they are available"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate if self.rate > 0 else math.inf
+
+    def give_back(self, cost: float = 1.0):
+        """Return tokens taken for a request that was not admitted"""
+        self.tokens = min(self.burst, self.tokens + cost)
+
+
+class ClientState:
+    def __init__(self, weight: float, rate: float, burst: float):
+        self.weight = weight
+        self.bucket = TokenBucket(rate * weight, burst * weight)
+        self.last_tag = 0.0
+        self.queued = 0
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected_rate = 0
+        self.rejected_queue = 0
+        self.last_seen = time.monotonic()
+
+
+class FairScheduler:
+    def __init__(self, max_concurrent: int = 8, rate: float = 2.0, burst: float = 10.0,
+                 weights: Optional[Dict[str, float]] = None, max_queue_per_client: int = 20,
+                 max_wait_s: float = 30.0, idle_client_s: float = 600.0):
+        self.max_concurrent = max_concurrent
+        self.rate = rate
+        self.burst = burst
+        self.weights = weights or {}
+        self.max_queue_per_client = max_queue_per_client
+        self.max_wait_s = max_wait_s
+        self.idle_client_s = idle_client_s
+        self.clients: Dict[str, ClientState] = {}
+        self.in_flight = 0
+        self.virtual_time = 0.0
+        # (finish tag, seq, client id, future) of requests waiting for a slot
+        self.waiting = []
+        self.seq = itertools.count()
+        # Moving average of slot hold time, used to estimate Retry-After for a full queue
+        self.avg_service_s = 1.0
+
+    def _client(self, client_id):
+        state = self.clients.get(client_id)
+        if state is None:
+            if len(self.clients) > 10_000:
+                self._forget_idle_clients()
+            state = ClientState(self.weights.get(client_id, 1.0), self.rate, self.burst)
+            self.clients[client_id] = state
+        state.last_seen = time.monotonic()
+        return state
+
+    def _forget_idle_clients(self):
+        cutoff = time.monotonic() - self.idle_client_s
+        for client_id in [c for c, s in self.clients.items() if s.last_seen < cutoff and not s.queued and not s.in_flight]:
+            del self.clients[client_id]
+
+    def _estimated_wait(self, ahead: int) -> float:
+        return (ahead + 1) * self.avg_service_s / self.max_concurrent
+
+    async def acquire(self, client_id: str, cost: float = 1.0, address: Optional[str] = None):
+        """Wait for a slot for client_id, also charging address's bucket; raises RateLimited instead of waiting indefinitely"""
+        state = self._client(client_id)
+        address_state = self._client(address) if address and address != client_id else None
+        if address_state is not None:
+            wait = address_state.bucket.take(cost)
+            if wait > 0:
+                address_state.rejected_rate += 1
+                raise RateLimited(f"Rate limit exceeded for address '{address}'", wait)
+        wait = state.bucket.take(cost)
+        if wait > 0:
+            state.rejected_rate += 1
+            if address_state is not None:
+                address_state.bucket.give_back(cost)
+            raise RateLimited(f"Rate limit exceeded for client '{display_id(client_id)}'", wait)
+
+        # Drop requests at the head that gave up waiting
+        while self.waiting and self.waiting[0][3].cancelled():
+            heapq.heappop(self.waiting)
+        if self.in_flight < self.max_concurrent and not self.waiting:
+            self._start(state)
+            return
+        if state.queued >= self.max_queue_per_client:
+            state.rejected_queue += 1
+            # The tokens were not used; give them back
+            state.bucket.give_back(cost)
+            if address_state is not None:
+                address_state.bucket.give_back(cost)
+            raise RateLimited(f"Too many queued requests for client '{display_id(client_id)}'", self._estimated_wait(len(self.waiting)))
+
+        tag = max(self.virtual_time, state.last_tag) + cost / state.weight
+        state.last_tag = tag
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiting, (tag, next(self.seq), client_id, future))
+        state.queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.max_wait_s)
+        except asyncio.TimeoutError:
+            if not future.done():
+                future.cancel()
+                state.queued -= 1
+                state.rejected_queue += 1
+                raise RateLimited(f"Request from client '{display_id(client_id)}' waited too long for a slot",
+                                  self._estimated_wait(len(self.waiting)))
+        except asyncio.CancelledError:
+            # The client went away; if a slot was already handed over, pass it on
+            if future.done() and not future.cancelled():
+                self.release(client_id)
+            else:
+                future.cancel()
+                state.queued -= 1
+            raise
+
+    def _start(self, state):
+        self.in_flight += 1
+        state.in_flight += 1
+        state.admitted += 1
+
+    def release(self, client_id: str, held_s: Optional[float] = None):
+        """Free a slot and hand it to the waiting request with the smallest finish tag"""
+        state = self.clients[client_id]
+        self.in_flight -= 1
+        state.in_flight -= 1
+        if held_s is not None:
+            self.avg_service_s = 0.9 * self.avg_service_s + 0.1 * held_s
+        while self.waiting and self.in_flight < self.max_concurrent:
+            tag, _, client_id, future = heapq.heappop(self.waiting)
+            if future.cancelled():
+                continue
+            waiter = self.clients[client_id]
+            waiter.queued -= 1
+            self.virtual_time = tag
+            self._start(waiter)
+            future.set_result(None)
+
+    def stats(self, top: int = 20):
+        busiest = sorted(self.clients.items(), key=lambda item: item[1].admitted, reverse=True)[:top]
+        return {
+            "max_concurrent": self.max_concurrent,
+            "in_flight": self.in_flight,
+            "waiting": sum(1 for _, _, _, future in self.waiting if not future.cancelled()),
+            "rate_per_s": self.rate,
+            "burst": self.burst,
+            "avg_service_ms": self.avg_service_s * 1000,
+            "clients": {
+                display_id(client_id): {
+                    "weight": state.weight,
+                    "in_flight": state.in_flight,
+                    "queued": state.queued,
+                    "admitted": state.admitted,
+                    "rejected_rate": state.rejected_rate,
+                    "rejected_queue": state.rejected_queue,
+                }
+                for client_id, state in busiest
+            },
+        }
+
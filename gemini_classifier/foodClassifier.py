@@ -3,18 +3,34 @@
 import sys
 import os
 import base64
-from typing import List, Optional, Union
+import asyncio
+from typing import Dict, List, Optional, Union
 from io import BytesIO
 import uvicorn
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, WebSocket, WebSocketDisconnect, Header, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 from PIL import Image
 import google.generativeai as genai
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 import json
+import re
+import secrets
+import time
+from micro_batcher import MicroBatcher
+from hedging import Hedger
+from audit_log import AuditLog
+from fair_queue import FairScheduler, RateLimited
+from categories import INVENTORY_CATEGORIES, POTENTIAL_RESTRICTIONS
+from product_index import ProductIndex
+from distillation import Distiller
+from frame_dedup import FrameDeduplicator, dhash
+from impact_rollups import TIMEFRAMES, ImpactRollups
+from matching import DonationMatcher
+from expiry_scheduler import ExpiryScheduler
+from profiling import SamplingProfiler, LoopLagMonitor
 
 # Load environment variables from .env file
 load_dotenv()
@@ -25,6 +41,37 @@ if not api_key:
     raise ValueError("GOOGLE_API_KEY not found in .env file or environment variables.")
 genai.configure(api_key=api_key)
 
+# Optional hedging of Gemini calls: when a call runs past the tracked latency
+# percentile for its endpoint, a duplicate is sent and the first answer wins.
+# HEDGE_RATIOS caps the share of hedged requests per endpoint, e.g.
+# "classify=0.1,best_before=0.05"; HEDGE_MAX_EXTRA_IN_FLIGHT caps extra calls overall.
+upstream_hedger = Hedger(
+    enabled=os.getenv("HEDGE_ENABLED", "0") == "1",
+    hedge_percentile=float(os.getenv("HEDGE_PERCENTILE", "95")),
+    max_extra_in_flight=int(os.getenv("HEDGE_MAX_EXTRA_IN_FLIGHT", "4")),
+    default_ratio=float(os.getenv("HEDGE_RATIO", "0.1")),
+    ratios={
+        name.strip(): float(value)
+        for name, _, value in (item.partition("=") for item in os.getenv("HEDGE_RATIOS", "").split(",") if item)
+    },
+)
+
+# Append-only audit log of inputs, outputs and timings (food-safety trail and
+# retraining data). Requests only enqueue; a background task writes batched Arrow
+# IPC files to AUDIT_LOG_DIR, rotating every AUDIT_ROTATE_ROWS rows or hour.
+# At most AUDIT_MAX_PENDING_MB of images wait in memory for the writer.
+audit_log = None
+if os.getenv("AUDIT_LOG_ENABLED", "1") == "1":
+    audit_log = AuditLog(
+        os.getenv("AUDIT_LOG_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "audit_logs")),
+        rotate_rows=int(os.getenv("AUDIT_ROTATE_ROWS", "100000")),
+        max_pending_bytes=int(float(os.getenv("AUDIT_MAX_PENDING_MB", "256")) * 1024 * 1024),
+    )
+
+def audit(endpoint: str, inputs: dict, outputs=None, started: float = None, image: bytes = None, error: str = None):
+    if audit_log is not None:
+        audit_log.record(endpoint, inputs, outputs, started, image, error)
+
 # Define the FastAPI app
 app = FastAPI(
     title="Food Waste Classification API",
@@ -41,6 +88,75 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-client rate limits and fair queuing for the classification endpoints. Clients
+# are identified by the X-API-Key header if it is one of CLIENT_API_KEYS, else by
+# X-Donor-ID (or a donor_id query parameter) if it is one of CLIENT_DONOR_IDS, else
+# by their address, so unlisted or rotated ids cannot get around the limit. Trusted
+# ids are limited by their own bucket only, since many of them may sit behind one
+# NAT or proxy; RATE_LIMIT_PER_ADDRESS=1 charges their address's bucket as well. Each
+# bucket holds RATE_LIMIT_BURST requests refilled at RATE_LIMIT_RATE per second, and
+# requests share FAIR_MAX_CONCURRENT slots by weighted fair queuing. CLIENT_WEIGHTS
+# scales both, e.g. "donor:foodbank-1=4,key:abc123=2,ip:10.0.0.5=4". Overflow gets a
+# 429 with Retry-After.
+fair_scheduler = FairScheduler(
+    max_concurrent=int(os.getenv("FAIR_MAX_CONCURRENT", "8")),
+    rate=float(os.getenv("RATE_LIMIT_RATE", "2")),
+    burst=float(os.getenv("RATE_LIMIT_BURST", "20")),
+    weights={
+        name.strip(): float(value)
+        for name, _, value in (item.partition("=") for item in os.getenv("CLIENT_WEIGHTS", "").split(",") if item)
+    },
+    max_queue_per_client=int(os.getenv("FAIR_MAX_QUEUE", "20")),
+    max_wait_s=float(os.getenv("FAIR_MAX_WAIT_S", "30")),
+)
+fair_queue_enabled = os.getenv("FAIR_QUEUE_ENABLED", "1") == "1"
+trusted_api_keys = {key.strip() for key in os.getenv("CLIENT_API_KEYS", "").split(",") if key.strip()}
+trusted_donor_ids = {donor.strip() for donor in os.getenv("CLIENT_DONOR_IDS", "").split(",") if donor.strip()}
+charge_address = os.getenv("RATE_LIMIT_PER_ADDRESS", "0") == "1"
+
+def client_address(connection: Union[Request, WebSocket]) -> str:
+    return f"ip:{connection.client.host if connection.client else 'unknown'}"
+
+def client_identity(connection: Union[Request, WebSocket]) -> str:
+    api_key = connection.headers.get("x-api-key")
+    if api_key in trusted_api_keys:
+        return f"key:{api_key}"
+    donor_id = connection.headers.get("x-donor-id") or connection.query_params.get("donor_id")
+    if donor_id in trusted_donor_ids:
+        return f"donor:{donor_id}"
+    return client_address(connection)
+
+def charged_address(connection: Union[Request, WebSocket]) -> Optional[str]:
+    """Address bucket to charge besides the client's own, if RATE_LIMIT_PER_ADDRESS is on"""
+    return client_address(connection) if charge_address else None
+
+async def fair_share(request: Request):
+    """Dependency holding a fair-queue slot for the duration of the request"""
+    if not fair_queue_enabled:
+        yield
+        return
+    client_id = client_identity(request)
+    try:
+        await fair_scheduler.acquire(client_id, address=charged_address(request))
+    except RateLimited as e:
+        raise HTTPException(status_code=429, detail=f"{e}; retry after {e.retry_after_header()}s",
+                            headers={"Retry-After": e.retry_after_header()})
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        fair_scheduler.release(client_id, time.monotonic() - started)
+
+# Admin-only endpoints (local prototype edits, debugging) are disabled unless
+# ADMIN_TOKEN is set, and then require it in the X-Admin-Token header.
+admin_token = os.getenv("ADMIN_TOKEN")
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not admin_token:
+        raise HTTPException(status_code=404, detail="Admin endpoints are disabled; set ADMIN_TOKEN to enable them")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
 # Define response models
 class ClassificationResponse(BaseModel):
     condition: str
@@ -49,34 +165,6 @@ class ClassificationResponse(BaseModel):
     reason: str
     item_name: str
     
-# Define available inventory categories (adjust based on your actual inventory categories)
-INVENTORY_CATEGORIES = [
-    "Fruits & Vegetables",
-    "Dairy & Eggs",
-    "Meat & Poultry",
-    "Seafood",
-    "Bakery & Bread",
-    "Frozen Foods",
-    "Pantry Staples",
-    "Snacks & Confectionery",
-    "Beverages",
-    "Prepared Foods"
-]
-
-# Mapping of potential dietary restrictions/tags
-POTENTIAL_RESTRICTIONS = [
-    "Vegetarian",
-    "Vegan",
-    "Gluten-Free",
-    "Dairy-Free",
-    "Nut-Free",
-    "Soy-Free",
-    "Halal",
-    "Kosher",
-    "Low Sugar",
-    "Organic"
-]
-
 # Add new response model for best before analysis
 class BestBeforeResponse(BaseModel):
     is_safe: bool
@@ -110,14 +198,109 @@ IMPORTANT NOTES:
 - When in doubt, throw it out
 """
 
+# Food condition labels the Gemini prompts choose from
+CONDITION_LABELS = ["safe for consumption", "needs immediate distribution", "waste"]
+
+def normalize_classification(condition: str, food_type: str, item_name: str):
+    """Snap a parsed condition and food type onto the known labels and fill in a missing item name"""
+    # Validate food type against inventory categories
+    if food_type not in INVENTORY_CATEGORIES and food_type != "Unknown":
+        # Find closest match
+        for category in INVENTORY_CATEGORIES:
+            if category.lower() in food_type.lower() or food_type.lower() in category.lower():
+                food_type = category
+                break
+
+    # Validate condition against condition labels
+    if condition not in CONDITION_LABELS and condition != "Unknown":
+        for label in CONDITION_LABELS:
+            if label in condition.lower():
+                condition = label
+                break
+
+    # Ensure item_name is never empty
+    if not item_name or item_name == "Unknown Item":
+        # Try to derive from food_type
+        if "Fruits" in food_type:
+            item_name = "Fruit"
+        elif "Vegetables" in food_type:
+            item_name = "Vegetable"
+        elif "Dairy" in food_type:
+            item_name = "Dairy Product"
+        elif "Meat" in food_type:
+            item_name = "Meat Product"
+        elif "Bakery" in food_type:
+            item_name = "Baked Good"
+        else:
+            item_name = food_type
+
+    return condition, food_type, item_name
+
+def parse_classification_response(response_text: str):
+    """Parse the line-based classify_image response into a normalized result dict"""
+    # Parse the response
+    item_name = "Unknown Item"
+    condition = "Unknown"
+    food_type = "Unknown"
+    restrictions = ["None identified"]
+    reason = "No reason provided."
+
+    try:
+        lines = response_text.split('\n')
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+
+            print(f"Processing line: {line}")  # Debug output
+
+            if line.lower().startswith("itemname:"):
+                item_name = line.split(":", 1)[1].strip()
+                print(f"Found item name: {item_name}")  # Debug output
+            elif line.lower().startswith("condition:"):
+                condition = line.split(":", 1)[1].strip()
+            elif line.lower().startswith("foodtype:"):
+                food_type = line.split(":", 1)[1].strip()
+            elif line.lower().startswith("restrictions:"):
+                restrictions_text = line.split(":", 1)[1].strip()
+                if "none" not in restrictions_text.lower():
+                    restrictions = [r.strip() for r in restrictions_text.split(",")]
+            elif line.lower().startswith("reason:"):
+                reason = line.split(":", 1)[1].strip()
+
+        # If no item name was found in the standard format, try to extract it from the response text
+        if item_name == "Unknown Item":
+            common_foods = ["banana", "apple", "orange", "tomato", "potato", "carrot", 
+                            "bread", "milk", "cheese", "yogurt", "chicken", "beef",
+                            "rice", "pasta", "cereal", "beans"]
+
+            response_lower = response_text.lower()
+            for food in common_foods:
+                if food in response_lower:
+                    item_name = food.capitalize()
+                    print(f"Extracted item name from text: {item_name}")  # Debug output
+                    break
+    except Exception as parse_error:
+        print(f"Warning: Could not parse model response: {parse_error}")
+        print(f"Raw model response:\n{response_text}")
+
+    condition, food_type, item_name = normalize_classification(condition, food_type, item_name)
+
+    # Prepare the final result
+    result = {
+        "condition": condition,
+        "food_type": food_type,
+        "restrictions": restrictions,
+        "reason": reason,
+        "item_name": item_name
+    }
+    return result
+
 async def classify_image(image: Image.Image):
     """Classify a food image using Gemini API"""
     # Initialize the Gemini model
     model = genai.GenerativeModel('gemini-1.5-flash')
     
-    # Define classification labels 
-    condition_labels = ["safe for consumption", "needs immediate distribution", "waste"]
-    
     # Prompt for Gemini with both condition classification and food type - make food item identification more prominent
     prompt = f"""
 Analyze the food item in the image and provide the following classifications:
@@ -152,97 +335,14 @@ DO NOT describe what type of food it is in the reason.
 
     try:
         # Generate content using the image and prompt
-        response = model.generate_content([prompt, image], stream=False)
-        response.resolve()
+        response = await upstream_hedger.call(
+            "classify", lambda: model.generate_content_async([prompt, image], stream=False)
+        )
         response_text = response.text.strip()
         
         print(f"Raw Gemini response:\n{response_text}")  # Debug output
         
-        # Parse the response
-        item_name = "Unknown Item"
-        condition = "Unknown"
-        food_type = "Unknown"
-        restrictions = ["None identified"]
-        reason = "No reason provided."
-        
-        try:
-            lines = response_text.split('\n')
-            for line in lines:
-                line = line.strip()
-                if not line:
-                    continue
-                    
-                print(f"Processing line: {line}")  # Debug output
-                
-                if line.lower().startswith("itemname:"):
-                    item_name = line.split(":", 1)[1].strip()
-                    print(f"Found item name: {item_name}")  # Debug output
-                elif line.lower().startswith("condition:"):
-                    condition = line.split(":", 1)[1].strip()
-                elif line.lower().startswith("foodtype:"):
-                    food_type = line.split(":", 1)[1].strip()
-                elif line.lower().startswith("restrictions:"):
-                    restrictions_text = line.split(":", 1)[1].strip()
-                    if "none" not in restrictions_text.lower():
-                        restrictions = [r.strip() for r in restrictions_text.split(",")]
-                elif line.lower().startswith("reason:"):
-                    reason = line.split(":", 1)[1].strip()
-                    
-            # If no item name was found in the standard format, try to extract it from the response text
-            if item_name == "Unknown Item":
-                common_foods = ["banana", "apple", "orange", "tomato", "potato", "carrot", 
-                                "bread", "milk", "cheese", "yogurt", "chicken", "beef",
-                                "rice", "pasta", "cereal", "beans"]
-                
-                response_lower = response_text.lower()
-                for food in common_foods:
-                    if food in response_lower:
-                        item_name = food.capitalize()
-                        print(f"Extracted item name from text: {item_name}")  # Debug output
-                        break
-        except Exception as parse_error:
-            print(f"Warning: Could not parse model response: {parse_error}")
-            print(f"Raw model response:\n{response_text}")
-            
-        # Validate food type against inventory categories
-        if food_type not in INVENTORY_CATEGORIES and food_type != "Unknown":
-            # Find closest match
-            for category in INVENTORY_CATEGORIES:
-                if category.lower() in food_type.lower() or food_type.lower() in category.lower():
-                    food_type = category
-                    break
-            
-        # Validate condition against condition labels
-        if condition not in condition_labels and condition != "Unknown":
-            for label in condition_labels:
-                if label in condition.lower():
-                    condition = label
-                    break
-        
-        # Ensure item_name is never empty
-        if not item_name or item_name == "Unknown Item":
-            # Try to derive from food_type
-            if "Fruits" in food_type:
-                item_name = "Fruit"
-            elif "Vegetables" in food_type:
-                item_name = "Vegetable"
-            elif "Dairy" in food_type:
-                item_name = "Dairy Product"
-            elif "Meat" in food_type:
-                item_name = "Meat Product"
-            elif "Bakery" in food_type:
-                item_name = "Baked Good"
-            else:
-                item_name = food_type
-                
-        # Prepare the final result
-        result = {
-            "condition": condition,
-            "food_type": food_type,
-            "restrictions": restrictions,
-            "reason": reason,
-            "item_name": item_name
-        }
+        result = parse_classification_response(response_text)
         
         print(f"Final classification result: {result}")  # Debug output
         return result
@@ -251,7 +351,7 @@ DO NOT describe what type of food it is in the reason.
         print(f"Error during Gemini API call: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
 
-@app.post("/classify/", response_model=ClassificationResponse)
+@app.post("/classify/", response_model=ClassificationResponse, dependencies=[Depends(fair_share)])
 async def classify_food_image(file: UploadFile = File(...)):
     """
     Classify a food image to determine:
@@ -260,6 +360,8 @@ async def classify_food_image(file: UploadFile = File(...)):
     - Dietary restrictions
     - Reason for condition classification
     """
+    started = time.perf_counter()
+    contents = None
     try:
         # Read and validate the image
         contents = await file.read()
@@ -273,16 +375,21 @@ async def classify_food_image(file: UploadFile = File(...)):
             
         # Classify the image
         result = await classify_image(img)
+        audit("classify", {"filename": file.filename}, result, started, contents)
+        distill(contents, result)
         return result
         
     except Exception as e:
+        audit("classify", {"filename": file.filename}, None, started, contents, str(getattr(e, "detail", e)))
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
-@app.post("/classify-base64/", response_model=ClassificationResponse)
+@app.post("/classify-base64/", response_model=ClassificationResponse, dependencies=[Depends(fair_share)])
 async def classify_food_image_base64(image_data: str = Form(...)):
     """
     Classify a food image provided as base64 string
     """
+    started = time.perf_counter()
+    image_bytes = None
     try:
         # Decode base64 image
         try:
@@ -297,16 +404,43 @@ async def classify_food_image_base64(image_data: str = Form(...)):
             
         # Classify the image
         result = await classify_image(img)
+        audit("classify-base64", {}, result, started, image_bytes)
+        distill(image_bytes, result)
         return result
         
     except Exception as e:
+        audit("classify-base64", {}, None, started, image_bytes, str(getattr(e, "detail", e)))
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
+@app.on_event("startup")
+async def start_audit_log():
+    if audit_log is not None:
+        audit_log.start()
+
+@app.on_event("shutdown")
+async def flush_audit_log():
+    """Write out queued audit records and complete the current file"""
+    if audit_log is not None:
+        await audit_log.stop()
+
+@app.get("/audit-log/stats")
+def audit_log_stats():
+    return audit_log.stats() if audit_log is not None else {"enabled": False}
+
 @app.get("/health")
 def health_check():
     """Health check endpoint"""
     return {"status": "healthy"}
 
+@app.get("/fair-queue/stats")
+def fair_queue_stats():
+    return {"enabled": fair_queue_enabled, **fair_scheduler.stats()}
+
+@app.get("/hedging/stats")
+def hedging_stats():
+    """Hedge rate and served vs. unhedged p99 latency per upstream endpoint"""
+    return upstream_hedger.stats()
+
 @app.get("/categories")
 def get_categories():
     """Get all available food categories and restriction tags"""
@@ -315,24 +449,42 @@ def get_categories():
         "restriction_tags": POTENTIAL_RESTRICTIONS
     }
 
-# Add new function to analyze best before dates
-async def analyze_best_before(food_type: str, best_before_date: str, item_name: str = None, is_opened: bool = False, storage_method: str = "refrigerated"):
-    """Analyze whether food is safe to consume based on its best before date"""
-    
-    # Initialize the Gemini model
-    model = genai.GenerativeModel('gemini-1.5-flash')
-    
-    # Parse the best before date
+def days_since_best_before(best_before_date: str, current_date: datetime = None):
+    """Parse a YYYY-MM-DD best before date; returns (current date, days elapsed since it)"""
     try:
         best_before = datetime.strptime(best_before_date, "%Y-%m-%d")
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date format. Please use YYYY-MM-DD")
     
     # Get the current date
-    current_date = datetime.now()
+    current_date = current_date or datetime.now()
     
     # Calculate days elapsed since best before date
-    days_elapsed = (current_date - best_before).days
+    return current_date, (current_date - best_before).days
+
+def extract_json(response_text: str, json_pattern: str = r'({.*})'):
+    """Parse a JSON model response, falling back to the first JSON-looking span in the text"""
+    try:
+        # Try to parse the JSON directly
+        return json.loads(response_text)
+    except json.JSONDecodeError:
+        # If direct parsing fails, try to extract JSON from text
+        match = re.search(json_pattern, response_text, re.DOTALL)
+        if match:
+            try:
+                return json.loads(match.group(1))
+            except json.JSONDecodeError:
+                pass
+        raise HTTPException(status_code=500, detail="Failed to parse JSON from AI response")
+
+# Add new function to analyze best before dates
+async def analyze_best_before(food_type: str, best_before_date: str, item_name: str = None, is_opened: bool = False, storage_method: str = "refrigerated"):
+    """Analyze whether food is safe to consume based on its best before date"""
+    
+    # Initialize the Gemini model
+    model = genai.GenerativeModel('gemini-1.5-flash')
+    
+    current_date, days_elapsed = days_since_best_before(best_before_date)
     
     # Use item_name if provided, otherwise use food_type as a more generic descriptor
     food_descriptor = item_name if item_name else food_type
@@ -372,37 +524,22 @@ Your JSON response MUST BE VALID and should contain ONLY the JSON object with no
 
     try:
         # Generate analysis using the prompt
-        response = model.generate_content(prompt, stream=False)
-        response.resolve()
+        response = await upstream_hedger.call(
+            "best_before", lambda: model.generate_content_async(prompt, stream=False)
+        )
         response_text = response.text.strip()
         
         print(f"Raw Gemini response for best before analysis:\n{response_text}")
         
         # Extract the JSON response - handle potential formatting issues
-        try:
-            # Try to parse the JSON directly
-            result = json.loads(response_text)
-        except json.JSONDecodeError:
-            # If direct parsing fails, try to extract JSON from text
-            json_pattern = r'({.*})'
-            import re
-            match = re.search(json_pattern, response_text, re.DOTALL)
-            if match:
-                try:
-                    result = json.loads(match.group(1))
-                except json.JSONDecodeError:
-                    raise HTTPException(status_code=500, detail="Failed to parse JSON from AI response")
-            else:
-                raise HTTPException(status_code=500, detail="Failed to parse JSON from AI response")
-        
-        return result
+        return extract_json(response_text)
     
     except Exception as e:
         print(f"Error during best before analysis: {e}")
         raise HTTPException(status_code=500, detail=f"Error analyzing best before date: {str(e)}")
 
 # Add new API endpoint for best before analysis
-@app.post("/analyze-best-before/", response_model=BestBeforeResponse)
+@app.post("/analyze-best-before/", response_model=BestBeforeResponse, dependencies=[Depends(fair_share)])
 async def analyze_food_best_before(
     food_type: str = Form(...),
     best_before_date: str = Form(...), 
@@ -423,14 +560,22 @@ async def analyze_food_best_before(
     Returns:
     - BestBeforeResponse: Analysis of food safety
     """
-    result = await analyze_best_before(
-        food_type=food_type,
-        best_before_date=best_before_date,
-        item_name=item_name,
-        is_opened=is_opened,
-        storage_method=storage_method
-    )
+    started = time.perf_counter()
+    inputs = {"food_type": food_type, "best_before_date": best_before_date, "item_name": item_name,
+              "is_opened": is_opened, "storage_method": storage_method}
+    try:
+        result = await analyze_best_before(
+            food_type=food_type,
+            best_before_date=best_before_date,
+            item_name=item_name,
+            is_opened=is_opened,
+            storage_method=storage_method
+        )
+    except HTTPException as e:
+        audit("analyze-best-before", inputs, None, started, error=str(e.detail))
+        raise
     
+    audit("analyze-best-before", inputs, result, started)
     return result
 
 # Add a new combined response model
@@ -446,7 +591,7 @@ class CombinedAnalysisResponse(BaseModel):
     recommendation: str
 
 # Add new endpoint for combined analysis
-@app.post("/combined-analysis/", response_model=CombinedAnalysisResponse)
+@app.post("/combined-analysis/", response_model=CombinedAnalysisResponse, dependencies=[Depends(fair_share)])
 async def combined_food_analysis(
     file: UploadFile = File(None),
     image_data: str = Form(None),
@@ -460,6 +605,11 @@ async def combined_food_analysis(
     Perform both image classification and best-before date analysis, with the best-before analysis
     overriding the condition if the food is deemed unsafe.
     """
+    started = time.perf_counter()
+    inputs = {"food_type": food_type, "best_before_date": best_before_date, "item_name": item_name,
+              "is_opened": is_opened, "storage_method": storage_method}
+    image_bytes = None
+
     # First, classify the image
     classification_result = None
     
@@ -468,6 +618,7 @@ async def combined_food_analysis(
             # Process uploaded file
             contents = await file.read()
             if contents:
+                image_bytes = contents
                 img = Image.open(BytesIO(contents))
                 classification_result = await classify_image(img)
         elif image_data and "data:" in image_data:
@@ -478,12 +629,15 @@ async def combined_food_analysis(
             image_bytes = base64.b64decode(image_data)
             img = Image.open(BytesIO(image_bytes))
             classification_result = await classify_image(img)
+        if classification_result is not None:
+            distill(image_bytes, classification_result)
     except Exception as e:
         print(f"Warning: Unable to process image: {e}")
     
     # If we couldn't get classification or food_type wasn't in the result, use the provided one
     if classification_result is None:
         if food_type is None:
+            audit("combined-analysis", inputs, None, started, image_bytes, "Either an image or food_type must be provided")
             raise HTTPException(status_code=400, detail="Either an image or food_type must be provided")
         
         # Create a minimal classification result
@@ -539,8 +693,669 @@ async def combined_food_analysis(
     }
     
     print(f"Combined analysis result: {result}")
+    audit("combined-analysis", inputs, result, started, image_bytes)
     return result
 
+# Barcode fast path. Packaged goods are looked up in a local SQLite product index
+# (imported with `python product_index.py import <products.csv>`) instead of a
+# Gemini vision call; a best before date, if given, goes straight into analysis.
+product_index = None
+
+def get_product_index():
+    global product_index
+    if product_index is None:
+        product_index = ProductIndex()
+    return product_index
+
+class BarcodeLookupResponse(BaseModel):
+    barcode: str
+    item_name: str
+    brand: Optional[str] = None
+    food_type: str
+    restrictions: List[str]
+    best_before: Optional[BestBeforeResponse] = None
+
+@app.post("/lookup-barcode/", response_model=BarcodeLookupResponse)
+async def lookup_barcode(
+    barcode: str = Form(...),
+    best_before_date: str = Form(None),
+    is_opened: bool = Form(False),
+    storage_method: str = Form("refrigerated")
+):
+    """Look up a packaged product by barcode, optionally analyzing its best before date"""
+    product = get_product_index().lookup(barcode)
+    if product is None:
+        raise HTTPException(status_code=404, detail=f"Barcode '{barcode}' not found in the product index")
+
+    if best_before_date:
+        product["best_before"] = await analyze_best_before(
+            food_type=product["food_type"],
+            best_before_date=best_before_date,
+            item_name=product["item_name"],
+            is_opened=is_opened,
+            storage_method=storage_method
+        )
+    return product
+
+@app.get("/search-products/")
+async def search_products(q: str, limit: int = 10):
+    """Full-text search of the product index by name or brand"""
+    return get_product_index().search(q, min(max(limit, 1), 100))
+
+# Local prototype classifier (ML_Classifier) behind a micro-batching queue.
+# Concurrent requests are grouped into one batched forward pass; tune the
+# latency/throughput trade-off with LOCAL_MAX_BATCH_SIZE and LOCAL_MAX_WAIT_MS.
+LOCAL_MAX_BATCH_SIZE = int(os.getenv("LOCAL_MAX_BATCH_SIZE", "16"))
+LOCAL_MAX_WAIT_MS = float(os.getenv("LOCAL_MAX_WAIT_MS", "5"))
+# LOCAL_WORKERS > 0 runs inference in that many worker processes (shared-memory
+# image handoff) instead of a thread in the API process; thread counts per worker
+# default to an even split of the cores.
+LOCAL_WORKERS = int(os.getenv("LOCAL_WORKERS", "0"))
+LOCAL_INTRA_OP_THREADS = int(os.getenv("LOCAL_INTRA_OP_THREADS", "0")) or None
+LOCAL_INTER_OP_THREADS = int(os.getenv("LOCAL_INTER_OP_THREADS", "1"))
+# How long worker processes may take to load and warm up their model
+LOCAL_WORKER_READY_TIMEOUT_S = float(os.getenv("LOCAL_WORKER_READY_TIMEOUT_S", "300"))
+
+class LocalClassificationResponse(BaseModel):
+    produce: str
+    produce_probability: float
+    condition: str
+    condition_probability: float
+    conditions: Dict[str, float]
+
+local_batcher = None
+local_pool = None
+local_model = None
+local_batcher_lock = asyncio.Lock()
+
+async def get_local_batcher():
+    """Create the local classifier and its batching queue on first use"""
+    global local_batcher, local_pool, local_model
+    async with local_batcher_lock:
+        if local_batcher is None:
+            # Imported lazily so the Gemini endpoints don't require TensorFlow
+            from local_classifier import LocalClassifier
+            embed_fn = None
+            if LOCAL_WORKERS > 0:
+                from inference_pool import InferencePool
+                local_pool = InferencePool(
+                    num_workers=LOCAL_WORKERS,
+                    max_batch_size=LOCAL_MAX_BATCH_SIZE,
+                    intra_op_threads=LOCAL_INTRA_OP_THREADS,
+                    inter_op_threads=LOCAL_INTER_OP_THREADS,
+                )
+                try:
+                    await asyncio.to_thread(local_pool.wait_until_ready, LOCAL_WORKER_READY_TIMEOUT_S)
+                except Exception:
+                    # Leave nothing half-started behind; the next request tries again
+                    await asyncio.to_thread(local_pool.close)
+                    local_pool = None
+                    raise
+                embed_fn = local_pool.embed_batch
+            local_model = await asyncio.to_thread(LocalClassifier, embed_fn=embed_fn)
+            local_batcher = MicroBatcher(
+                local_model.classify_batch,
+                max_batch_size=LOCAL_MAX_BATCH_SIZE,
+                max_wait_ms=LOCAL_MAX_WAIT_MS,
+                max_in_flight=max(1, LOCAL_WORKERS),
+            )
+    return local_batcher
+
+# LOCAL_WARMUP=1 loads, compiles and warms up the local classifier at startup, so
+# the first real request is as fast as the hundredth
+LOCAL_WARMUP = os.getenv("LOCAL_WARMUP", "0") == "1"
+
+@app.on_event("startup")
+async def warmup_local_classifier():
+    if LOCAL_WARMUP:
+        await get_local_batcher()
+
+@app.on_event("shutdown")
+async def shutdown_local_classifier():
+    """Stop the batching queue and release the worker processes and shared memory"""
+    if local_batcher is not None:
+        await local_batcher.stop()
+    if local_pool is not None:
+        await asyncio.to_thread(local_pool.close)
+
+@app.post("/classify-local/", response_model=LocalClassificationResponse, dependencies=[Depends(fair_share)])
+async def classify_food_image_local(file: UploadFile = File(...)):
+    """
+    Classify produce type and condition with the local prototype classifier
+    (no Gemini call). Requests are micro-batched with other concurrent requests.
+    """
+    contents = await file.read()
+    if not contents:
+        raise HTTPException(status_code=400, detail="Empty file")
+
+    from local_classifier import decode_image
+    try:
+        img_array = await asyncio.to_thread(decode_image, contents)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image file: {str(e)}")
+
+    try:
+        batcher = await get_local_batcher()
+        return await batcher.submit(img_array)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+@app.get("/classify-local/stats")
+def local_classifier_stats():
+    """Batch-size distribution and queueing delay of the local classifier"""
+    if local_batcher is None:
+        return {"status": "not loaded"}
+    stats = local_batcher.stats()
+    # Cold (first call) vs warm latency per batch size, measured during warmup
+    stats["warmup"] = local_pool.warmup_reports if local_pool is not None else local_model.warmup_report
+    # Model registry: resident weights, evictions, reloads and process memory
+    if local_pool is not None:
+        stats["registry"] = {str(pid): registry for pid, registry in local_pool.registry_stats.items()}
+    else:
+        from local_classifier import serving_registry
+        stats["registry"] = serving_registry.stats()
+    return stats
+
+# Online prototype updates for the local classifier. Each add/remove adjusts one
+# running class centroid in O(1) and is journaled next to the saved index, so a
+# staff correction takes effect on the very next request and survives restarts.
+# Changing prototypes is admin-only (X-Admin-Token), since a bad example poisons
+# every later local classification.
+LOCAL_CONDITIONS = ["good", "risky", "expired"]
+
+@app.post("/local-prototypes/", dependencies=[Depends(require_admin)])
+async def add_local_prototype(
+    file: UploadFile = File(...),
+    produce: str = Form(...),
+    condition: str = Form(...),
+    example_id: str = Form(None)
+):
+    """Add a labeled example image to the local classifier's prototypes"""
+    if condition not in LOCAL_CONDITIONS:
+        raise HTTPException(status_code=400, detail=f"Condition must be one of {LOCAL_CONDITIONS}")
+    contents = await file.read()
+    if not contents:
+        raise HTTPException(status_code=400, detail="Empty file")
+
+    from local_classifier import decode_image
+    try:
+        img_array = await asyncio.to_thread(decode_image, contents)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image file: {str(e)}")
+
+    await get_local_batcher()
+    try:
+        example_id = await asyncio.to_thread(local_model.add_example, img_array, produce, condition, example_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {
+        "example_id": example_id,
+        "produce": produce,
+        "condition": condition,
+        "class_size": local_model.index.class_sizes()[f"{produce}/{condition}"],
+    }
+
+@app.delete("/local-prototypes/{example_id:path}", dependencies=[Depends(require_admin)])
+async def remove_local_prototype(example_id: str):
+    """Remove a previously added example from the local classifier's prototypes"""
+    await get_local_batcher()
+    try:
+        produce, condition = local_model.remove_example(example_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Example '{example_id}' not found")
+    return {"removed": example_id, "produce": produce, "condition": condition}
+
+@app.get("/local-prototypes/")
+async def list_local_prototypes():
+    """Number of examples behind each (produce, condition) prototype"""
+    await get_local_batcher()
+    return local_model.index.class_sizes()
+
+# Distillation: high-confidence Gemini verdicts on produce become local prototypes
+# (grouped by item name and condition, de-duplicated, capped per class), so the
+# local classifier gradually covers what Gemini sees. DISTILL_ENABLED=1 turns it on;
+# the weekly coverage report is kept in DISTILL_REPORT_PATH.
+async def get_local_model():
+    await get_local_batcher()
+    return local_model
+
+distiller = None
+if os.getenv("DISTILL_ENABLED", "0") == "1":
+    distiller = Distiller(
+        get_local_model,
+        food_types=os.getenv("DISTILL_FOOD_TYPES", "Fruits & Vegetables").split(";"),
+        max_per_class=int(os.getenv("DISTILL_MAX_PER_CLASS", "50")),
+        dedup_similarity=float(os.getenv("DISTILL_DEDUP_SIMILARITY", "0.97")),
+        coverage_confidence=float(os.getenv("DISTILL_COVERAGE_CONFIDENCE", "0.8")),
+        report_path=os.getenv("DISTILL_REPORT_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "distillation_report.json")),
+    )
+
+def distill(image: bytes, result: dict):
+    if distiller is not None:
+        distiller.submit(image, result)
+
+@app.on_event("startup")
+async def start_distiller():
+    if distiller is not None:
+        distiller.start()
+
+@app.on_event("shutdown")
+async def stop_distiller():
+    if distiller is not None:
+        distiller.stop()
+
+@app.get("/local-prototypes/coverage")
+async def local_prototype_coverage():
+    """Weekly distillation counts and how much of Gemini's traffic the local index covers"""
+    if distiller is None:
+        return {"enabled": False}
+    return distiller.coverage_report(local_model.index.class_sizes() if local_model is not None else None)
+
+# Multi-item mode: one photo of a whole crate, one Gemini call, one classification
+# and bounding box per item. With local_crops=true the boxes are also cropped and
+# sent through the local classifier together, so the crops share a batched pass.
+class ItemBox(BaseModel):
+    x_min: int
+    y_min: int
+    x_max: int
+    y_max: int
+
+class DetectedItem(ClassificationResponse):
+    box: Optional[ItemBox] = None
+    local: Optional[LocalClassificationResponse] = None
+
+class MultiItemResponse(BaseModel):
+    count: int
+    items: List[DetectedItem]
+
+MAX_ITEMS_PER_IMAGE = int(os.getenv("MAX_ITEMS_PER_IMAGE", "30"))
+
+def box_to_pixels(box_2d, width: int, height: int):
+    """Convert Gemini's [ymin, xmin, ymax, xmax] on a 0-1000 grid to a clamped pixel box"""
+    try:
+        y_min, x_min, y_max, x_max = [min(max(float(v), 0.0), 1000.0) for v in box_2d]
+    except (TypeError, ValueError):
+        return None
+    if x_max <= x_min or y_max <= y_min:
+        return None
+    # A thin box on a small image can round to zero pixels; keep at least one so it can be cropped
+    left = min(round(x_min * width / 1000), width - 1)
+    top = min(round(y_min * height / 1000), height - 1)
+    return {
+        "x_min": left, "y_min": top,
+        "x_max": max(round(x_max * width / 1000), left + 1), "y_max": max(round(y_max * height / 1000), top + 1),
+    }
+
+async def classify_image_items(image: Image.Image):
+    """Classify every food item in an image using a single Gemini call"""
+    model = genai.GenerativeModel('gemini-1.5-flash')
+
+    prompt = f"""
+Find EVERY separate food item in the image (for example each fruit, loaf or package in a crate) and classify each one.
+
+For each item provide:
+- item_name: the exact specific food item (e.g., "Banana", "Apple", "Bread", "Milk")
+- condition: one of {', '.join([f'"{c}"' for c in CONDITION_LABELS])}
+- food_type: exactly one of {', '.join([f'"{cat}"' for cat in INVENTORY_CATEGORIES])}
+- restrictions: applicable dietary restrictions from {', '.join([f'"{r}"' for r in POTENTIAL_RESTRICTIONS])}, only if you can definitively determine them, otherwise an empty list
+- reason: brief explanation of the condition classification ONLY (signs of freshness or spoilage)
+- box_2d: bounding box of the item as [ymin, xmin, ymax, xmax] normalized to 0-1000
+
+List at most {MAX_ITEMS_PER_IMAGE} items. Format your response as a valid JSON array of objects with exactly these keys.
+Your JSON response MUST BE VALID and should contain ONLY the JSON array with no other text.
+"""
+
+    try:
+        response = await upstream_hedger.call(
+            "classify_multi", lambda: model.generate_content_async([prompt, image], stream=False)
+        )
+        response_text = response.text.strip()
+        print(f"Raw Gemini multi-item response:\n{response_text}")
+    except Exception as e:
+        print(f"Error during Gemini API call: {e}")
+        raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
+
+    # Strip markdown fences or surrounding text if needed
+    raw_items = extract_json(response_text, json_pattern=r'(\[.*\])')
+    if isinstance(raw_items, dict):
+        raw_items = raw_items.get("items", [raw_items])
+    if not isinstance(raw_items, list):
+        raise HTTPException(status_code=502, detail="Failed to parse items from AI response: expected a JSON array")
+
+    width, height = image.size
+    items = []
+    for raw in raw_items[:MAX_ITEMS_PER_IMAGE]:
+        if not isinstance(raw, dict):
+            continue
+        condition, food_type, item_name = normalize_classification(
+            str(raw.get("condition") or "Unknown"), str(raw.get("food_type") or "Unknown"), str(raw.get("item_name") or "")
+        )
+        restrictions = [r for r in raw.get("restrictions") or [] if r in POTENTIAL_RESTRICTIONS]
+        items.append({
+            "condition": condition,
+            "food_type": food_type,
+            "restrictions": restrictions or ["None identified"],
+            "reason": str(raw.get("reason") or "No reason provided."),
+            "item_name": item_name,
+            "box": box_to_pixels(raw.get("box_2d"), width, height),
+        })
+    return items
+
+@app.post("/classify-multi/", response_model=MultiItemResponse, dependencies=[Depends(fair_share)])
+async def classify_food_image_multi(file: UploadFile = File(...), local_crops: bool = Form(False)):
+    """
+    Classify every food item in one photo (e.g. a whole crate) with a single upstream call.
+    With local_crops, each item's crop is also classified by the local model in one batch.
+    """
+    contents = await file.read()
+    if not contents:
+        raise HTTPException(status_code=400, detail="Empty file")
+    try:
+        img = Image.open(BytesIO(contents))
+        img.load()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image file: {str(e)}")
+
+    items = await classify_image_items(img)
+
+    if local_crops:
+        boxed = [item for item in items if item["box"]]
+        if boxed:
+            from local_classifier import crop_to_array
+            try:
+                rgb = img.convert("RGB")
+                crops = [crop_to_array(rgb, item["box"]) for item in boxed]
+                batcher = await get_local_batcher()
+                # Submitted together, the crops land in the same micro-batch
+                results = await asyncio.gather(*(batcher.submit(crop) for crop in crops))
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+            for item, result in zip(boxed, results):
+                item["local"] = result
+
+    return {"count": len(items), "items": items}
+
+# Streaming intake for a camera over the sorting line. Frames arrive as binary
+# WebSocket messages; near-duplicates of recently classified frames (perceptual
+# hash) and frames taken while the scene is still moving are dropped, and while a
+# classification is running only the newest changed frame is kept. Upstream and
+# local-model load therefore follow the rate of new items, not the frame rate.
+STREAM_HASH_THRESHOLD = int(os.getenv("STREAM_HASH_THRESHOLD", "4"))
+
+@app.websocket("/ws/classify-stream")
+async def classify_frame_stream(websocket: WebSocket, mode: str = "gemini"):
+    """
+    Classify a stream of encoded frames (one binary message each). Results are sent
+    back on the same connection as JSON: {"frame", "result" | "error", "latency_ms", "stats"};
+    a frame over the client's rate limit gets {"frame", "error", "retry_after", "stats"}.
+    mode is "gemini" (classify_image) or "local" (local prototype classifier).
+    """
+    await websocket.accept()
+    if mode not in ("gemini", "local"):
+        await websocket.close(code=1008, reason="mode must be 'gemini' or 'local'")
+        return
+
+    dedup = FrameDeduplicator(threshold=STREAM_HASH_THRESHOLD)
+    client_id, address = client_identity(websocket), charged_address(websocket)
+    pending = {}
+    frame_ready = asyncio.Event()
+
+    async def classify_pending():
+        while True:
+            await frame_ready.wait()
+            frame_ready.clear()
+            frame_index, data, frame_hash = pending.pop("frame")
+            # A frame of the same scene may have been classified while this one waited
+            if not dedup.still_new(frame_hash):
+                continue
+            start = datetime.now()
+            message = {"frame": frame_index}
+            # Each classified frame takes a fair-queue slot like any other request
+            if fair_queue_enabled:
+                try:
+                    await fair_scheduler.acquire(client_id, address=address)
+                except RateLimited as e:
+                    await websocket.send_json({"frame": frame_index, "error": f"{e}; retry after {e.retry_after_header()}s",
+                                               "retry_after": e.retry_after, "stats": dedup.stats()})
+                    # Not marked classified: once the limit allows, the newest frame of the
+                    # scene (this one unless a newer one arrived meanwhile) is tried again
+                    await asyncio.sleep(e.retry_after)
+                    pending.setdefault("frame", (frame_index, data, frame_hash))
+                    frame_ready.set()
+                    continue
+            held = time.monotonic()
+            try:
+                if mode == "local":
+                    from local_classifier import decode_image
+                    img_array = await asyncio.to_thread(decode_image, data)
+                    message["result"] = await (await get_local_batcher()).submit(img_array)
+                else:
+                    message["result"] = await classify_image(Image.open(BytesIO(data)))
+            except Exception as e:
+                message["error"] = str(getattr(e, "detail", e))
+            finally:
+                if fair_queue_enabled:
+                    fair_scheduler.release(client_id, time.monotonic() - held)
+            if "result" in message:
+                dedup.mark_classified(frame_hash)
+            message["latency_ms"] = (datetime.now() - start).total_seconds() * 1000
+            message["stats"] = dedup.stats()
+            await websocket.send_json(message)
+
+    worker = asyncio.create_task(classify_pending())
+    frame_index = 0
+    try:
+        while True:
+            data = await websocket.receive_bytes()
+            frame_index += 1
+            try:
+                frame_hash = await asyncio.to_thread(dhash, data)
+            except Exception as e:
+                await websocket.send_json({"frame": frame_index, "error": f"Invalid image frame: {str(e)}"})
+                continue
+            if dedup.check(frame_hash) == "new":
+                # Latest changed frame wins if the previous one is still waiting
+                pending["frame"] = (frame_index, data, frame_hash)
+                frame_ready.set()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        worker.cancel()
+
+# Impact analytics for the dashboard. Donations are folded into per-donor and
+# organisation-wide day/week/month/year rollups as they arrive, so reads are O(1)
+# no matter how much history exists. They are kept in SQLite at IMPACT_DB_PATH, shared
+# by all workers and kept across restarts. Conversion factors are configurable.
+impact_rollups = ImpactRollups(
+    co2_kg_per_lb=float(os.getenv("IMPACT_CO2_KG_PER_LB", "0.18")),
+    lbs_per_meal=float(os.getenv("IMPACT_LBS_PER_MEAL", "1.2")),
+    default_item_lbs=float(os.getenv("IMPACT_DEFAULT_ITEM_LBS", "1.0")),
+)
+
+@app.get("/analytics/impact")
+async def impact_summary(timeframe: str = "month", donor_id: str = None):
+    """Food saved, CO2 offset and people served for the current period"""
+    if timeframe not in TIMEFRAMES:
+        raise HTTPException(status_code=400, detail=f"timeframe must be one of {TIMEFRAMES}")
+    return impact_rollups.summary(timeframe, donor_id)
+
+@app.get("/analytics/impact/series")
+async def impact_series(timeframe: str = "month", periods: int = 12, donor_id: str = None):
+    """Per-period totals for charts, oldest first"""
+    if timeframe not in TIMEFRAMES:
+        raise HTTPException(status_code=400, detail=f"timeframe must be one of {TIMEFRAMES}")
+    if not 0 < periods <= 366:
+        raise HTTPException(status_code=400, detail="periods must be between 1 and 366")
+    return impact_rollups.series(timeframe, periods, donor_id)
+
+# Donation-to-shelter matching. Analyzed donations (the combined-analysis output plus
+# a pickup location) go into an in-memory spatial grid index; shelters query it by
+# location, radius, categories and dietary restrictions and get nearby, soon-to-expire
+# donations first. Everything runs on the event loop, so no locking is needed.
+donation_matcher = DonationMatcher(POTENTIAL_RESTRICTIONS, cell_km=float(os.getenv("MATCH_CELL_KM", "5")))
+
+class DonationRequest(CombinedAnalysisResponse):
+    donation_id: Optional[str] = None
+    donor_id: Optional[str] = None
+    weight_lbs: Optional[float] = None
+    latitude: float
+    longitude: float
+
+class ShelterMatchRequest(BaseModel):
+    latitude: float
+    longitude: float
+    radius_km: float = 10.0
+    categories: Optional[List[str]] = None
+    restrictions: List[str] = []
+    limit: int = 10
+
+@app.post("/donations/")
+async def add_donation(donation: DonationRequest):
+    """Make an analyzed donation available for matching"""
+    if donation.food_type not in INVENTORY_CATEGORIES:
+        raise HTTPException(status_code=400, detail=f"food_type must be one of {INVENTORY_CATEGORIES}")
+    try:
+        donation_id = donation_matcher.add(donation.dict())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    impact_rollups.record(donation.dict(), donation_id=donation_id)
+    return {"donation_id": donation_id, "open_donations": len(donation_matcher)}
+
+DONATION_REMOVAL_REASONS = ["claimed", "picked_up", "cancelled"]
+
+@app.delete("/donations/{donation_id}")
+async def remove_donation(donation_id: str, reason: str = "claimed"):
+    """Withdraw a donation once it has been claimed or picked up, or because it was cancelled"""
+    if reason not in DONATION_REMOVAL_REASONS:
+        raise HTTPException(status_code=400, detail=f"reason must be one of {DONATION_REMOVAL_REASONS}")
+    try:
+        donation_matcher.remove(donation_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Donation '{donation_id}' not found")
+    # Rescued food stays in the impact totals; only a cancelled donation is taken out again
+    if reason == "cancelled":
+        impact_rollups.remove(donation_id)
+    return {"removed": donation_id, "reason": reason, "open_donations": len(donation_matcher)}
+
+@app.post("/match/")
+async def match_donations(request: ShelterMatchRequest):
+    """Ranked open donations for a shelter's location, categories and restrictions"""
+    if request.radius_km <= 0 or request.limit <= 0:
+        raise HTTPException(status_code=400, detail="radius_km and limit must be positive")
+    unknown = [c for c in request.categories or [] if c not in INVENTORY_CATEGORIES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown categories {unknown}. Choose from {INVENTORY_CATEGORIES}")
+    matches = donation_matcher.match(
+        request.latitude, request.longitude, request.radius_km,
+        request.categories, request.restrictions, request.limit,
+    )
+    return {"matches": matches, "open_donations": len(donation_matcher)}
+
+# Expiry-ordered stock. Classified items are kept in a heap by safe_until and urgency
+# so dispatch always gets the most urgent safe item in O(log n); items whose
+# safe_until has passed are moved to waste, touching only those items. Deadlines are
+# whole days, so a background task also sweeps once right after every midnight.
+expiry_scheduler = ExpiryScheduler()
+
+class InventoryItemRequest(BaseModel):
+    item_id: Optional[str] = None
+    item_name: str
+    food_type: str
+    condition: str
+    safe_until: Union[str, None] = None
+    restrictions: List[str] = []
+
+async def expire_inventory_at_midnight():
+    while True:
+        now = datetime.now()
+        next_midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+        await asyncio.sleep((next_midnight - now).total_seconds() + 1)
+        expired = expiry_scheduler.expire()
+        if expired:
+            print(f"Moved {len(expired)} expired item(s) to waste")
+
+@app.on_event("startup")
+async def start_expiry_sweeper():
+    asyncio.create_task(expire_inventory_at_midnight())
+
+@app.post("/inventory/")
+async def schedule_inventory_item(item: InventoryItemRequest):
+    """Add (or update) a classified item in the expiry schedule"""
+    if item.safe_until:
+        try:
+            datetime.strptime(item.safe_until, "%Y-%m-%d")
+        except ValueError:
+            raise HTTPException(status_code=400, detail="safe_until must be in YYYY-MM-DD format")
+    item_id = expiry_scheduler.add(item.dict())
+    return {"item_id": item_id, "scheduled": item_id in expiry_scheduler.items}
+
+@app.post("/inventory/dispatch")
+async def dispatch_inventory(count: int = 1):
+    """Pop the most urgent items that are still safe to distribute"""
+    if count <= 0:
+        raise HTTPException(status_code=400, detail="count must be positive")
+    return {"items": expiry_scheduler.pop(count), **expiry_scheduler.stats()}
+
+@app.get("/inventory/next")
+async def next_inventory_item():
+    """Most urgent item without removing it"""
+    return {"item": expiry_scheduler.peek(), **expiry_scheduler.stats()}
+
+@app.delete("/inventory/{item_id}")
+async def remove_inventory_item(item_id: str):
+    if expiry_scheduler.remove(item_id) is None:
+        raise HTTPException(status_code=404, detail=f"Item '{item_id}' not scheduled")
+    return {"removed": item_id}
+
+@app.post("/inventory/waste/collect")
+async def collect_inventory_waste():
+    """Hand over everything that has expired since the last collection"""
+    expiry_scheduler.expire()
+    return {"items": expiry_scheduler.collect_waste()}
+
+# Admin-only debugging: an on-demand sampling profiler returning collapsed stacks
+# (load into speedscope or flamegraph.pl) and an event-loop lag monitor that records
+# the stack of any callback blocking the loop for longer than LOOP_LAG_THRESHOLD_MS.
+# Like the other admin endpoints they need ADMIN_TOKEN (see require_admin).
+sampling_profiler = SamplingProfiler()
+loop_lag_monitor = LoopLagMonitor(
+    threshold_ms=float(os.getenv("LOOP_LAG_THRESHOLD_MS", "100")),
+    interval_ms=float(os.getenv("LOOP_LAG_INTERVAL_MS", "50")),
+)
+
+@app.on_event("startup")
+async def start_loop_lag_monitor():
+    if os.getenv("LOOP_LAG_MONITOR", "1") == "1":
+        loop_lag_monitor.start()
+
+@app.on_event("shutdown")
+async def stop_loop_lag_monitor():
+    loop_lag_monitor.stop()
+
+@app.get("/debug/profile", dependencies=[Depends(require_admin)])
+async def profile_service(seconds: float = 10.0, interval_ms: float = 5.0, include_idle: bool = False):
+    """Sample all threads for the given time and download the collapsed stacks"""
+    if not 0 < seconds <= 120:
+        raise HTTPException(status_code=400, detail="seconds must be between 0 and 120")
+    if interval_ms < 1:
+        raise HTTPException(status_code=400, detail="interval_ms must be at least 1")
+    try:
+        # The sampler runs in a worker thread, so the loop keeps serving the traffic being profiled
+        collapsed, stats = await asyncio.to_thread(sampling_profiler.profile, seconds, interval_ms / 1000, include_idle)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    filename = f"profile-{datetime.now().strftime('%Y%m%dT%H%M%S')}.collapsed"
+    return PlainTextResponse(collapsed, headers={
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "X-Profile-Samples": str(stats["samples"]),
+        "X-Profile-Interval-Ms": f"{stats['effective_interval_ms'] or 0:.2f}",
+    })
+
+@app.get("/debug/loop-lag", dependencies=[Depends(require_admin)])
+async def loop_lag_stats():
+    """Event-loop lag percentiles and the stacks of recent blocking callbacks"""
+    return loop_lag_monitor.stats()
+
 # For running the app directly
 if __name__ == "__main__":
     # Make sure required libraries are installed before running
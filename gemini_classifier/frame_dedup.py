@@ -0,0 +1,84 @@
+from collections import deque
+from io import BytesIO
+
+from PIL import Image
+
+# Near-duplicate frame detection for camera streams.
+# Each frame is reduced to a 64-bit difference hash (dHash): grayscale, 9x8 pixels,
+# one bit per horizontally adjacent pair (set when the left one is brighter). Frames
+# of the same scene differ in only a few bits despite sensor noise and JPEG
+# artefacts, so comparing Hamming distances tells a new item from the same item seen
+# again. A frame is classified only once the scene has settled (it matches the
+# previous frame) and it differs from every recently classified frame. A hash only
+# counts as classified once mark_classified() is called after a successful
+# classification, so a failed or skipped attempt is retried with a later frame.
+
+HASH_SIZE = 8
+# Brightness step (0-255) a neighbour pair must exceed to set its bit; without it flat
+# areas such as an empty belt flip bits on sensor noise alone
+DEAD_BAND = 4
+
+
+def dhash(data: bytes) -> int:
+    """64-bit difference hash of an encoded image"""
+    img = Image.open(BytesIO(data))
+    # DCT-scaled JPEG decode: far cheaper than decoding the full frame
+    img.draft("L", (HASH_SIZE * 8, HASH_SIZE * 8))
+    pixels = img.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR).tobytes()
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1] + DEAD_BAND)
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class FrameDeduplicator:
+    def __init__(self, threshold: int = 4, history: int = 8, require_stable: bool = True):
+        self.threshold = threshold
+        self.require_stable = require_stable
+        self.recent = deque(maxlen=history)
+        self.previous = None
+        self.frames = 0
+        self.skipped_duplicate = 0
+        self.skipped_unstable = 0
+        self.accepted = 0
+        self.classified = 0
+
+    def check(self, frame_hash: int) -> str:
+        """Return "new" for a frame worth classifying, otherwise why it is skipped"""
+        self.frames += 1
+        previous, self.previous = self.previous, frame_hash
+        if self.require_stable and previous is not None and hamming(previous, frame_hash) > self.threshold:
+            # Still moving (item entering or leaving); wait for the scene to settle
+            self.skipped_unstable += 1
+            return "unstable"
+        if not self.still_new(frame_hash):
+            return "duplicate"
+        self.accepted += 1
+        return "new"
+
+    def still_new(self, frame_hash: int) -> bool:
+        """False (counted as a duplicate) if a matching frame has been classified meanwhile"""
+        if any(hamming(seen, frame_hash) <= self.threshold for seen in self.recent):
+            self.skipped_duplicate += 1
+            return False
+        return True
+
+    def mark_classified(self, frame_hash: int):
+        """Record a successfully classified frame; later frames of the same scene are duplicates"""
+        self.recent.append(frame_hash)
+        self.classified += 1
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "accepted": self.accepted,
+            "classified": self.classified,
+            "skipped_duplicate": self.skipped_duplicate,
+            "skipped_unstable": self.skipped_unstable,
+        }
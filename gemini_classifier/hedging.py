@@ -0,0 +1,164 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional
+
+# Hedged upstream requests.
+# If an upstream call has not answered by the tracked latency percentile for its
+# endpoint, a duplicate is sent and whichever answers first is used. Hedges are
+# limited by a global budget of extra in-flight calls and a per-endpoint ratio of
+# hedged requests. The slower call is left to finish (it is already paid for), which
+# also gives the latency the request would have had without hedging, so the tail
+# improvement can be reported directly. If the caller itself is cancelled, every
+# call still in flight for it is cancelled too.
+
+LATENCY_WINDOW = 500
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+class EndpointStats:
+    def __init__(self):
+        # Latency of single upstream calls; sets the hedge delay
+        self.upstream = deque(maxlen=LATENCY_WINDOW)
+        # Latency of the primary call alone vs. what the caller actually waited
+        self.primary = deque(maxlen=LATENCY_WINDOW)
+        self.served = deque(maxlen=LATENCY_WINDOW)
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.skipped_budget = 0
+        self.delay = None
+        self.samples_since_delay = 0
+
+
+class Hedger:
+    def __init__(self, enabled: bool = False, hedge_percentile: float = 95.0, max_extra_in_flight: int = 4,
+                 default_ratio: float = 0.1, ratios: Optional[Dict[str, float]] = None, min_samples: int = 20):
+        self.enabled = enabled
+        self.hedge_percentile = hedge_percentile
+        self.max_extra_in_flight = max_extra_in_flight
+        self.default_ratio = default_ratio
+        self.ratios = ratios or {}
+        self.min_samples = min_samples
+        self.extra_in_flight = 0
+        self.endpoints: Dict[str, EndpointStats] = {}
+        # Strong references to calls that lost the race but are still running
+        self.background = set()
+
+    def _stats(self, endpoint):
+        if endpoint not in self.endpoints:
+            self.endpoints[endpoint] = EndpointStats()
+        return self.endpoints[endpoint]
+
+    def _delay(self, stats):
+        """Hedge delay in seconds, re-derived from the window every few samples"""
+        if len(stats.upstream) < self.min_samples:
+            return None
+        if stats.delay is None or stats.samples_since_delay >= 10:
+            stats.delay = percentile(stats.upstream, self.hedge_percentile)
+            stats.samples_since_delay = 0
+        return stats.delay
+
+    def _may_hedge(self, endpoint, stats):
+        if self.extra_in_flight >= self.max_extra_in_flight:
+            stats.skipped_budget += 1
+            return False
+        return stats.hedged < self.ratios.get(endpoint, self.default_ratio) * stats.requests
+
+    async def _timed(self, stats, make_call):
+        start = time.perf_counter()
+        result = await make_call()
+        stats.upstream.append(time.perf_counter() - start)
+        stats.samples_since_delay += 1
+        return result
+
+    async def call(self, endpoint: str, make_call: Callable[[], Awaitable]):
+        """Await make_call(), hedging it with a second make_call() if it runs past the delay"""
+        stats = self._stats(endpoint)
+        stats.requests += 1
+        start = time.perf_counter()
+        primary = asyncio.ensure_future(self._timed(stats, make_call))
+        delay = self._delay(stats) if self.enabled else None
+
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait({primary}, timeout=delay)
+                if not done and self._may_hedge(endpoint, stats):
+                    return await self._race(stats, start, primary, make_call)
+            result = await primary
+        except asyncio.CancelledError:
+            # The caller gave up (client went away); nothing will use the answer
+            primary.cancel()
+            raise
+        elapsed = time.perf_counter() - start
+        stats.primary.append(elapsed)
+        stats.served.append(elapsed)
+        return result
+
+    async def _race(self, stats, start, primary, make_call):
+        stats.hedged += 1
+        self.extra_in_flight += 1
+        hedge = asyncio.ensure_future(self._timed(stats, make_call))
+        hedge.add_done_callback(self._release)
+        primary.add_done_callback(
+            lambda task: task.cancelled() or task.exception() or stats.primary.append(time.perf_counter() - start)
+        )
+
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            try:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            except asyncio.CancelledError:
+                for task in pending:
+                    task.cancel()
+                raise
+            for task in done:
+                if task.exception() is None:
+                    stats.served.append(time.perf_counter() - start)
+                    if task is hedge:
+                        stats.hedge_wins += 1
+                    for loser in pending:
+                        self.background.add(loser)
+                        loser.add_done_callback(self._forget)
+                    return task.result()
+                error = error or task.exception()
+        raise error
+
+    def _release(self, task):
+        self.extra_in_flight -= 1
+
+    def _forget(self, task):
+        self.background.discard(task)
+        # Retrieve the exception so a failed loser is not reported as never retrieved
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self):
+        report = {"enabled": self.enabled, "percentile": self.hedge_percentile,
+                  "extra_in_flight": self.extra_in_flight, "max_extra_in_flight": self.max_extra_in_flight,
+                  "endpoints": {}}
+        for endpoint, stats in self.endpoints.items():
+            p99_primary = percentile(stats.primary, 99)
+            p99_served = percentile(stats.served, 99)
+            report["endpoints"][endpoint] = {
+                "requests": stats.requests,
+                "hedged": stats.hedged,
+                "hedge_rate": stats.hedged / stats.requests if stats.requests else 0.0,
+                "hedge_ratio_limit": self.ratios.get(endpoint, self.default_ratio),
+                "hedge_wins": stats.hedge_wins,
+                "skipped_budget": stats.skipped_budget,
+                "hedge_delay_ms": stats.delay * 1000 if stats.delay is not None else None,
+                "p50_ms": percentile(stats.served, 50) * 1000 if stats.served else None,
+                "p99_ms": p99_served * 1000 if p99_served is not None else None,
+                "p99_without_hedging_ms": p99_primary * 1000 if p99_primary is not None else None,
+                "p99_improvement_ms": (p99_primary - p99_served) * 1000
+                if p99_primary is not None and p99_served is not None else None,
+            }
+        return report
@@ -0,0 +1,181 @@
+import os
+import sqlite3
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+# Pre-aggregated impact analytics.
+# Every classified donation is folded into running totals for the organisation and
+# for its donor, in day/week/month/year buckets, as it arrives. A dashboard read is
+# then a single primary-key lookup, independent of how much history exists. Pounds
+# are converted to CO2 offset and meals (people served) with fixed factors.
+# Totals live in SQLite (IMPACT_DB_PATH), so they survive restarts and every uvicorn
+# worker updates and reads the same ones. Donations are also kept by id until the
+# month they were recorded in has closed: re-posting one meanwhile replaces its
+# contribution, and cancelling it subtracts it again.
+
+IMPACT_DB_PATH = os.getenv("IMPACT_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "impact.db"))
+TIMEFRAMES = ["day", "week", "month", "year"]
+# Scope of the organisation-wide buckets; donor scopes are "donor:<id>", so no donor_id can collide
+ALL_DONORS = "all"
+
+
+def donor_scope(donor_id: Optional[str]) -> str:
+    return f"donor:{donor_id}" if donor_id else ALL_DONORS
+
+
+def period_key(timeframe: str, day: date) -> str:
+    if timeframe == "day":
+        return day.isoformat()
+    if timeframe == "week":
+        year, week, _ = day.isocalendar()
+        return f"{year}-W{week:02d}"
+    if timeframe == "month":
+        return f"{day.year}-{day.month:02d}"
+    if timeframe == "year":
+        return str(day.year)
+    raise ValueError(f"Unknown timeframe '{timeframe}'. Choose from {TIMEFRAMES}")
+
+
+def previous_period(timeframe: str, day: date) -> date:
+    """A day inside the period before the one containing day"""
+    if timeframe == "day":
+        return day - timedelta(days=1)
+    if timeframe == "week":
+        return day - timedelta(days=7)
+    if timeframe == "month":
+        return day.replace(day=1) - timedelta(days=1)
+    return day.replace(month=1, day=1) - timedelta(days=1)
+
+
+class ImpactRollups:
+    def __init__(self, path: str = IMPACT_DB_PATH, co2_kg_per_lb: float = 0.18, lbs_per_meal: float = 1.2,
+                 default_item_lbs: float = 1.0):
+        self.co2_kg_per_lb = co2_kg_per_lb
+        self.lbs_per_meal = lbs_per_meal
+        self.default_item_lbs = default_item_lbs
+        # Updates happen on the event loop; other workers share the file through SQLite's locking
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        if path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS impact_buckets (
+                scope TEXT, timeframe TEXT, period TEXT,
+                donations INTEGER NOT NULL, pounds REAL NOT NULL, co2_kg REAL NOT NULL, meals REAL NOT NULL,
+                PRIMARY KEY (scope, timeframe, period)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS impact_counts (
+                scope TEXT, timeframe TEXT, period TEXT, kind TEXT, name TEXT, count INTEGER NOT NULL,
+                PRIMARY KEY (scope, timeframe, period, kind, name)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS impact_donations (
+                donation_id TEXT PRIMARY KEY, donor_id TEXT, day TEXT NOT NULL, pounds REAL NOT NULL,
+                co2_kg REAL NOT NULL, meals REAL NOT NULL, food_type TEXT NOT NULL, condition TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS impact_donations_day ON impact_donations (day);
+        """)
+        self.pruned_month = None
+
+    def record(self, donation: dict, when: Optional[datetime] = None, donation_id: Optional[str] = None):
+        """Fold one classified donation into every bucket it belongs to; an already recorded id is replaced"""
+        donation_id = donation_id or donation.get("donation_id")
+        with self.conn:
+            previous = self._pop(donation_id) if donation_id is not None else None
+            # An update keeps counting in the period the donation was first recorded in
+            day = when.date() if when else date.fromisoformat(previous["day"]) if previous else date.today()
+            pounds = float(donation.get("weight_lbs") or self.default_item_lbs)
+            entry = {
+                "donation_id": donation_id,
+                "donor_id": str(donation["donor_id"]) if donation.get("donor_id") else None,
+                "day": day.isoformat(),
+                "pounds": pounds,
+                "co2_kg": pounds * self.co2_kg_per_lb,
+                "meals": pounds / self.lbs_per_meal,
+                "food_type": donation.get("food_type") or "Unknown",
+                "condition": donation.get("condition") or "Unknown",
+            }
+            self._apply(entry, 1)
+            if donation_id is not None:
+                self.conn.execute(
+                    "INSERT INTO impact_donations VALUES (:donation_id, :donor_id, :day, :pounds, :co2_kg, :meals, "
+                    ":food_type, :condition)", entry)
+            self._prune()
+
+    def remove(self, donation_id: str) -> bool:
+        """Subtract a recorded donation (e.g. a cancelled one); False if it is unknown or its month has closed"""
+        with self.conn:
+            return self._pop(donation_id) is not None
+
+    def _pop(self, donation_id):
+        entry = self.conn.execute("SELECT * FROM impact_donations WHERE donation_id = ?", (donation_id,)).fetchone()
+        if entry is None:
+            return None
+        self.conn.execute("DELETE FROM impact_donations WHERE donation_id = ?", (donation_id,))
+        self._apply(entry, -1)
+        return entry
+
+    def _apply(self, entry, sign):
+        day = date.fromisoformat(entry["day"])
+        scopes = [ALL_DONORS] + ([donor_scope(entry["donor_id"])] if entry["donor_id"] else [])
+        for scope in scopes:
+            for timeframe in TIMEFRAMES:
+                key = (scope, timeframe, period_key(timeframe, day))
+                self.conn.execute(
+                    "INSERT INTO impact_buckets VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (scope, timeframe, period) DO UPDATE SET donations = donations + excluded.donations, "
+                    "pounds = pounds + excluded.pounds, co2_kg = co2_kg + excluded.co2_kg, meals = meals + excluded.meals",
+                    key + (sign, sign * entry["pounds"], sign * entry["co2_kg"], sign * entry["meals"]),
+                )
+                for kind in ("food_type", "condition"):
+                    self.conn.execute(
+                        "INSERT INTO impact_counts VALUES (?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT (scope, timeframe, period, kind, name) DO UPDATE SET count = count + excluded.count",
+                        key + (kind, entry[kind], sign),
+                    )
+                if sign < 0:
+                    self.conn.execute("DELETE FROM impact_counts WHERE scope = ? AND timeframe = ? AND period = ? "
+                                      "AND count <= 0", key)
+                    self.conn.execute("DELETE FROM impact_buckets WHERE scope = ? AND timeframe = ? AND period = ? "
+                                      "AND donations <= 0", key)
+
+    def _prune(self):
+        # Donations of closed months can no longer be replaced or cancelled; forget their ids
+        month_start = date.today().replace(day=1).isoformat()
+        if self.pruned_month != month_start:
+            self.conn.execute("DELETE FROM impact_donations WHERE day < ?", (month_start,))
+            self.pruned_month = month_start
+
+    def summary(self, timeframe: str = "month", donor_id: Optional[str] = None, day: Optional[date] = None):
+        """Totals for the period containing day (default today); O(1)"""
+        day = day or date.today()
+        key = (donor_scope(donor_id), timeframe, period_key(timeframe, day))
+        bucket = self.conn.execute(
+            "SELECT * FROM impact_buckets WHERE scope = ? AND timeframe = ? AND period = ?", key).fetchone()
+        counts = {"food_type": {}, "condition": {}}
+        for row in self.conn.execute(
+                "SELECT kind, name, count FROM impact_counts WHERE scope = ? AND timeframe = ? AND period = ?", key):
+            counts[row["kind"]][row["name"]] = row["count"]
+        return {
+            "timeframe": timeframe,
+            "period": key[2],
+            "donor_id": donor_id,
+            "donations": bucket["donations"] if bucket else 0,
+            "food_saved_lbs": round(bucket["pounds"], 2) if bucket else 0.0,
+            "co2_offset_kg": round(bucket["co2_kg"], 2) if bucket else 0.0,
+            "people_served": round(bucket["meals"]) if bucket else 0,
+            "by_category": counts["food_type"],
+            "by_condition": counts["condition"],
+        }
+
+    def series(self, timeframe: str = "month", periods: int = 12, donor_id: Optional[str] = None,
+               day: Optional[date] = None):
+        """The last `periods` summaries, oldest first; cost depends only on `periods`"""
+        day = day or date.today()
+        summaries = []
+        for _ in range(periods):
+            summaries.append(self.summary(timeframe, donor_id, day))
+            day = previous_period(timeframe, day)
+        return summaries[::-1]
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,226 @@
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+
+from local_classifier import LOCAL_BACKBONE, load_serving_backbone, serving_registry
+
+# Pool of worker processes computing backbone embeddings for the local classifier.
+# The API process decodes images and copies the uint8 tensors into shared-memory
+# slots; only (task id, slot, count) goes through the task queue, never the pixels.
+# Scoring against the prototype index stays in the API process, so online prototype
+# updates take effect immediately without having to reach every worker.
+# Each worker pins its TensorFlow intra-op and inter-op thread counts so that
+# N workers share the cores instead of oversubscribing them.
+# Workers report each task they take, so when a worker process dies the tasks it
+# held fail instead of leaving their callers (and shared-memory slots) waiting.
+
+IMAGE_SHAPE = (224, 224, 3)
+
+
+def _worker_main(task_queue, result_queue, slot_names, slot_shape, intra_op_threads, inter_op_threads,
+                 backbone_name):
+    # Thread limits must be in place before TensorFlow initialises its thread pools
+    os.environ["OMP_NUM_THREADS"] = str(intra_op_threads)
+    os.environ["TF_NUM_INTRAOP_THREADS"] = str(intra_op_threads)
+    os.environ["TF_NUM_INTEROP_THREADS"] = str(inter_op_threads)
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+
+    from backbones import embed_batch
+    # Compiled and warmed up here (through the worker's model registry), before the worker reports ready
+    feature_extractor, _ = load_serving_backbone(backbone_name)
+
+    # Attach to the parent's blocks; the parent alone unlinks them in close()
+    slots = [SharedMemory(name=name) for name in slot_names]
+    views = [np.ndarray(slot_shape, dtype=np.uint8, buffer=shm.buf) for shm in slots]
+    result_queue.put(("ready", (os.getpid(), getattr(feature_extractor, "warmup_report", None)), None))
+    result_queue.put(("registry", (os.getpid(), serving_registry.stats()), None))
+    stats_sent = time.monotonic()
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        task_id, slot, count = task
+        result_queue.put(("taken", (task_id, os.getpid()), None))
+        try:
+            feature_extractor, preprocess_input = load_serving_backbone(backbone_name)
+            embeddings = embed_batch(feature_extractor, preprocess_input, views[slot][:count])
+            result_queue.put((task_id, embeddings, None))
+        except Exception as e:
+            result_queue.put((task_id, None, f"{type(e).__name__}: {e}"))
+        # Registry stats (loads, evictions, memory) for /classify-local/stats, at most every few seconds
+        if time.monotonic() - stats_sent >= 5.0:
+            result_queue.put(("registry", (os.getpid(), serving_registry.stats()), None))
+            stats_sent = time.monotonic()
+
+    del views
+    for shm in slots:
+        shm.close()
+
+
+class InferencePool:
+    def __init__(self, num_workers=None, max_batch_size=16, intra_op_threads=None, inter_op_threads=1,
+                 backbone_name=LOCAL_BACKBONE):
+        cpu_count = os.cpu_count() or 1
+        self.num_workers = num_workers or cpu_count
+        self.max_batch_size = max_batch_size
+        self.intra_op_threads = intra_op_threads or max(1, cpu_count // self.num_workers)
+        self.inter_op_threads = inter_op_threads
+
+        # Two slots per worker lets the API fill the next batch while one is being processed
+        self.slot_shape = (max_batch_size,) + IMAGE_SHAPE
+        slot_bytes = int(np.prod(self.slot_shape))
+        self.slots = [SharedMemory(create=True, size=slot_bytes) for _ in range(2 * self.num_workers)]
+        self.views = [np.ndarray(self.slot_shape, dtype=np.uint8, buffer=shm.buf) for shm in self.slots]
+        self.free_slots = queue.Queue()
+        for slot in range(len(self.slots)):
+            self.free_slots.put(slot)
+
+        context = multiprocessing.get_context("spawn")
+        self.task_queue = context.Queue()
+        self.result_queue = context.Queue()
+        self.workers = [
+            context.Process(
+                target=_worker_main,
+                args=(self.task_queue, self.result_queue, [shm.name for shm in self.slots], self.slot_shape,
+                      self.intra_op_threads, self.inter_op_threads, backbone_name),
+                daemon=True,
+            )
+            for _ in range(self.num_workers)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+        self.pending = {}
+        # task id -> pid of the worker processing it
+        self.taken = {}
+        self.dead_workers = set()
+        self.pending_lock = threading.Lock()
+        self.task_ids = itertools.count()
+        self.ready = 0
+        self.warmup_reports = {}
+        # pid -> latest model registry stats reported by that worker
+        self.registry_stats = {}
+        self.all_ready = threading.Event()
+        self.listener = threading.Thread(target=self._listen, daemon=True)
+        self.listener.start()
+
+    def _listen(self):
+        # Route results from any worker back to the waiting caller
+        last_check = time.monotonic()
+        while True:
+            if time.monotonic() - last_check >= 1.0:
+                self._check_workers()
+                last_check = time.monotonic()
+            try:
+                task_id, results, error = self.result_queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            if task_id is None:
+                break
+            if task_id == "taken":
+                with self.pending_lock:
+                    if results[0] in self.pending:
+                        self.taken[results[0]] = results[1]
+                continue
+            if task_id == "registry":
+                self.registry_stats[results[0]] = results[1]
+                continue
+            if task_id == "ready":
+                pid, warmup_report = results
+                self.warmup_reports[pid] = warmup_report
+                self.ready += 1
+                if self.ready == self.num_workers:
+                    self.all_ready.set()
+                continue
+            with self.pending_lock:
+                future = self.pending.pop(task_id, None)
+                self.taken.pop(task_id, None)
+            if future is None:
+                continue
+            if error is not None:
+                future.set_exception(RuntimeError(f"Inference worker failed: {error}"))
+            else:
+                future.set_result(results)
+
+    def _check_workers(self):
+        """Fail the tasks of workers that exited; fail everything once no worker is left"""
+        newly_dead = [worker for worker in self.workers if worker.exitcode is not None and worker.pid not in self.dead_workers]
+        if not newly_dead:
+            return
+        self.dead_workers.update(worker.pid for worker in newly_dead)
+        all_dead = len(self.dead_workers) == len(self.workers)
+        with self.pending_lock:
+            lost = [task_id for task_id in self.pending
+                    if all_dead or self.taken.get(task_id) in self.dead_workers]
+            futures = [self.pending.pop(task_id) for task_id in lost]
+            for task_id in lost:
+                self.taken.pop(task_id, None)
+        codes = ", ".join(f"pid {worker.pid} exit code {worker.exitcode}" for worker in newly_dead)
+        print(f"Inference worker(s) exited: {codes}")
+        for future in futures:
+            # The caller's finally block hands the shared-memory slot back
+            future.set_exception(RuntimeError(f"Inference worker exited ({codes})"))
+
+    def alive_workers(self):
+        return len(self.workers) - len(self.dead_workers)
+
+    def wait_until_ready(self, timeout=300.0):
+        """Block until every worker has loaded its model; raises if one dies or the timeout passes"""
+        waited = 0.0
+        while not self.all_ready.wait(0.5):
+            waited += 0.5
+            failed = [worker for worker in self.workers if worker.exitcode is not None]
+            if failed:
+                raise RuntimeError(f"Inference worker pid {failed[0].pid} exited with code "
+                                   f"{failed[0].exitcode} before it was ready")
+            if timeout is not None and waited >= timeout:
+                raise TimeoutError(f"Only {self.ready} of {self.num_workers} inference workers ready after {timeout:.0f}s")
+        return True
+
+    def embed_batch(self, images):
+        """Embed uint8 (224, 224, 3) images in the worker processes (blocking)"""
+        if len(images) <= self.max_batch_size:
+            return self._embed_chunk(images)
+        chunks = [images[i:i + self.max_batch_size] for i in range(0, len(images), self.max_batch_size)]
+        return np.concatenate([self._embed_chunk(chunk) for chunk in chunks])
+
+    def _embed_chunk(self, images):
+        if not self.alive_workers():
+            raise RuntimeError("No inference workers are running")
+        slot = self.free_slots.get()
+        try:
+            view = self.views[slot]
+            for i, img in enumerate(images):
+                view[i] = img
+            future = Future()
+            task_id = next(self.task_ids)
+            with self.pending_lock:
+                self.pending[task_id] = future
+            self.task_queue.put((task_id, slot, len(images)))
+            return future.result()
+        finally:
+            # The worker is done reading the slot once the result has come back
+            self.free_slots.put(slot)
+
+    def close(self):
+        for _ in self.workers:
+            self.task_queue.put(None)
+        for worker in self.workers:
+            worker.join(timeout=10)
+            if worker.is_alive():
+                worker.terminate()
+        self.result_queue.put((None, None, None))
+        self.listener.join(timeout=5)
+        del self.views
+        for shm in self.slots:
+            shm.close()
+            shm.unlink()
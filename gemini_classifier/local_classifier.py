@@ -0,0 +1,109 @@
+import os
+import sys
+import numpy as np
+from PIL import Image
+
+# Local prototype classifier from ML_Classifier, for serving next to the Gemini endpoints.
+# TensorFlow is only needed once a LocalClassifier is actually created.
+ML_CLASSIFIER_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ML_Classifier"))
+if ML_CLASSIFIER_DIR not in sys.path:
+    sys.path.append(ML_CLASSIFIER_DIR)
+
+from backbones import IMG_SIZE, compile_backbone, decode_image, embed_batch, load_backbone  # noqa: E402
+from model_registry import ModelRegistry  # noqa: E402
+from produce_index import ProduceIndex  # noqa: E402
+
+# Backbone and the persisted index (.npz snapshot plus its .journal of online updates)
+LOCAL_BACKBONE = os.getenv("LOCAL_BACKBONE", "MobileNetV2")
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", os.path.join(ML_CLASSIFIER_DIR, "produce_index.npz"))
+# Serve through a compiled tf.function (LOCAL_XLA=1 adds XLA JIT), warmed up for
+# every batch size up to LOCAL_MAX_BATCH_SIZE before the first request
+LOCAL_COMPILE = os.getenv("LOCAL_COMPILE", "1") == "1"
+LOCAL_XLA = os.getenv("LOCAL_XLA", "0") == "1"
+LOCAL_MAX_BATCH_SIZE = int(os.getenv("LOCAL_MAX_BATCH_SIZE", "16"))
+# Keep prototype embeddings compressed (LOCAL_INDEX_DTYPE=float16 or int8), optionally
+# PCA-projected to LOCAL_INDEX_PCA_DIM dimensions; see ML_Classifier/compressed_store.py
+LOCAL_INDEX_DTYPE = os.getenv("LOCAL_INDEX_DTYPE", "")
+LOCAL_INDEX_PCA_DIM = int(os.getenv("LOCAL_INDEX_PCA_DIM", "0")) or None
+# Backbones are held by a ModelRegistry: LOCAL_WEIGHTS_DTYPE=float16 halves their
+# resident weights, and LOCAL_MEMORY_BUDGET_MB evicts the least recently used one
+LOCAL_WEIGHTS_DTYPE = os.getenv("LOCAL_WEIGHTS_DTYPE", "float32")
+LOCAL_MEMORY_BUDGET_MB = float(os.getenv("LOCAL_MEMORY_BUDGET_MB", "0")) or None
+
+
+def crop_to_array(img, box):
+    """Crop a pixel box out of a decoded RGB PIL image into a uint8 (224, 224, 3) array"""
+    crop = img.crop((box["x_min"], box["y_min"], box["x_max"], box["y_max"]))
+    # Same nearest-neighbour resize as decode_image, so crops match whole-image inputs
+    return np.asarray(crop.resize(IMG_SIZE, Image.NEAREST), dtype=np.uint8)
+
+
+def _load_compiled_backbone(backbone_name):
+    feature_extractor, preprocess_input = load_backbone(backbone_name)
+    if LOCAL_COMPILE:
+        feature_extractor = compile_backbone(feature_extractor, jit_compile=LOCAL_XLA, max_batch_size=LOCAL_MAX_BATCH_SIZE)
+        print(f"Warmed up {backbone_name} (xla={LOCAL_XLA}): {feature_extractor.warmup_report}")
+    return feature_extractor, preprocess_input
+
+
+# One registry per process (the API process or an inference worker)
+serving_registry = ModelRegistry(LOCAL_MEMORY_BUDGET_MB, LOCAL_WEIGHTS_DTYPE, loader=_load_compiled_backbone)
+
+
+def load_serving_backbone(backbone_name):
+    """Backbone for serving from the registry, compiled and warmed up unless LOCAL_COMPILE=0"""
+    return serving_registry.get(backbone_name)
+
+
+def registry_embed_fn(backbone_name):
+    """Embed function that fetches the backbone from the registry on every batch"""
+    # Holding on to the model here would keep it resident after the registry evicts it
+    def embed(batch):
+        feature_extractor, preprocess_input = serving_registry.get(backbone_name)
+        return embed_batch(feature_extractor, preprocess_input, batch)
+    return embed
+
+
+class LocalClassifier:
+    def __init__(self, backbone_name=LOCAL_BACKBONE, index_path=LOCAL_INDEX_PATH, embed_fn=None):
+        # With an external embed_fn (e.g. an InferencePool) this process never loads the backbone
+        self.warmup_report = None
+        if embed_fn is None:
+            feature_extractor, _ = load_serving_backbone(backbone_name)
+            self.warmup_report = getattr(feature_extractor, "warmup_report", None)
+            embed_fn = registry_embed_fn(backbone_name)
+        self.embed_fn = embed_fn
+
+        self.index = None
+        if index_path and os.path.exists(index_path):
+            self.index = ProduceIndex.load(index_path, with_backbone=False)
+            if self.index.backbone_name != backbone_name:
+                # Its online corrections are embeddings from the other backbone and cannot be
+                # replayed here; keep that index (and its journal) intact for switching back
+                backbone_path = os.path.splitext(index_path)[0] + f".{backbone_name}.npz"
+                print(f"Warning: saved index {index_path} uses {self.index.backbone_name}, not {backbone_name}; "
+                      f"leaving it and its {len(self.index.examples)} examples untouched and using {backbone_path}")
+                index_path = backbone_path
+                self.index = ProduceIndex.load(index_path, with_backbone=False) if os.path.exists(index_path) else None
+        if self.index is None:
+            self.index = ProduceIndex.build(backbone_name, embed_fn=embed_fn)
+            if LOCAL_INDEX_DTYPE:
+                self.index.compress(dim=LOCAL_INDEX_PCA_DIM, dtype=LOCAL_INDEX_DTYPE)
+            if index_path:
+                self.index.save(index_path)
+        elif LOCAL_INDEX_DTYPE and self.index.store is None:
+            self.index.compress(dim=LOCAL_INDEX_PCA_DIM, dtype=LOCAL_INDEX_DTYPE)
+        print(f"Local classifier ready: {self.index.backbone_name}, {len(self.index.labels)} classes")
+
+    def classify_batch(self, images):
+        """Classify a list (or stacked array) of uint8 (224, 224, 3) images with one batched forward pass"""
+        batch = images if isinstance(images, np.ndarray) else np.stack(images)
+        return self.index.classify_embeddings(self.embed_fn(batch))
+
+    def add_example(self, img_array, produce, condition, example_id=None):
+        """Embed one labeled image and fold it into its class centroid"""
+        embedding = self.embed_fn(img_array[np.newaxis])[0]
+        return self.index.add_example(produce, condition, embedding, example_id=example_id)
+
+    def remove_example(self, example_id):
+        return self.index.remove_example(example_id)
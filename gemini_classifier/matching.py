@@ -0,0 +1,164 @@
+import itertools
+import math
+import random
+import time
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+# Donation-to-shelter matching with a spatial grid index.
+# Open donations are bucketed into fixed-size lat/lon cells and, within a cell, by
+# inventory category, so a shelter query only touches the cells overlapping its
+# search radius and only the categories it asked for. Dietary restrictions are
+# kept as a bitmask per donation so the restriction filter is a single AND.
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE_LAT = 111.32
+
+# Days of shelf life beyond which a donation is no more urgent than any other
+URGENCY_HORIZON_DAYS = 14
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class DonationMatcher:
+    def __init__(self, restriction_tags: List[str], cell_km: float = 5.0, urgency_weight: float = 0.5):
+        self.restriction_bits = {tag.lower(): 1 << i for i, tag in enumerate(restriction_tags)}
+        self.cell_km = cell_km
+        self.cell_deg = cell_km / KM_PER_DEGREE_LAT
+        self.urgency_weight = urgency_weight
+        # (cell_y, cell_x) -> food_type -> donation_id -> entry
+        self.cells: Dict[tuple, Dict[str, Dict[str, tuple]]] = {}
+        # donation_id -> (cell, food_type), for O(1) removal
+        self.locations: Dict[str, tuple] = {}
+        self.ids = itertools.count(1)
+
+    def _cell(self, latitude, longitude):
+        # Cells are cell_km tall everywhere; in longitude they are measured at the equator
+        # and the query widens its column range by 1/cos(latitude) to compensate
+        return (math.floor(latitude / self.cell_deg), math.floor(longitude / self.cell_deg))
+
+    def restriction_mask(self, restrictions: Optional[List[str]]) -> int:
+        mask = 0
+        for tag in restrictions or []:
+            mask |= self.restriction_bits.get(tag.strip().lower(), 0)
+        return mask
+
+    def add(self, donation: dict) -> str:
+        """Index an open donation; expects CombinedAnalysisResponse fields plus latitude/longitude"""
+        if donation.get("condition") == "waste":
+            raise ValueError("Donations classified as waste cannot be matched")
+        donation_id = str(donation.get("donation_id") or f"donation-{next(self.ids)}")
+        if donation_id in self.locations:
+            self.remove(donation_id)
+
+        safe_until = donation.get("safe_until")
+        expiry = datetime.strptime(safe_until, "%Y-%m-%d").date().toordinal() if safe_until else None
+        urgent = donation.get("condition") == "needs immediate distribution"
+        donation = dict(donation, donation_id=donation_id)
+        entry = (
+            donation_id,
+            float(donation["latitude"]),
+            float(donation["longitude"]),
+            self.restriction_mask(donation.get("restrictions")),
+            expiry,
+            urgent,
+            donation,
+        )
+        cell = self._cell(entry[1], entry[2])
+        food_type = donation["food_type"]
+        self.cells.setdefault(cell, {}).setdefault(food_type, {})[donation_id] = entry
+        self.locations[donation_id] = (cell, food_type)
+        return donation_id
+
+    def remove(self, donation_id: str) -> dict:
+        """Drop a donation (claimed, delivered or expired) from the index"""
+        cell, food_type = self.locations.pop(donation_id)
+        by_type = self.cells[cell]
+        entry = by_type[food_type].pop(donation_id)
+        if not by_type[food_type]:
+            del by_type[food_type]
+            if not by_type:
+                del self.cells[cell]
+        return entry[6]
+
+    def __len__(self):
+        return len(self.locations)
+
+    def _urgency(self, expiry, urgent, today):
+        """0 for the most urgent donations up to 1 for ones with plenty of shelf life left"""
+        if urgent:
+            return 0.0
+        if expiry is None:
+            return 1.0
+        days_left = max(0, expiry - today)
+        return min(days_left, URGENCY_HORIZON_DAYS) / URGENCY_HORIZON_DAYS
+
+    def match(self, latitude: float, longitude: float, radius_km: float = 10.0,
+              categories: Optional[List[str]] = None, restrictions: Optional[List[str]] = None,
+              limit: int = 10, today: Optional[date] = None) -> List[dict]:
+        """Rank open donations within radius_km of a shelter, filtered by category and restrictions"""
+        today = (today or date.today()).toordinal()
+        required = self.restriction_mask(restrictions)
+        rows = math.ceil(radius_km / self.cell_km)
+        cols = math.ceil(radius_km / (self.cell_km * max(math.cos(math.radians(latitude)), 0.01)))
+        center_y, center_x = self._cell(latitude, longitude)
+
+        candidates = []
+        for cell_y in range(center_y - rows, center_y + rows + 1):
+            for cell_x in range(center_x - cols, center_x + cols + 1):
+                by_type = self.cells.get((cell_y, cell_x))
+                if not by_type:
+                    continue
+                groups = by_type.values() if categories is None else (by_type[c] for c in categories if c in by_type)
+                for group in groups:
+                    for donation_id, lat, lon, mask, expiry, urgent, donation in group.values():
+                        if mask & required != required:
+                            continue
+                        if expiry is not None and expiry < today:
+                            continue
+                        distance = haversine_km(latitude, longitude, lat, lon)
+                        if distance > radius_km:
+                            continue
+                        # Lower is better: nearby and soon-to-expire donations come first
+                        score = distance / radius_km + self.urgency_weight * self._urgency(expiry, urgent, today)
+                        candidates.append((score, distance, donation_id, donation))
+
+        candidates.sort(key=lambda candidate: candidate[0])
+        return [
+            {**donation, "distance_km": round(distance, 3), "score": round(score, 4)}
+            for score, distance, donation_id, donation in candidates[:limit]
+        ]
+
+
+if __name__ == "__main__":
+    # Rough latency check: 100k open donations scattered over a metro area
+    from categories import INVENTORY_CATEGORIES, POTENTIAL_RESTRICTIONS
+
+    rng = random.Random(0)
+    matcher = DonationMatcher(POTENTIAL_RESTRICTIONS)
+    for _ in range(100_000):
+        matcher.add({
+            "food_type": rng.choice(INVENTORY_CATEGORIES),
+            "condition": rng.choice(["safe for consumption", "needs immediate distribution"]),
+            "restrictions": rng.sample(POTENTIAL_RESTRICTIONS, rng.randint(0, 3)),
+            "safe_until": f"2030-01-{rng.randint(1, 28):02d}",
+            "latitude": 51.05 + rng.uniform(-0.5, 0.5),
+            "longitude": -114.07 + rng.uniform(-0.8, 0.8),
+        })
+
+    timings = []
+    for _ in range(2000):
+        start = time.perf_counter()
+        matcher.match(51.05 + rng.uniform(-0.4, 0.4), -114.07 + rng.uniform(-0.6, 0.6), radius_km=5,
+                      categories=[rng.choice(INVENTORY_CATEGORIES)], restrictions=["Vegetarian"],
+                      today=date(2030, 1, 1))
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    print(f"{len(matcher)} donations: median {timings[len(timings) // 2] * 1e6:.0f} us, "
+          f"p99 {timings[int(len(timings) * 0.99)] * 1e6:.0f} us per match query")
@@ -0,0 +1,135 @@
+import asyncio
+import time
+from collections import Counter, deque
+from typing import Any, Callable, List
+
+# Dynamic micro-batching for the local classifier.
+# Concurrent requests are collected for up to `max_wait_ms` or until `max_batch_size`
+# items are queued, then processed with one batched call in a worker thread so the
+# event loop keeps accepting requests. Each caller gets back its own result.
+
+
+class MicroBatcher:
+    def __init__(self, process_batch: Callable[[List[Any]], List[Any]], max_batch_size: int = 16,
+                 max_wait_ms: float = 5.0, max_in_flight: int = 1, history: int = 1000):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        # More than one batch in flight only helps when process_batch runs outside this
+        # process (e.g. an InferencePool with one worker per in-flight batch)
+        self.max_in_flight = max_in_flight
+        self.queue = None
+        self.worker = None
+        self.in_flight = None
+        self.batch_tasks = set()
+        # Stats exposed through stats()
+        self.batch_sizes = Counter()
+        self.queue_delays = deque(maxlen=history)
+        self.batch_latencies = deque(maxlen=history)
+
+    def start(self):
+        """Start the background batching task on the running event loop"""
+        if self.worker is None:
+            self.queue = asyncio.Queue()
+            self.in_flight = asyncio.Semaphore(self.max_in_flight)
+            self.worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop batching; in-flight and still queued requests fail instead of hanging"""
+        if self.worker is not None:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+            self.worker = None
+        for task in list(self.batch_tasks):
+            task.cancel()
+        await asyncio.gather(*self.batch_tasks, return_exceptions=True)
+        while self.queue is not None and not self.queue.empty():
+            _, future, _ = self.queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Batcher stopped"))
+
+    async def submit(self, item: Any) -> Any:
+        """Queue one item and wait for its result"""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((item, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self):
+        # Block for the first item, then gather more until the batch is full or the window closes
+        batch = [await self.queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            # Wait for a free processing slot first so items keep queueing (and batching) meanwhile
+            await self.in_flight.acquire()
+            batch = await self._collect()
+            task = asyncio.get_running_loop().create_task(self._process(batch))
+            self.batch_tasks.add(task)
+            task.add_done_callback(self.batch_tasks.discard)
+
+    async def _process(self, batch):
+        try:
+            started = time.perf_counter()
+            for _, _, enqueued in batch:
+                self.queue_delays.append(started - enqueued)
+            self.batch_sizes[len(batch)] += 1
+
+            try:
+                results = list(await asyncio.to_thread(self.process_batch, [item for item, _, _ in batch]))
+                if len(results) != len(batch):
+                    # Zipping would leave the unmatched callers waiting forever
+                    raise RuntimeError(f"Batch function returned {len(results)} results for {len(batch)} items")
+            except (Exception, asyncio.CancelledError) as e:
+                error = RuntimeError("Batcher stopped") if isinstance(e, asyncio.CancelledError) else e
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                return
+            self.batch_latencies.append(time.perf_counter() - started)
+
+            for (_, future, _), result in zip(batch, results):
+                # The caller may have gone away (e.g. client disconnect) while we were busy
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self.in_flight.release()
+
+    def stats(self):
+        """Batch-size distribution and queueing delay percentiles"""
+        def percentiles(values):
+            if not values:
+                return {"p50_ms": None, "p90_ms": None, "p99_ms": None}
+            ordered = sorted(values)
+            pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+            return {"p50_ms": pick(0.50), "p90_ms": pick(0.90), "p99_ms": pick(0.99)}
+
+        batches = sum(self.batch_sizes.values())
+        items = sum(size * count for size, count in self.batch_sizes.items())
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "max_in_flight": self.max_in_flight,
+            "batches": batches,
+            "items": items,
+            "mean_batch_size": items / batches if batches else None,
+            "batch_size_distribution": {str(size): count for size, count in sorted(self.batch_sizes.items())},
+            "queue_delay": percentiles(self.queue_delays),
+            "batch_latency": percentiles(self.batch_latencies),
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+        }
@@ -0,0 +1,236 @@
+import argparse
+import csv
+import os
+import re
+import sqlite3
+import sys
+import time
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+# Local barcode/UPC product index.
+# Packaged goods are looked up by barcode in SQLite (primary key lookup, well under a
+# millisecond) instead of a multi-second Gemini vision call. Products are imported
+# from a product dataset such as the Open Food Facts CSV export; dataset categories
+# and labels are mapped onto the API's inventory categories and dietary restrictions
+# once at import time, and an FTS5 table allows searching by name or brand.
+#
+#   python product_index.py import en.openfoodfacts.org.products.csv
+
+PRODUCT_DB_PATH = os.getenv("PRODUCT_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "products.db"))
+
+# Category text is a comma-separated list of tags, broadest first as in Open Food
+# Facts (en:plant-based-foods-and-beverages,en:plant-based-foods,...,en:breads).
+# Tags are tried from the most specific (last) one back; a tag matches a rule when
+# its head word(s) are one of the rule's keywords (plurals included), so
+# en:milk-chocolates is confectionery and en:orange-juices a beverage. Only if no tag
+# matches that way is any whole word of a tag used (en:chicken-breasts). Anything
+# frozen is "Frozen Foods" whatever else it is; the rest default to pantry staples
+FROZEN_KEYWORDS = ["frozen", "ice cream"]
+CATEGORY_KEYWORDS = [
+    ("Beverages", ["beverage", "drink", "juice", "water", "soda", "coffee", "tea", "milk drink", "wine", "beer"]),
+    ("Dairy & Eggs", ["dairy", "dairies", "milk", "cheese", "yogurt", "yoghurt", "butter", "cream", "egg"]),
+    ("Meat & Poultry", ["meat", "poultry", "poultries", "chicken", "beef", "pork", "sausage", "ham", "turkey"]),
+    ("Seafood", ["seafood", "fish", "fishes", "tuna", "salmon", "shrimp", "sardine"]),
+    ("Bakery & Bread", ["bread", "bakery", "bakeries", "pastry", "pastries", "cake", "bagel", "tortilla"]),
+    ("Snacks & Confectionery", ["snack", "chocolate", "candy", "candies", "confectionery", "confectioneries",
+                                "chip", "crisp", "cookie", "biscuit"]),
+    ("Prepared Foods", ["meal", "prepared", "sandwich", "pizza", "salad", "soup"]),
+    ("Fruits & Vegetables", ["fruit", "vegetable", "apple", "banana", "berries", "potato", "tomato"]),
+    ("Pantry Staples", ["pasta", "rice", "cereal", "flour", "sauce", "oil", "legume", "spice", "condiment"]),
+]
+DEFAULT_CATEGORY = "Pantry Staples"
+# Umbrella tags that name no category of their own ("...-and-beverages" is not a drink)
+GENERIC_TAGS = {"plant based foods and beverages", "plant based foods", "foods and beverages"}
+
+RESTRICTION_KEYWORDS = [
+    ("Vegetarian", ["vegetarian"]),
+    ("Vegan", ["vegan"]),
+    ("Gluten-Free", ["gluten free", "no gluten"]),
+    ("Dairy-Free", ["dairy free", "no lactose", "lactose free", "no milk"]),
+    ("Nut-Free", ["nut free", "no nuts", "peanut free"]),
+    ("Soy-Free", ["soy free", "no soy"]),
+    ("Halal", ["halal"]),
+    ("Kosher", ["kosher"]),
+    ("Low Sugar", ["low sugar", "no added sugar", "sugar free"]),
+    ("Organic", ["organic"]),
+]
+
+# Accepted column names, in order of preference (Open Food Facts names last)
+COLUMNS = {
+    "barcode": ["barcode", "upc", "ean", "code"],
+    "item_name": ["item_name", "name", "product_name"],
+    "brand": ["brand", "brands"],
+    "category": ["category", "food_type", "categories_tags", "categories_en", "categories"],
+    "labels": ["restrictions", "labels_tags", "labels_en", "labels"],
+}
+
+
+def normalize_barcode(barcode: str) -> str:
+    """Digits only; UPC-A (12 digits) is stored as its EAN-13 form with a leading zero"""
+    digits = "".join(ch for ch in str(barcode) if ch.isdigit())
+    return digits.zfill(13) if len(digits) == 12 else digits
+
+
+def _words(text: str) -> str:
+    """Lowercase words separated (and surrounded) by single spaces, for whole-word matching"""
+    return " " + re.sub(r"[^a-z0-9]+", " ", (text or "").lower()).strip() + " "
+
+
+def _mentions(words: str, keywords: List[str]) -> bool:
+    return any(f" {keyword}{suffix} " in words for keyword in keywords for suffix in ("", "s", "es"))
+
+
+def _tags(text: str) -> List[str]:
+    """Comma-separated tags as word strings, language prefixes (en:) dropped"""
+    tags = [_words(re.sub(r"^[a-z]{2}:", "", tag.strip().lower())) for tag in (text or "").split(",")]
+    return [tag for tag in tags if tag.strip() and tag.strip() not in GENERIC_TAGS]
+
+
+def _ends_with(words: str, keywords: List[str]) -> bool:
+    return any(words.endswith(f" {keyword}{suffix} ") for keyword in keywords for suffix in ("", "s", "es"))
+
+
+# Datasets repeat the same category and label strings, so each is mapped once
+@lru_cache(maxsize=65536)
+def map_category(text: str) -> str:
+    tags = _tags(text)
+    if any(_mentions(tag, FROZEN_KEYWORDS) for tag in tags):
+        return "Frozen Foods"
+    for matches in (_ends_with, _mentions):
+        for tag in reversed(tags):
+            for category, keywords in CATEGORY_KEYWORDS:
+                if tag == _words(category) or matches(tag, keywords):
+                    return category
+    return DEFAULT_CATEGORY
+
+
+@lru_cache(maxsize=65536)
+def map_restrictions(text: str) -> Tuple[str, ...]:
+    words = _words(text)
+    return tuple(tag for tag, keywords in RESTRICTION_KEYWORDS if _mentions(words, [_words(tag).strip()] + keywords))
+
+
+class ProductIndex:
+    def __init__(self, path: str = PRODUCT_DB_PATH):
+        self.path = path
+        # Lookups happen on the event loop and writes only during import
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS products (
+                barcode TEXT PRIMARY KEY,
+                item_name TEXT NOT NULL,
+                brand TEXT,
+                category TEXT NOT NULL,
+                restrictions TEXT NOT NULL
+            ) WITHOUT ROWID;
+            CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(barcode UNINDEXED, item_name, brand);
+        """)
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+
+    def _product(self, row) -> dict:
+        return {
+            "barcode": row["barcode"],
+            "item_name": row["item_name"],
+            "brand": row["brand"],
+            "food_type": row["category"],
+            "restrictions": row["restrictions"].split(",") if row["restrictions"] else [],
+        }
+
+    def lookup(self, barcode: str) -> Optional[dict]:
+        row = self.conn.execute(
+            "SELECT * FROM products WHERE barcode = ?", (normalize_barcode(barcode),)
+        ).fetchone()
+        return self._product(row) if row else None
+
+    def search(self, text: str, limit: int = 10) -> List[dict]:
+        """Full-text search over product names and brands, best matches first"""
+        # Quote each term so user input cannot inject FTS query syntax
+        query = " ".join('"' + term.replace('"', '""') + '"*' for term in text.split())
+        if not query:
+            return []
+        rows = self.conn.execute(
+            "SELECT p.* FROM products_fts f JOIN products p ON p.barcode = f.barcode "
+            "WHERE products_fts MATCH ? ORDER BY rank LIMIT ?",
+            (query, limit),
+        ).fetchall()
+        return [self._product(row) for row in rows]
+
+    def import_csv(self, csv_path: str, batch_size: int = 10000) -> int:
+        """Import (or refresh) products from a CSV/TSV file; returns the number of rows imported"""
+        csv.field_size_limit(sys.maxsize)
+        with open(csv_path, newline="", encoding="utf-8", errors="replace") as f:
+            header = f.readline()
+            f.seek(0)
+            reader = csv.DictReader(f, delimiter="\t" if "\t" in header else ",")
+            columns = {
+                field: next((name for name in names if name in reader.fieldnames), None)
+                for field, names in COLUMNS.items()
+            }
+            if columns["barcode"] is None or columns["item_name"] is None:
+                raise ValueError(f"'{csv_path}' needs a barcode column {COLUMNS['barcode']} "
+                                 f"and a name column {COLUMNS['item_name']}")
+
+            imported = 0
+            batch = []
+            for record in reader:
+                barcode = normalize_barcode(record.get(columns["barcode"]) or "")
+                item_name = (record.get(columns["item_name"]) or "").strip()
+                if not barcode or not item_name:
+                    continue
+                brand = (record.get(columns["brand"]) or "").split(",")[0].strip() if columns["brand"] else ""
+                category = map_category(record.get(columns["category"]) if columns["category"] else "")
+                restrictions = map_restrictions(record.get(columns["labels"]) if columns["labels"] else "")
+                batch.append((barcode, item_name, brand, category, ",".join(restrictions)))
+                if len(batch) >= batch_size:
+                    imported += self._write(batch)
+                    batch = []
+            imported += self._write(batch)
+        self.rebuild_search()
+        return imported
+
+    def _write(self, batch) -> int:
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?)", batch)
+        return len(batch)
+
+    def rebuild_search(self):
+        """Rebuild the search table from products in one pass"""
+        # Deleting stale rows per barcode would scan the whole FTS table for each one
+        # (barcode is UNINDEXED there), so imports refill it once at the end instead
+        with self.conn:
+            self.conn.execute("DELETE FROM products_fts")
+            self.conn.execute("INSERT INTO products_fts SELECT barcode, item_name, brand FROM products")
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the local barcode product index")
+    parser.add_argument("--db", default=PRODUCT_DB_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import", help="Import products from a CSV/TSV export")
+    import_parser.add_argument("csv_path")
+    lookup_parser = commands.add_parser("lookup", help="Look up a barcode")
+    lookup_parser.add_argument("barcode")
+    search_parser = commands.add_parser("search", help="Search products by name or brand")
+    search_parser.add_argument("text")
+    args = parser.parse_args()
+
+    index = ProductIndex(args.db)
+    if args.command == "import":
+        start = time.perf_counter()
+        count = index.import_csv(args.csv_path)
+        print(f"Imported {count} products in {time.perf_counter() - start:.1f} s ({len(index)} in the index)")
+    elif args.command == "lookup":
+        start = time.perf_counter()
+        product = index.lookup(args.barcode)
+        print(product or "Not found", f"({(time.perf_counter() - start) * 1e6:.0f} us)")
+    else:
+        for product in index.search(args.text):
+            print(product)
+    index.close()
@@ -0,0 +1,164 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+# On-demand sampling profiler and event-loop lag monitor.
+# The profiler runs in its own thread and, every interval, reads the current frame of
+# every other thread from sys._current_frames(); nothing is instrumented, so the
+# profiled code runs at full speed and the cost is one stack walk per thread per
+# sample. Stacks are returned in the collapsed format ("root;caller;leaf count" per
+# line) that flamegraph.pl, speedscope and inferno read directly.
+#
+# The lag monitor has a heartbeat task on the event loop and a watchdog thread. When
+# the heartbeat is late by more than the threshold, something is blocking the loop;
+# the watchdog then captures the loop thread's stack while the blocking callback is
+# still running, so each lag event names the code responsible.
+
+
+# Innermost functions of a thread that is waiting, not working
+IDLE_FUNCTIONS = {"wait", "select", "poll", "epoll", "_worker", "get", "sleep", "accept", "_recv_into", "acquire"}
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)})"
+
+
+def stack_names(frame, max_depth=128):
+    """Function names from the outermost frame to the innermost"""
+    names = []
+    while frame is not None and len(names) < max_depth:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    return names[::-1]
+
+
+class SamplingProfiler:
+    def __init__(self):
+        self.running = False
+        self.lock = threading.Lock()
+
+    def profile(self, seconds: float, interval_s: float = 0.005, include_idle: bool = False):
+        """Sample every thread for the given time; returns (collapsed stacks text, stats)"""
+        with self.lock:
+            if self.running:
+                raise RuntimeError("A profile is already running")
+            self.running = True
+        try:
+            return self._sample(seconds, interval_s, include_idle)
+        finally:
+            self.running = False
+
+    def _sample(self, seconds, interval_s, include_idle):
+        own_id = threading.get_ident()
+        thread_names = {}
+        counts = Counter()
+        samples = 0
+        started = time.perf_counter()
+        deadline = started + seconds
+        next_sample = started
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            if not thread_names or samples % 100 == 0:
+                thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                names = stack_names(frame)
+                # Threads parked in a wait (idle executor workers, the selector) add noise
+                if not include_idle and names and names[-1].split(" ", 1)[0] in IDLE_FUNCTIONS:
+                    continue
+                counts[";".join([thread_names.get(thread_id, str(thread_id))] + names)] += 1
+            samples += 1
+            next_sample += interval_s
+            time.sleep(max(0.0, next_sample - time.perf_counter()))
+        elapsed = time.perf_counter() - started
+        collapsed = "\n".join(f"{stack} {count}" for stack, count in counts.most_common()) + "\n"
+        stats = {"seconds": elapsed, "samples": samples, "interval_ms": interval_s * 1000,
+                 "effective_interval_ms": elapsed * 1000 / samples if samples else None,
+                 "stacks": len(counts)}
+        return collapsed, stats
+
+
+class LoopLagMonitor:
+    def __init__(self, threshold_ms: float = 100.0, interval_ms: float = 50.0, max_events: int = 100):
+        self.threshold_s = threshold_ms / 1000
+        self.interval_s = interval_ms / 1000
+        self.lags = deque(maxlen=1000)
+        self.events = deque(maxlen=max_events)
+        self.blocked_total = 0
+        self.max_lag_s = 0.0
+        self.loop_thread_id = None
+        self.last_beat = None
+        # (heartbeat it belongs to, stack) captured by the watchdog during a block
+        self.captured = None
+        self.task = None
+        self.watchdog = None
+        self.stopped = threading.Event()
+
+    def start(self):
+        self.loop_thread_id = threading.get_ident()
+        self.last_beat = time.perf_counter()
+        self.stopped.clear()
+        self.task = asyncio.create_task(self._heartbeat())
+        self.watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self.watchdog.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def _heartbeat(self):
+        while True:
+            beat = self.last_beat
+            await asyncio.sleep(self.interval_s)
+            now = time.perf_counter()
+            lag = max(0.0, now - beat - self.interval_s)
+            self.lags.append(lag)
+            self.max_lag_s = max(self.max_lag_s, lag)
+            if lag > self.threshold_s:
+                self.blocked_total += 1
+                captured = self.captured
+                stack = captured[1] if captured is not None and captured[0] == beat else None
+                self.events.append({
+                    "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "lag_ms": lag * 1000,
+                    # Innermost frames last; None if the block ended before the watchdog looked
+                    "stack": stack,
+                })
+            self.last_beat = now
+
+    def _watch(self):
+        while not self.stopped.wait(self.interval_s):
+            beat = self.last_beat
+            if time.perf_counter() - beat - self.interval_s <= self.threshold_s:
+                continue
+            if self.captured is not None and self.captured[0] == beat:
+                continue
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is not None:
+                self.captured = (beat, stack_names(frame))
+
+    def stats(self):
+        ordered = sorted(self.lags)
+
+        def pct(p):
+            return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] * 1000 if ordered else None
+
+        return {
+            "running": self.task is not None,
+            "threshold_ms": self.threshold_s * 1000,
+            "interval_ms": self.interval_s * 1000,
+            "p50_lag_ms": pct(50),
+            "p99_lag_ms": pct(99),
+            "max_lag_ms": self.max_lag_s * 1000,
+            "blocked_total": self.blocked_total,
+            "recent_blocks": list(self.events)[::-1],
+        }
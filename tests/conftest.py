@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The services import their sibling modules by bare name, as when run from their own directory
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ("gemini_classifier", "ML_Classifier"):
+    path = os.path.join(ROOT, directory)
+    if path not in sys.path:
+        sys.path.insert(0, path)
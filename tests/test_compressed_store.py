@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from compressed_store import CompressedEmbeddingStore
+
+
+def unit_vectors(count, dim=128, seed=0):
+    # Pooled embeddings are non-negative and scored after L2 normalisation
+    vectors = np.abs(np.random.default_rng(seed).normal(size=(count, dim))).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def filled_store(vectors, dim=None, dtype="int8"):
+    store = CompressedEmbeddingStore.fit(vectors, dim=dim, dtype=dtype)
+    store.add_many([f"ex-{i}" for i in range(len(vectors))], vectors)
+    return store
+
+
+@pytest.mark.parametrize("dtype,tolerance", [("float16", 1e-3), ("int8", 2e-2)])
+@pytest.mark.parametrize("dim", [None, 32])
+def test_similarities_match_float32(dim, dtype, tolerance):
+    vectors = unit_vectors(20)
+    queries = unit_vectors(5, seed=1)
+    store = filled_store(vectors, dim=dim, dtype=dtype)
+    # With fewer stored vectors than PCA dimensions only quantization error remains
+    np.testing.assert_allclose(store.similarities(queries), queries @ vectors.T, atol=tolerance)
+    np.testing.assert_allclose(store.decode(), vectors, atol=tolerance)
+
+
+def test_pca_loses_information_below_the_data_rank():
+    vectors = unit_vectors(40)
+    store = filled_store(vectors, dim=4, dtype="float16")
+    assert store.dim == 4
+    assert 0 < store.explained_variance < 1
+    assert np.abs(store.similarities(vectors) - vectors @ vectors.T).max() > 1e-3
+
+
+def test_codes_are_smaller_than_float32():
+    store = filled_store(unit_vectors(10), dtype="int8")
+    sizes = store.nbytes()
+    assert sizes["per_vector"] == 128 + 4 + 4
+    assert sizes["float32_per_vector"] == 128 * 4
+    assert store.codes.dtype == np.int8
+
+
+def test_add_and_get():
+    vectors = unit_vectors(100)
+    store = CompressedEmbeddingStore.fit(vectors, dtype="float16")
+    # One by one, past the initial capacity
+    for i, vector in enumerate(vectors):
+        store.add(f"ex-{i}", vector)
+    assert len(store) == 100
+    assert "ex-99" in store
+    np.testing.assert_allclose(store.get("ex-42"), vectors[42], atol=1e-3)
+    with pytest.raises(ValueError):
+        store.add("ex-0", vectors[0])
+
+
+def test_remove_moves_last_vector_into_the_freed_slot():
+    vectors = unit_vectors(5)
+    store = filled_store(vectors, dtype="float16")
+    removed = store.remove("ex-1")
+    np.testing.assert_allclose(removed, vectors[1], atol=1e-3)
+    assert len(store) == 4
+    assert "ex-1" not in store
+    assert store.ids == ["ex-0", "ex-4", "ex-2", "ex-3"]
+    assert store.slots["ex-4"] == 1
+
+    # Remaining ids still score against their own vectors
+    kept = [0, 4, 2, 3]
+    slots = [store.slots[f"ex-{i}"] for i in kept]
+    np.testing.assert_allclose(store.similarities(vectors, slots), vectors @ vectors[kept].T, atol=1e-3)
+
+    store.remove("ex-3")
+    assert store.ids == ["ex-0", "ex-4", "ex-2"]
+    with pytest.raises(KeyError):
+        store.remove("ex-1")
+
+
+def test_chunked_scoring_matches_single_pass():
+    vectors = unit_vectors(50)
+    store = filled_store(vectors)
+    np.testing.assert_allclose(store.similarities(vectors, chunk_size=7), store.similarities(vectors), rtol=1e-6)
+
+
+def test_state_round_trip():
+    vectors = unit_vectors(12)
+    store = filled_store(vectors, dim=8)
+    store.remove("ex-3")
+    restored = CompressedEmbeddingStore.from_state(store.state())
+    assert restored.ids == store.ids
+    assert restored.dim == 8
+    np.testing.assert_array_equal(restored.similarities(vectors), store.similarities(vectors))
+    restored.add("ex-new", vectors[3])
+    assert restored.slots["ex-new"] == 11
+
+
+def test_unknown_dtype():
+    with pytest.raises(ValueError):
+        CompressedEmbeddingStore(np.zeros(4), dtype="int4")
@@ -0,0 +1,72 @@
+import random
+from datetime import date
+
+from expiry_scheduler import URGENT_CONDITION, ExpiryScheduler
+
+TODAY = date(2030, 1, 10)
+
+
+def item(item_id, safe_until=None, condition="safe for consumption"):
+    return {"item_id": item_id, "item_name": item_id, "food_type": "Pantry Staples",
+            "condition": condition, "safe_until": safe_until}
+
+
+def test_pop_returns_items_by_deadline_then_urgency():
+    scheduler = ExpiryScheduler()
+    scheduler.add(item("undated"), TODAY)
+    scheduler.add(item("late", "2030-02-01"), TODAY)
+    scheduler.add(item("soon", "2030-01-12"), TODAY)
+    scheduler.add(item("soon-urgent", "2030-01-12", URGENT_CONDITION), TODAY)
+    scheduler.add(item("today", "2030-01-10"), TODAY)
+
+    order = [entry["item_id"] for entry in scheduler.pop(10, TODAY)]
+    assert order == ["today", "soon-urgent", "soon", "late", "undated"]
+    assert len(scheduler) == 0
+
+
+def test_pop_order_matches_sorting_with_updates_and_removals():
+    rng = random.Random(0)
+    scheduler = ExpiryScheduler()
+    live = {}
+    for i in range(300):
+        item_id = f"i{rng.randrange(120)}"
+        if rng.random() < 0.2:
+            scheduler.remove(item_id)
+            live.pop(item_id, None)
+            continue
+        safe_until = f"2030-0{rng.randint(2, 9)}-{rng.randint(10, 28)}"
+        condition = URGENT_CONDITION if rng.random() < 0.3 else "safe for consumption"
+        scheduler.add(item(item_id, safe_until, condition), TODAY)
+        live[item_id] = (safe_until, condition != URGENT_CONDITION)
+
+    popped = [(entry["safe_until"], entry["condition"] != URGENT_CONDITION) for entry in scheduler.pop(1000, TODAY)]
+    assert popped == sorted(live.values())
+    assert scheduler.stats()["scheduled"] == 0
+
+
+def test_expire_moves_only_passed_items_to_waste():
+    scheduler = ExpiryScheduler()
+    scheduler.add(item("old", "2030-01-05"), date(2030, 1, 1))
+    scheduler.add(item("edge", "2030-01-10"), date(2030, 1, 1))
+    scheduler.add(item("fresh", "2030-01-20"), date(2030, 1, 1))
+
+    expired = scheduler.expire(TODAY)
+    assert [entry["item_id"] for entry in expired] == ["old"]
+    assert expired[0]["condition"] == "waste"
+    assert scheduler.peek(TODAY)["item_id"] == "edge"
+    assert scheduler.next_deadline() == date(2030, 1, 10)
+    assert [entry["item_id"] for entry in scheduler.collect_waste()] == ["old"]
+    assert scheduler.collect_waste() == []
+
+
+def test_waste_items_and_updates():
+    scheduler = ExpiryScheduler()
+    scheduler.add(item("a", "2030-01-15"), TODAY)
+    scheduler.add(item("a", "2030-03-01"), TODAY)
+    scheduler.add(item("b", "2030-02-01"), TODAY)
+    assert scheduler.peek(TODAY)["item_id"] == "b"
+
+    scheduler.add(item("b", condition="waste"), TODAY)
+    assert len(scheduler) == 1 and scheduler.stats()["waste"] == 1
+    assert scheduler.remove("missing") is None
+    assert scheduler.pop(5, TODAY)[0]["safe_until"] == "2030-03-01"
@@ -0,0 +1,167 @@
+import asyncio
+import os
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from fair_queue import FairScheduler, RateLimited, TokenBucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr("fair_queue.time.monotonic", clock)
+    return clock
+
+
+def test_bucket_allows_burst_then_refills(clock):
+    bucket = TokenBucket(rate=2.0, burst=3.0)
+    assert [bucket.take() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.take() == pytest.approx(0.5)
+    clock.now += 0.5
+    assert bucket.take() == 0.0
+    # Refill is capped at the burst size
+    clock.now += 60
+    assert [bucket.take() for _ in range(4)][-1] == pytest.approx(0.5)
+
+
+def test_bucket_give_back(clock):
+    bucket = TokenBucket(rate=1.0, burst=2.0)
+    bucket.take(2)
+    bucket.give_back(1)
+    assert bucket.take() == 0.0
+    bucket.give_back(5)
+    assert bucket.tokens == 2.0
+
+
+def test_zero_rate_never_refills(clock):
+    bucket = TokenBucket(rate=0.0, burst=1.0)
+    assert bucket.take() == 0.0
+    assert bucket.take() == float("inf")
+
+
+def test_retry_after_header_rounds_up():
+    assert RateLimited("x", 0.2).retry_after_header() == "1"
+    assert RateLimited("x", 2.1).retry_after_header() == "3"
+
+
+def test_scheduler_rate_limits_per_client(clock):
+    async def run():
+        scheduler = FairScheduler(rate=1.0, burst=2.0)
+        await scheduler.acquire("a")
+        await scheduler.acquire("a")
+        with pytest.raises(RateLimited) as e:
+            await scheduler.acquire("a")
+        assert e.value.retry_after == pytest.approx(1.0)
+        # Other clients have their own bucket
+        await scheduler.acquire("b")
+        assert scheduler.stats()["clients"]["a"]["rejected_rate"] == 1
+
+    asyncio.run(run())
+
+
+def test_address_bucket_is_refunded_when_client_is_limited(clock):
+    async def run():
+        scheduler = FairScheduler(rate=1.0, burst=1.0)
+        await scheduler.acquire("donor:a", address="ip:1")
+        with pytest.raises(RateLimited):
+            await scheduler.acquire("donor:a", address="ip:2")
+        # ip:2 was not charged for the rejected request
+        await scheduler.acquire("donor:b", address="ip:2")
+        with pytest.raises(RateLimited):
+            await scheduler.acquire("donor:c", address="ip:2")
+
+    asyncio.run(run())
+
+
+def test_weighted_fair_order():
+    async def run():
+        scheduler = FairScheduler(max_concurrent=1, rate=100.0, burst=100.0)
+        await scheduler.acquire("bulk")
+        served = []
+
+        async def request(client_id):
+            await scheduler.acquire(client_id)
+            served.append(client_id)
+
+        tasks = [asyncio.ensure_future(request("bulk")) for _ in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.ensure_future(request("interactive")))
+        await asyncio.sleep(0)
+        for _ in range(4):
+            scheduler.release(served[-1] if served else "bulk")
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        # The newcomer is served after one bulk request, not behind the whole backlog
+        assert served == ["bulk", "interactive", "bulk", "bulk"]
+
+    asyncio.run(run())
+
+
+def test_full_queue_is_rejected_and_refunded():
+    async def run():
+        scheduler = FairScheduler(max_concurrent=1, rate=100.0, burst=3.0, max_queue_per_client=1)
+        await scheduler.acquire("a")
+        waiter = asyncio.ensure_future(scheduler.acquire("a"))
+        await asyncio.sleep(0)
+        with pytest.raises(RateLimited) as e:
+            await scheduler.acquire("a")
+        assert e.value.retry_after > 0
+        assert scheduler.clients["a"].bucket.tokens == pytest.approx(1.0, abs=0.1)
+        scheduler.release("a")
+        await waiter
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_gives_its_slot_on():
+    async def run():
+        scheduler = FairScheduler(max_concurrent=1)
+        await scheduler.acquire("a")
+        gone = asyncio.ensure_future(scheduler.acquire("b"))
+        waiting = asyncio.ensure_future(scheduler.acquire("c"))
+        await asyncio.sleep(0)
+        gone.cancel()
+        await asyncio.sleep(0)
+        scheduler.release("a")
+        await waiting
+        assert scheduler.stats()["clients"]["c"]["in_flight"] == 1
+        assert scheduler.clients["b"].queued == 0
+
+    asyncio.run(run())
+
+
+def test_endpoint_returns_429_with_retry_after(monkeypatch):
+    os.environ.setdefault("GOOGLE_API_KEY", "test")
+    os.environ.setdefault("AUDIT_LOG_ENABLED", "0")
+    os.environ.setdefault("IMPACT_DB_PATH", ":memory:")
+    fastapi_testclient = pytest.importorskip("fastapi.testclient")
+    import foodClassifier
+
+    async def classify_image(image):
+        return {"condition": "safe for consumption", "food_type": "Fruits & Vegetables", "restrictions": [],
+                "reason": "Fresh", "item_name": "Banana"}
+
+    monkeypatch.setattr(foodClassifier, "fair_scheduler", FairScheduler(rate=0.25, burst=1.0))
+    monkeypatch.setattr(foodClassifier, "fair_queue_enabled", True)
+    monkeypatch.setattr(foodClassifier, "classify_image", classify_image)
+    monkeypatch.setattr(foodClassifier, "distill", lambda contents, result: None)
+    client = fastapi_testclient.TestClient(foodClassifier.app)
+
+    image = BytesIO()
+    Image.new("RGB", (8, 8)).save(image, "PNG")
+    files = {"file": ("banana.png", image.getvalue(), "image/png")}
+
+    assert client.post("/classify/", files=files).status_code == 200
+    response = client.post("/classify/", files=files)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "4"
@@ -0,0 +1,71 @@
+from io import BytesIO
+
+from PIL import Image, ImageDraw
+
+from frame_dedup import FrameDeduplicator, dhash, hamming
+
+
+def frame(box_x=40, fmt="JPEG", quality=90, size=(320, 240)):
+    # A dark box on a light background, like an item on a belt
+    img = Image.new("RGB", size, (200, 200, 200))
+    ImageDraw.Draw(img).rectangle([box_x, 60, box_x + 100, 180], fill=(40, 80, 30))
+    out = BytesIO()
+    img.save(out, fmt, **({"quality": quality} if fmt == "JPEG" else {}))
+    return out.getvalue()
+
+
+def test_dhash_stable_across_encodings():
+    assert hamming(dhash(frame(fmt="PNG")), dhash(frame(fmt="PNG"))) == 0
+    assert hamming(dhash(frame(fmt="PNG")), dhash(frame(quality=60))) <= 4
+    assert hamming(dhash(frame(box_x=40)), dhash(frame(box_x=200))) > 4
+
+
+def test_hamming():
+    assert hamming(0b1011, 0b0001) == 2
+    assert hamming(0, 0) == 0
+
+
+def test_accept_then_duplicate():
+    dedup = FrameDeduplicator()
+    item = dhash(frame())
+    assert dedup.check(item) == "new"
+    dedup.mark_classified(item)
+    assert dedup.check(dhash(frame(quality=60))) == "duplicate"
+    assert dedup.stats()["skipped_duplicate"] == 1
+
+
+def test_unclassified_frame_is_retried():
+    # A failed classification must not make the next frame of the scene a duplicate
+    dedup = FrameDeduplicator()
+    item = dhash(frame())
+    assert dedup.check(item) == "new"
+    assert dedup.check(item) == "new"
+    assert dedup.still_new(item)
+    dedup.mark_classified(item)
+    assert not dedup.still_new(item)
+    assert dedup.stats()["classified"] == 1
+
+
+def test_moving_scene_is_unstable():
+    dedup = FrameDeduplicator()
+    first, moved = dhash(frame(box_x=40)), dhash(frame(box_x=200))
+    assert dedup.check(first) == "new"
+    assert dedup.check(moved) == "unstable"
+    # Settled on the new position
+    assert dedup.check(moved) == "new"
+    assert dedup.stats()["skipped_unstable"] == 1
+
+
+def test_stability_can_be_disabled():
+    dedup = FrameDeduplicator(require_stable=False)
+    assert dedup.check(dhash(frame(box_x=40))) == "new"
+    assert dedup.check(dhash(frame(box_x=200))) == "new"
+
+
+def test_history_is_bounded():
+    dedup = FrameDeduplicator(history=1)
+    first, second = dhash(frame(box_x=40)), dhash(frame(box_x=200))
+    dedup.mark_classified(first)
+    dedup.mark_classified(second)
+    assert dedup.still_new(first)
+    assert not dedup.still_new(second)
@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+
+from hedging import Hedger, percentile
+
+
+class Upstream:
+    """Fake upstream call; each call sleeps for the next scripted delay and returns its own index.
+    A delay of None fails immediately instead."""
+
+    def __init__(self, *delays):
+        self.delays = list(delays)
+        self.started = []
+        self.cancelled = []
+        self.finished = []
+
+    async def __call__(self):
+        index = len(self.started)
+        delay = self.delays[index]
+        self.started.append(index)
+        if delay is None:
+            raise RuntimeError("upstream failed")
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled.append(index)
+            raise
+        self.finished.append(index)
+        return index
+
+
+def warmed_hedger(**options):
+    # One fast sample sets a 10 ms hedge delay right away
+    return Hedger(enabled=True, min_samples=1, default_ratio=1.0, **options)
+
+
+async def warm_up(hedger, endpoint="classify"):
+    await hedger.call(endpoint, Upstream(0.01))
+
+
+def test_percentile():
+    assert percentile([], 50) is None
+    assert percentile([3, 1, 2, 4], 50) == 3
+    assert percentile([3, 1, 2, 4], 99) == 4
+
+
+def test_disabled_never_hedges():
+    async def run():
+        hedger = Hedger(enabled=False, min_samples=1, default_ratio=1.0)
+        await warm_up(hedger)
+        upstream = Upstream(0.05)
+        assert await hedger.call("classify", upstream) == 0
+        assert upstream.started == [0]
+        assert hedger.stats()["endpoints"]["classify"]["hedged"] == 0
+
+    asyncio.run(run())
+
+
+def test_hedge_wins_and_slow_primary_finishes_in_background():
+    async def run():
+        hedger = warmed_hedger()
+        await warm_up(hedger)
+        upstream = Upstream(0.3, 0.0)
+        assert await hedger.call("classify", upstream) == 1
+        assert len(hedger.background) == 1
+        assert hedger.extra_in_flight == 0
+
+        # The losing primary is not cancelled: it finishes and is then forgotten
+        await asyncio.sleep(0.4)
+        assert upstream.finished == [1, 0]
+        assert upstream.cancelled == []
+        assert not hedger.background
+        endpoint = hedger.stats()["endpoints"]["classify"]
+        assert endpoint["hedged"] == 1
+        assert endpoint["hedge_wins"] == 1
+
+    asyncio.run(run())
+
+
+def test_failed_call_falls_back_to_the_other():
+    async def run():
+        hedger = warmed_hedger()
+        await warm_up(hedger)
+        assert await hedger.call("classify", Upstream(0.05, None)) == 0
+
+    asyncio.run(run())
+
+
+def test_caller_cancellation_cancels_primary_and_hedge():
+    async def run():
+        hedger = warmed_hedger()
+        await warm_up(hedger)
+        upstream = Upstream(5.0, 5.0)
+        caller = asyncio.ensure_future(hedger.call("classify", upstream))
+        await asyncio.sleep(0.1)
+        assert upstream.started == [0, 1]
+        assert hedger.extra_in_flight == 1
+
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        await asyncio.sleep(0)
+        assert sorted(upstream.cancelled) == [0, 1]
+        assert hedger.extra_in_flight == 0
+        assert not hedger.background
+
+    asyncio.run(run())
+
+
+def test_caller_cancellation_before_hedging_cancels_primary():
+    async def run():
+        hedger = warmed_hedger()
+        await warm_up(hedger)
+        upstream = Upstream(5.0)
+        caller = asyncio.ensure_future(hedger.call("classify", upstream))
+        await asyncio.sleep(0)
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        await asyncio.sleep(0)
+        assert upstream.cancelled == [0]
+
+    asyncio.run(run())
+
+
+def test_budget_limits_extra_calls():
+    async def run():
+        hedger = warmed_hedger(max_extra_in_flight=0)
+        await warm_up(hedger)
+        upstream = Upstream(0.05)
+        assert await hedger.call("classify", upstream) == 0
+        assert upstream.started == [0]
+        assert hedger.stats()["endpoints"]["classify"]["skipped_budget"] == 1
+
+    asyncio.run(run())
@@ -0,0 +1,84 @@
+from datetime import date, datetime
+
+import pytest
+
+from impact_rollups import ImpactRollups
+
+DAY = datetime(2030, 3, 14)
+
+
+@pytest.fixture
+def rollups():
+    rollups = ImpactRollups(":memory:", co2_kg_per_lb=0.5, lbs_per_meal=2.0)
+    yield rollups
+    rollups.close()
+
+
+def donation(donor_id="donor-1", weight_lbs=4, food_type="Seafood", condition="safe for consumption"):
+    return {"donor_id": donor_id, "weight_lbs": weight_lbs, "food_type": food_type, "condition": condition}
+
+
+def test_record_adds_to_every_timeframe_for_org_and_donor(rollups):
+    rollups.record(donation(), when=DAY, donation_id="a")
+    rollups.record(donation(donor_id="donor-2", weight_lbs=2, food_type="Bakery & Bread"), when=DAY, donation_id="b")
+
+    for timeframe in ("day", "week", "month", "year"):
+        org = rollups.summary(timeframe, day=DAY.date())
+        assert org["donations"] == 2
+        assert org["food_saved_lbs"] == 6
+        assert org["co2_offset_kg"] == 3
+        assert org["people_served"] == 3
+        assert org["by_category"] == {"Seafood": 1, "Bakery & Bread": 1}
+    assert rollups.summary("month", "donor-1", DAY.date())["food_saved_lbs"] == 4
+    assert rollups.summary("month", day=date(2030, 4, 1))["donations"] == 0
+
+
+def test_update_replaces_instead_of_double_counting(rollups):
+    rollups.record(donation(), when=DAY, donation_id="a")
+    rollups.record(donation(weight_lbs=10, condition="needs immediate distribution"), donation_id="a")
+
+    summary = rollups.summary("month", day=DAY.date())
+    assert summary["donations"] == 1
+    assert summary["food_saved_lbs"] == 10
+    assert summary["by_condition"] == {"needs immediate distribution": 1}
+    # The update stays in the period the donation was first recorded in
+    assert rollups.summary("day", day=DAY.date())["donations"] == 1
+
+
+def test_remove_subtracts_and_is_idempotent(rollups):
+    rollups.record(donation(), when=DAY, donation_id="a")
+    rollups.record(donation(), when=DAY, donation_id="b")
+
+    assert rollups.remove("a") is True
+    assert rollups.remove("a") is False
+    assert rollups.remove("never-recorded") is False
+    summary = rollups.summary("year", "donor-1", DAY.date())
+    assert summary["donations"] == 1 and summary["food_saved_lbs"] == 4
+
+    rollups.remove("b")
+    empty = rollups.summary("year", "donor-1", DAY.date())
+    assert empty["donations"] == 0 and empty["by_category"] == {} and empty["by_condition"] == {}
+
+
+def test_donor_ids_cannot_collide_with_the_org_totals(rollups):
+    rollups.record(donation(donor_id="all"), when=DAY, donation_id="a")
+    rollups.record(donation(donor_id="*"), when=DAY, donation_id="b")
+    assert rollups.summary("month", day=DAY.date())["donations"] == 2
+    assert rollups.summary("month", "all", DAY.date())["donations"] == 1
+
+
+def test_totals_persist_across_instances(tmp_path):
+    path = str(tmp_path / "impact.db")
+    first = ImpactRollups(path)
+    first.record(donation(), when=DAY, donation_id="a")
+    second = ImpactRollups(path)
+    assert second.summary("month", day=DAY.date())["donations"] == 1
+    assert second.remove("a") is True
+    assert first.summary("month", day=DAY.date())["donations"] == 0
+
+
+def test_series_is_oldest_first(rollups):
+    rollups.record(donation(), when=datetime(2030, 1, 5))
+    rollups.record(donation(), when=datetime(2030, 3, 5))
+    series = rollups.series("month", periods=3, day=date(2030, 3, 20))
+    assert [(s["period"], s["donations"]) for s in series] == [("2030-01", 1), ("2030-02", 0), ("2030-03", 1)]
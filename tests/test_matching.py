@@ -0,0 +1,90 @@
+import random
+from datetime import date
+from math import cos, radians
+
+import pytest
+
+from categories import POTENTIAL_RESTRICTIONS
+from matching import DonationMatcher, haversine_km
+
+CENTER = (51.05, -114.07)
+TODAY = date(2030, 1, 1)
+
+
+def donation(km_north=0.0, km_east=0.0, **fields):
+    # Offsets in km turned into degrees around CENTER
+    return {
+        "food_type": "Seafood",
+        "condition": "safe for consumption",
+        "restrictions": [],
+        "safe_until": "2030-01-20",
+        "latitude": CENTER[0] + km_north / 111.32,
+        "longitude": CENTER[1] + km_east / (111.32 * cos(radians(CENTER[0]))),
+        **fields,
+    }
+
+
+@pytest.fixture
+def matcher():
+    return DonationMatcher(POTENTIAL_RESTRICTIONS, cell_km=5)
+
+
+def test_radius_includes_only_donations_within_it(matcher):
+    near = matcher.add(donation(km_north=3, donation_id="near"))
+    edge = matcher.add(donation(km_east=9.5, donation_id="edge"))
+    matcher.add(donation(km_north=10.5, donation_id="far"))
+    matcher.add(donation(km_east=-40, donation_id="very-far"))
+
+    found = [m["donation_id"] for m in matcher.match(*CENTER, radius_km=10, today=TODAY)]
+    assert found == [near, edge]
+    for match in matcher.match(*CENTER, radius_km=10, today=TODAY):
+        assert match["distance_km"] == pytest.approx(
+            haversine_km(*CENTER, match["latitude"], match["longitude"]), abs=1e-3)
+        assert match["distance_km"] <= 10
+
+
+def test_radius_spanning_many_cells_matches_brute_force(matcher):
+    rng = random.Random(0)
+    for i in range(500):
+        matcher.add(donation(km_north=rng.uniform(-30, 30), km_east=rng.uniform(-30, 30), donation_id=f"d{i}"))
+    for radius in (0.5, 4, 12, 25):
+        found = {m["donation_id"] for m in matcher.match(*CENTER, radius_km=radius, limit=1000, today=TODAY)}
+        expected = {
+            donation_id for donation_id, (cell, food_type) in matcher.locations.items()
+            if haversine_km(*CENTER, *matcher.cells[cell][food_type][donation_id][1:3]) <= radius
+        }
+        assert found == expected
+
+
+def test_filters_by_category_restrictions_and_expiry(matcher):
+    matcher.add(donation(km_north=1, donation_id="vegan-fruit", food_type="Fruits & Vegetables",
+                         restrictions=["Vegan", "Vegetarian"]))
+    matcher.add(donation(km_north=1, donation_id="vegetarian-fruit", food_type="Fruits & Vegetables",
+                         restrictions=["Vegetarian"]))
+    matcher.add(donation(km_north=1, donation_id="expired-fruit", food_type="Fruits & Vegetables",
+                         safe_until="2029-12-31"))
+    matcher.add(donation(km_north=1, donation_id="fish"))
+
+    fruit = matcher.match(*CENTER, radius_km=5, categories=["Fruits & Vegetables"], today=TODAY)
+    assert {m["donation_id"] for m in fruit} == {"vegan-fruit", "vegetarian-fruit"}
+    vegan = matcher.match(*CENTER, radius_km=5, restrictions=["vegan"], today=TODAY)
+    assert [m["donation_id"] for m in vegan] == ["vegan-fruit"]
+
+
+def test_urgent_donations_rank_before_closer_ones(matcher):
+    matcher.add(donation(km_north=1, donation_id="close", safe_until="2030-03-01"))
+    matcher.add(donation(km_north=4, donation_id="urgent", condition="needs immediate distribution"))
+    assert [m["donation_id"] for m in matcher.match(*CENTER, radius_km=10, today=TODAY)] == ["urgent", "close"]
+
+
+def test_add_replaces_and_remove_drops(matcher):
+    matcher.add(donation(km_north=1, donation_id="d"))
+    matcher.add(donation(km_north=30, donation_id="d"))
+    assert len(matcher) == 1
+    assert matcher.match(*CENTER, radius_km=5, today=TODAY) == []
+    matcher.remove("d")
+    assert len(matcher) == 0 and matcher.cells == {}
+    with pytest.raises(KeyError):
+        matcher.remove("d")
+    with pytest.raises(ValueError):
+        matcher.add(donation(condition="waste"))
@@ -0,0 +1,67 @@
+import pytest
+
+from product_index import DEFAULT_CATEGORY, ProductIndex, map_category, map_restrictions, normalize_barcode
+
+# Real Open Food Facts categories_tags values and the category they must map to
+CATEGORY_EXAMPLES = [
+    ("en:plant-based-foods-and-beverages,en:plant-based-foods,en:cereals-and-potatoes,en:breads", "Bakery & Bread"),
+    ("en:plant-based-foods-and-beverages,en:plant-based-foods,en:fruits-and-vegetables-based-foods,"
+     "en:fruits-based-foods,en:fruits,en:apples", "Fruits & Vegetables"),
+    ("en:plant-based-foods-and-beverages,en:plant-based-foods", DEFAULT_CATEGORY),
+    ("en:plant-based-foods-and-beverages,en:beverages,en:plant-based-beverages,en:fruit-based-beverages,"
+     "en:juices-and-nectars,en:fruit-juices,en:orange-juices", "Beverages"),
+    ("en:beverages,en:carbonated-drinks,en:sodas,en:colas", "Beverages"),
+    ("en:dairies,en:fermented-foods,en:fermented-milk-products,en:cheeses,en:cow-cheeses", "Dairy & Eggs"),
+    ("en:snacks,en:sweet-snacks,en:cocoa-and-its-products,en:chocolates,en:milk-chocolates", "Snacks & Confectionery"),
+    ("en:meats,en:poultries,en:chickens,en:chicken-breasts", "Meat & Poultry"),
+    ("en:seafood,en:fishes,en:canned-foods,en:canned-fishes,en:canned-tunas", "Seafood"),
+    ("en:meals,en:pizzas-pies-and-quiches,en:pizzas,en:frozen-foods,en:frozen-pizzas", "Frozen Foods"),
+    ("en:plant-based-foods-and-beverages,en:plant-based-foods,en:cereals-and-potatoes,"
+     "en:cereals-and-their-products,en:pastas,en:dry-pastas", "Pantry Staples"),
+    ("Dairy & Eggs", "Dairy & Eggs"),
+]
+
+
+@pytest.mark.parametrize("tags,expected", CATEGORY_EXAMPLES)
+def test_map_category(tags, expected):
+    assert map_category(tags) == expected
+
+
+def test_map_restrictions():
+    assert map_restrictions("en:vegan,en:vegetarian,en:gluten-free") == ("Vegetarian", "Vegan", "Gluten-Free")
+    assert map_restrictions("") == ()
+
+
+def test_normalize_barcode():
+    # UPC-A is stored in its EAN-13 form
+    assert normalize_barcode("0 12345-67890 5") == "0012345678905"
+    assert normalize_barcode("4006381333931") == "4006381333931"
+
+
+def test_import_lookup_and_search(tmp_path):
+    csv_path = tmp_path / "products.tsv"
+    csv_path.write_text(
+        "code\tproduct_name\tbrands\tcategories_tags\tlabels_tags\n"
+        "012345678905\tApple Juice\tTropicana,PepsiCo\ten:beverages,en:juices\ten:vegan\n"
+        "4006381333931\tDark Chocolate\tLindt\ten:snacks,en:chocolates\t\n"
+        "\tNo Barcode\t\t\t\n"
+    )
+    index = ProductIndex(str(tmp_path / "products.db"))
+    try:
+        assert index.import_csv(str(csv_path)) == 2
+        assert len(index) == 2
+
+        product = index.lookup("0-12345-67890-5")
+        assert product["item_name"] == "Apple Juice"
+        assert product["brand"] == "Tropicana"
+        assert product["food_type"] == "Beverages"
+        assert "Vegan" in product["restrictions"]
+
+        assert [p["barcode"] for p in index.search("choc")] == ["4006381333931"]
+        assert index.search('"') == []
+
+        # Re-importing refreshes rows instead of duplicating them in the search table
+        index.import_csv(str(csv_path))
+        assert len(index.search("apple juice")) == 1
+    finally:
+        index.close()